@@ -0,0 +1,203 @@
+from collections import defaultdict
+from pymongo import ASCENDING, HASHED, UpdateOne
+from pmid_index import normalize_pmid, parse_pmid
+
+import hashlib
+import logging
+import re
+import threading
+import time
+
+# MinHash signature size & LSH bands, rows per band = NUM_HASHES // NUM_BANDS.
+# 16 bands of 4 rows find abstracts with a similarity over ~0.5
+NUM_HASHES = 64
+NUM_BANDS = 16
+SHINGLE_SIZE = 3
+MIN_SIMILARITY = 0.5
+EMPTY_BIN = None
+# Seconds between two refreshes of the background index thread
+REFRESH_INTERVAL = 300
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+  """Lowercased words of a text, whitespace & punctuation are ignored"""
+  return re.findall(r"\w+", text.lower())
+
+
+def fingerprint(words):
+  """Hash of the words of a text, the same for texts which only differ by case, whitespace & punctuation"""
+  return hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+
+
+def minhash(words):
+  """
+  MinHash signature of the word shingles of a text (one permutation hashing - every shingle
+  is hashed once, its hash goes to one of the NUM_HASHES bins which keep their minimum)
+  """
+  signature = [EMPTY_BIN] * NUM_HASHES
+  for i in range(max(len(words) - SHINGLE_SIZE + 1, 1)):
+    # signatures stay in the process, the (per process) salted builtin hash is enough
+    h = hash(tuple(words[i:i + SHINGLE_SIZE])) & 0xFFFFFFFFFFFFFFFF
+    b, value = h % NUM_HASHES, h // NUM_HASHES
+    if signature[b] is EMPTY_BIN or value < signature[b]:
+      signature[b] = value
+  return tuple(signature)
+
+
+def similarity(a, b):
+  """Estimated Jaccard similarity of the shingles of two signatures"""
+  bins = [(x, y) for x, y in zip(a, b) if x is not EMPTY_BIN or y is not EMPTY_BIN]
+  if not bins:
+    return 0.0
+  return sum(x == y for x, y in bins) / len(bins)
+
+
+def band_keys(signature):
+  rows = NUM_HASHES // NUM_BANDS
+  for band in range(NUM_BANDS):
+    key = signature[band * rows:(band + 1) * rows]
+    # a band of empty bins would match every short text
+    if any(value is not EMPTY_BIN for value in key):
+      yield band, key
+
+
+class AbstractSearch:
+  """
+  Search of the abstracts of the `abstract_details` collection by pasted text.
+
+  1. fingerprint - hashed Mongo index on the hash of the normalized text (exact match up to case,
+     whitespace & punctuation)
+  2. pmid - Mongo index on the PMID, only for queries which are a PMID or start with a PMID header
+  3. fuzzy - in-process MinHash LSH index of the word shingles, finds abstracts with small edits
+
+  The fingerprint & pmid fields of the documents are filled when they are first loaded in the
+  local index. The index is built by a background thread (`start`), which then refreshes it
+  with the documents inserted since (by _id). Once built, searches also add the new documents
+  unless a refresh is already running, so requests never wait for the full build.
+
+  collection : pymongo collection
+  """
+
+  def __init__(self, collection, batch_size=1000):
+    self.collection = collection
+    self.batch_size = batch_size
+    self.ready = False
+    self._lock = threading.Lock()
+    self._has_indexes = False
+    self._last_id = None
+    self._rows = []
+    self._signatures = []
+    self._buckets = defaultdict(list)
+
+  def _ensure_indexes(self):
+    if not self._has_indexes:
+      self.collection.create_index([('fingerprint', HASHED)])
+      self.collection.create_index([('pmid', ASCENDING)])
+      self._has_indexes = True
+
+  def start(self, interval=REFRESH_INTERVAL):
+    """Build the local index in a daemon thread, then refresh it every `interval` seconds"""
+    def run():
+      while True:
+        try:
+          self.refresh()
+        except Exception:
+          logger.exception('Abstract search index refresh failed')
+        time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='abstract-search-index', daemon=True)
+    thread.start()
+    return thread
+
+  def refresh(self, blocking=True):
+    """
+    Load the documents inserted since the last refresh in the local index, returns their number
+    (0 without waiting if another refresh is running and `blocking` is False)
+    """
+    if not self._lock.acquire(blocking=blocking):
+      return 0
+    try:
+      self._ensure_indexes()
+      query = {} if self._last_id is None else {'_id': {'$gt': self._last_id}}
+      docs = self.collection.find(
+        query,
+        projection={'row_data': 1, 'uid': 1, 'external_id': 1, 'fingerprint': 1, 'pmid': 1},
+        sort=[('_id', ASCENDING)])
+
+      n_docs = 0
+      ops = []
+      for doc in docs:
+        n_docs += 1
+        self._last_id = doc['_id']
+        row_data = doc.get('row_data') or ''
+        words = tokenize(row_data)
+        updates = {}
+        if 'fingerprint' not in doc:
+          updates['fingerprint'] = fingerprint(words)
+        # also rewrites the PMIDs stored by the former parser (trailing spaces)
+        pmid = parse_pmid(row_data)
+        if 'pmid' not in doc or doc['pmid'] != pmid:
+          updates['pmid'] = pmid
+        if updates:
+          ops.append(UpdateOne({'_id': doc['_id']}, {'$set': updates}))
+        if len(ops) == self.batch_size:
+          self.collection.bulk_write(ops, ordered=False)
+          ops = []
+
+        # rows are added before the buckets pointing to them, searches run during the build
+        signature = minhash(words)
+        self._rows.append((doc.get('uid'), doc.get('external_id')))
+        self._signatures.append(signature)
+        for key in band_keys(signature):
+          self._buckets[key].append(len(self._rows) - 1)
+      if ops:
+        self.collection.bulk_write(ops, ordered=False)
+      self.ready = True
+      return n_docs
+    finally:
+      self._lock.release()
+
+  def _find_one(self, query, projection=None):
+    return self.collection.find_one(query, projection={'uid': 1, 'external_id': 1, **(projection or {})})
+
+  def fuzzy(self, text, limit=5, min_similarity=MIN_SIMILARITY):
+    """Most similar abstracts of the local index, [(row_uid, external_id, similarity)]"""
+    signature = minhash(tokenize(text))
+    candidates = set()
+    for key in band_keys(signature):
+      candidates.update(self._buckets.get(key, ()))
+    scores = [(similarity(signature, self._signatures[i]), i) for i in candidates]
+    scores = sorted((s for s in scores if s[0] >= min_similarity), reverse=True)[:limit]
+    return [(*self._rows[i], score) for score, i in scores]
+
+  def search(self, text):
+    """
+    Data row of an abstract - {'row_uid', 'external_id', 'match': fingerprint/pmid/fuzzy, 'score'},
+    empty if no abstract matches. The score is the estimated similarity of the texts
+    (1.0 for a fingerprint match), null when the query is only a PMID.
+    Fuzzy matches are only searched once the local index is built.
+    """
+    if self.ready:
+      self.refresh(blocking=False)
+    text = text.strip()
+    words = tokenize(text)
+    doc = self._find_one({'fingerprint': fingerprint(words)})
+    if doc is not None:
+      return {'row_uid': doc['uid'], 'external_id': doc['external_id'], 'match': 'fingerprint', 'score': 1.0}
+
+    # same normalizer as the stored PMIDs
+    pmid = normalize_pmid(text)
+    if pmid is not None:
+      doc = self._find_one({'pmid': pmid}, projection={'row_data': 1})
+      if doc is not None:
+        # same PMID, the texts differ (no fingerprint match)
+        score = None if pmid == text else similarity(minhash(words), minhash(tokenize(doc.get('row_data') or '')))
+        return {'row_uid': doc['uid'], 'external_id': doc['external_id'], 'match': 'pmid', 'score': score}
+
+    matches = self.fuzzy(text, limit=1)
+    if matches:
+      row_uid, external_id, score = matches[0]
+      return {'row_uid': row_uid, 'external_id': external_id, 'match': 'fuzzy', 'score': score}
+    return {}
@@ -0,0 +1,54 @@
+from cachetools import TTLCache
+
+import threading
+
+
+class LookupCache:
+  """
+  In-process TTL/LRU cache of a lookup function (ex: project name -> Labelbox project).
+
+  load : function(key) -> value, called on a miss
+  maxsize : number of keys kept, least recently used keys are evicted first
+  ttl : seconds a value is kept
+  """
+
+  def __init__(self, load, maxsize=128, ttl=600):
+    self.load = load
+    self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    with self._lock:
+      try:
+        value = self._cache[key]
+        self.hits += 1
+        return value
+      except KeyError:
+        self.misses += 1
+    # loaded outside the lock so a slow lookup doesn't block the other keys
+    value = self.load(key)
+    with self._lock:
+      self._cache[key] = value
+    return value
+
+  def invalidate(self, key=None):
+    """Drop a key, every key if None"""
+    with self._lock:
+      if key is None:
+        self._cache.clear()
+      else:
+        self._cache.pop(key, None)
+
+  def stats(self):
+    with self._lock:
+      self._cache.expire()
+      size = len(self._cache)
+    requests = self.hits + self.misses
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'hit_rate': self.hits / requests if requests else None,
+      'size': size,
+    }
@@ -1,11 +1,13 @@
-from flask import Flask, redirect, url_for, request, jsonify, render_template
+from flask import Flask, Response, redirect, url_for, request, jsonify, render_template
 from labelbox import Client, Project, Dataset
 from typing import Dict
 from datetime import datetime
-from collections import defaultdict
 from bson.objectid import ObjectId
 from os.path import join, dirname
 from dotenv import load_dotenv
+from pmid_index import PmidIndex, dataset_rows
+from lookup_cache import LookupCache
+from abstract_search import AbstractSearch
 
 import ndjson
 import requests
@@ -14,7 +16,6 @@ import json
 import os
 import pymongo 
 import uuid
-import re
 
 app = Flask(__name__)
 
@@ -29,11 +30,25 @@ mongo_client = pymongo.MongoClient(str(mongo_api_key))
 mydb = mongo_client["omdena"]
 mycol = mydb["upload_annotations"]
 
-def get_project_uid(project_name):
+abstract_search = AbstractSearch(mydb["abstract_details"])
+# the fuzzy search index is built when the app starts, not in the first search request
+abstract_search.start()
+
+# PMID -> data row uid index of every dataset, by dataset uid
+pmid_indexes = {}
+
+def get_pmid_index(dataset):
+  if dataset.uid not in pmid_indexes:
+    pmid_indexes[dataset.uid] = PmidIndex(
+      mydb["abstract_details"], mydb["pmid_index_watermarks"], dataset.uid, dataset_rows(dataset))
+  return pmid_indexes[dataset.uid]
+
+def get_project(project_name):
   projects = client.get_projects(where=(Project.name == project_name))
-  project = next(iter(projects))
-  project_uid = project.uid
-  return project_uid
+  return next(iter(projects))
+
+def get_project_uid(project_name):
+  return project_cache.get(project_name).uid
 
 def get_ontology(client: Client, project_id: str) -> Dict[str, str]:
   result = client.execute("""
@@ -50,9 +65,16 @@ def get_ontology(client: Client, project_id: str) -> Dict[str, str]:
   return result['project']['ontology']['normalized']
 
 
-def get_entity_schema_id(ontology, name):
-  tools = ontology['tools']
-  return next((t for t in tools if t["name"] == name), None)
+def get_schema_ids(project_id):
+  """Ontology of a project indexed by tool name, name->featureSchemaId"""
+  ontology = get_ontology(client, project_id)
+  return {tool['name']: tool['featureSchemaId'] for tool in ontology['tools']}
+
+# Labelbox lookups cached by key - project name->project, project name->dataset, project uid->schema ids
+project_cache = LookupCache(get_project)
+dataset_cache = LookupCache(lambda project_name: next(iter(project_cache.get(project_name).datasets())))
+schema_id_cache = LookupCache(get_schema_ids)
+lookup_caches = {'project': project_cache, 'dataset': dataset_cache, 'ontology': schema_id_cache}
 
 def get_current_import_requests(project_id):
     response = client.execute(
@@ -87,35 +109,92 @@ def delete_import_request(import_request_id):
     
     return response
 
+# Page size of /upload-annotation-list
+UPLOAD_LIST_LIMIT = 100
+UPLOAD_LIST_MAX_LIMIT = 1000
+upload_indexes_created = False
+
+def ensure_upload_indexes():
+  """Indexes of the upload list - newest first pages & status filter (created once per process)"""
+  global upload_indexes_created
+  if not upload_indexes_created:
+    mycol.create_index([('date', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)])
+    mycol.create_index([('status', pymongo.ASCENDING), ('date', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)])
+    upload_indexes_created = True
+
+def upload_to_json(col, include_data):
+  upload = {
+    'id': str(col['_id']),
+    'project': col['project'],
+    'date': col['date'],
+    'upload_name': col['upload_name'],
+    'submitted_by': col['submitted_by'],
+    'description': col['description'],
+    'status': col['status'],
+    'task_id': col.get('task_id', "---"),
+  }
+  if include_data:
+    upload['data'] = col['data']
+  return upload
+
 @app.route('/upload-annotation-list', methods = ['POST', 'GET'])
 def upload_annotation_list():
-    result = {}
-    try:
-      result['data'] = []
+    """
+    Uploads, newest first, one page at a time
 
-      for col in mycol.find():
-        task_id = "---"
-        if 'task_id' in col:
-          task_id = col['task_id']
+    after : id of the last upload of the previous page (optional, first page by default)
+    limit : number of uploads (default 100, clamped to 1-1000)
+    status : only the uploads with this status (optional)
+    include_data : 1 to include the annotations of every upload (optional)
 
-        result['data'].append({
-          'id': str(col['_id']),
-          'project': col['project'],
-          'date': col['date'],
-          'upload_name': col['upload_name'],
-          'submitted_by': col['submitted_by'],
-          'description': col['description'],
-          'status': col['status'],
-          'task_id': task_id,
-          'data': col['data'],
-        })
-      
-      result['status'] = 'Successfully Uploaded Annotations'
+    Response - {'data': [uploads], 'next': id of the last upload (null on the last page), 'total': int, 'status': str},
+    an error while reading the uploads ends the data list early with the 'Error Uploading' status and a 'message'
+    """
+    result = {}
+    try:
+      ensure_upload_indexes()
+      limit = min(max(int(request.args.get('limit', UPLOAD_LIST_LIMIT)), 1), UPLOAD_LIST_MAX_LIMIT)
+      include_data = request.args.get('include_data', '0') == '1'
+      after = request.args.get('after')
+      status = request.args.get('status')
+
+      query = {} if status is None else {'status': status}
+      total = mycol.count_documents(query) if query else mycol.estimated_document_count()
+      if after:
+        # keyset pagination on (date, _id) - pages cost the same at any depth
+        last = mycol.find_one({'_id': ObjectId(after)}, projection={'date': 1})
+        query = {'$and': [query, {'$or': [
+          {'date': {'$lt': last['date']}},
+          {'date': last['date'], '_id': {'$lt': last['_id']}},
+        ]}]}
+
+      cursor = mycol.find(query, projection=None if include_data else {'data': 0})
+      cursor = cursor.sort([('date', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]).limit(limit + 1)
     except Exception as e:
       result['status'] = 'Error Uploading'
       result['message'] = str(e)
-
-    return json.dumps(result)
+      return json.dumps(result)
+
+    def stream():
+      # uploads are sent as they are read, one extra upload tells if there is a next page
+      yield '{"data": ['
+      n_uploads = 0
+      last_id = next_id = None
+      try:
+        for col in cursor:
+          if n_uploads == limit:
+            next_id = last_id
+            break
+          yield (', ' if n_uploads else '') + json.dumps(upload_to_json(col, include_data))
+          last_id = str(col['_id'])
+          n_uploads += 1
+      except Exception as e:
+        # the response has started, the error is reported in the closing fields
+        yield '], "next": null, "total": {}, "status": "Error Uploading", "message": {}}}'.format(total, json.dumps(str(e)))
+        return
+      yield '], "next": {}, "total": {}, "status": "Successfully Uploaded Annotations"}}'.format(json.dumps(next_id), total)
+
+    return Response(stream(), mimetype='application/json')
 
 
 @app.route('/delete', methods = ['GET'])
@@ -219,38 +298,38 @@ def submit_annotation():
 
           # Get project details
           project_name = received_data['project']
-          projects = client.get_projects(where=(Project.name == project_name))
-          project = next(iter(projects))
+          project = project_cache.get(project_name)
           project_name = project.name
           project_uid = project.uid
 
           # Get associated dataset
-          dataset = next(iter(project.datasets()))
+          dataset = dataset_cache.get(received_data['project'])
           dataset_name = dataset.name
           dataset_uid = dataset.uid
 
           # Get ontology for the project
-          ontology = get_ontology(client, project.uid)
-
-          rows = list(dataset.data_rows())
-          mapping = defaultdict()
-
-          # Create mapping pmid->row uid
-          for row in rows:
-            abstract = row.row_data
-            pmid_begin = re.search(r"\d", abstract).start()
-            pmid_end = abstract.find('T') - 1
-            pmid = str(abstract[pmid_begin:pmid_end])
+          tags = {_received_data['tag'] for _received_data in received_data['data']}
+          schema_ids = schema_id_cache.get(project_uid)
+          if not tags <= set(schema_ids):
+            # the ontology may have been edited since it was cached
+            schema_id_cache.invalidate(project_uid)
+            schema_ids = schema_id_cache.get(project_uid)
+          unknown_tags = sorted(tags - set(schema_ids))
+          if unknown_tags:
+            return json.dumps({'message': 'Unknown tags', 'tags': unknown_tags})
+
+          # Mapping pmid->row uid of the submitted pmids
+          pmids = {_received_data['pmid'] for _received_data in received_data['data']}
+          mapping = get_pmid_index(dataset).lookup(pmids)
+          missing_pmids = sorted(pmids - set(mapping))
+          if missing_pmids:
+            return json.dumps({'message': 'Unknown PMIDs', 'pmids': missing_pmids})
 
-            mapping[pmid] = row.uid
-
-        
           # Iterate through submitted annotations
           for _received_data in received_data['data']:
-            schema_id = get_entity_schema_id(ontology, _received_data['tag'])
             annotations.append({
               'uuid':str(uuid.uuid4()), 
-              "schemaId":schema_id['featureSchemaId'], 
+              "schemaId":schema_ids[_received_data['tag']], 
               "dataRow": { 
                   "id": mapping[_received_data['pmid']]
               }, 
@@ -283,29 +362,77 @@ def submit_annotation():
     
 
 
+# Page size of GET /available-abstracts
+ABSTRACT_LIST_LIMIT = 100
+ABSTRACT_LIST_MAX_LIMIT = 1000
+
 @app.route('/available-abstracts', methods = ['POST', 'GET'])
 def available_abstracts():
+    """
+    GET - abstracts one page at a time, ?after=<id of the last abstract of the previous page>&limit=<n>
+      {'data': [abstracts], 'next': id of the last abstract (null on the last page)},
+      400 {'status', 'message'} for an invalid limit or id
+    POST - data row of a pasted abstract {'row_data': str}, small edits are allowed
+      {'row_uid', 'external_id', 'match': fingerprint/pmid/fuzzy, 'score'}, empty if not found
+    """
     result = {}
     mydata = mydb["abstract_details"]
     if request.method == 'GET':
+      try:
+        limit = min(max(int(request.args.get('limit', ABSTRACT_LIST_LIMIT)), 1), ABSTRACT_LIST_MAX_LIMIT)
+        after = request.args.get('after')
+        query = {} if not after else {'_id': {'$gt': ObjectId(after)}}
+      except Exception as e:
+        return json.dumps({'status': 'Invalid Parameters', 'message': str(e)}), 400
+      docs = list(mydata.find(query, projection={'row_data': 1, 'uid': 1, 'external_id': 1})
+                  .sort('_id', pymongo.ASCENDING).limit(limit + 1))
+
       result['data'] = []
-      for _mydata in mydata.find():
+      for _mydata in docs[:limit]:
         result['data'].append({
+          'id': str(_mydata['_id']),
           'row_data': _mydata['row_data'],
           'uid': _mydata['uid'],
           'external_id': _mydata['external_id']
         })
+      result['next'] = result['data'][-1]['id'] if len(docs) > limit else None
     else:
       received_data = json.loads(request.data)
-      current_data = mydata.find_one({"row_data": received_data['row_data'].strip()})
-      if current_data is not None:
-        result['row_uid'] = current_data['uid']
-        result['external_id'] = current_data['external_id']
+      result = abstract_search.search(received_data['row_data'])
 
 
     return json.dumps(result)
 
 
+@app.route('/cache-stats', methods = ['GET'])
+def cache_stats():
+    return json.dumps({name: cache.stats() for name, cache in lookup_caches.items()})
+
+
+@app.route('/invalidate-cache', methods = ['POST'])
+def invalidate_cache():
+    """
+    Drop cached Labelbox lookups (ex: after renaming a project or editing an ontology)
+
+    {
+      'token' : str,
+      'cache' : project/dataset/ontology (optional, every cache by default),
+      'key' : project name (project/dataset) or project uid (ontology) (optional, every key by default)
+    }
+    """
+    received_data = json.loads(request.data)
+    if received_data['token'] != token_checker:
+      return json.dumps({'message':'Invalid Token'})
+
+    names = [received_data['cache']] if 'cache' in received_data else list(lookup_caches)
+    unknown = [name for name in names if name not in lookup_caches]
+    if unknown:
+      return json.dumps({'message': f'Unknown cache {unknown[0]}', 'caches': list(lookup_caches)}), 400
+    for name in names:
+      lookup_caches[name].invalidate(received_data.get('key'))
+    return json.dumps({'status': 'Cache invalidated', 'caches': names})
+
+
 @app.route('/', methods = ['GET'])
 def index():
     return render_template('index.html')
@@ -0,0 +1,141 @@
+from datetime import timezone
+from itertools import takewhile
+from labelbox import DataRow
+from pymongo import ASCENDING, UpdateOne
+
+import re
+
+
+# PMID header at the start of an abstract, ex: "PMID: 33176080  TITLE. ..."
+PMID_HEADER = re.compile(r"PMID:?\s*(\d+)\b", re.IGNORECASE)
+
+
+def parse_pmid(abstract):
+  """PMID of the header of an abstract, None if the abstract doesn't start with a PMID header"""
+  header = PMID_HEADER.match(abstract.strip())
+  return header.group(1) if header else None
+
+
+def normalize_pmid(pmid):
+  """PMID as stored in the indexes - digits only, None if `pmid` is neither digits nor a PMID header"""
+  pmid = str(pmid).strip()
+  if pmid.isascii() and pmid.isdigit():
+    return pmid
+  return parse_pmid(pmid)
+
+
+def dataset_rows(dataset):
+  """
+  fetch_rows function of a Labelbox dataset for `PmidIndex`.
+  Data rows are paged newest first and paging stops at the first row older than `since`,
+  so a refresh only requests the pages of the new rows.
+  """
+  def fetch_rows(since=None):
+    rows = dataset.data_rows(order_by=DataRow.created_at.desc)
+    if since is None:
+      return rows
+    return takewhile(lambda row: row.created_at >= since, rows)
+
+  return fetch_rows
+
+
+class PmidIndex:
+  """
+  PMID -> data row uid index of a Labelbox dataset, stored in the `abstract_details` collection
+  (fields pmid, dataset_uid & created_at are added to the documents of the data rows).
+
+  The index is built with a single crawl of the dataset, then refreshed with the data rows
+  created since the watermark - the creation time of the newest data row of the last complete
+  crawl. The watermark is only advanced once a crawl is over, an interrupted crawl (rows are
+  written batch by batch, newest first) is started again from the previous watermark.
+  Looking up the PMIDs of a request is a single query.
+
+  collection : pymongo collection
+  watermarks : pymongo collection of the watermarks, one document per dataset
+  dataset_uid : Labelbox dataset uid
+  fetch_rows : function(since) -> data rows (uid, row_data, external_id, created_at)
+               created at or after `since`, every data row if `since` is None
+  """
+
+  def __init__(self, collection, watermarks, dataset_uid, fetch_rows, batch_size=1000):
+    self.collection = collection
+    self.watermarks = watermarks
+    self.dataset_uid = dataset_uid
+    self.fetch_rows = fetch_rows
+    self.batch_size = batch_size
+    self._has_indexes = False
+
+  def _ensure_indexes(self):
+    if not self._has_indexes:
+      self.collection.create_index([('dataset_uid', ASCENDING), ('pmid', ASCENDING)])
+      self._has_indexes = True
+
+  def last_created_at(self):
+    """Creation time of the newest data row of the last complete crawl, None if the dataset isn't indexed"""
+    watermark = self.watermarks.find_one({'_id': self.dataset_uid})
+    if watermark is None or watermark.get('created_at') is None:
+      return None
+    created_at = watermark['created_at']
+    # pymongo returns naive UTC datetimes
+    if created_at.tzinfo is None:
+      created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+  def refresh(self):
+    """Index the data rows created since the last refresh (all of them the first time), returns the number of rows indexed"""
+    self._ensure_indexes()
+    since = self.last_created_at()
+    newest = since
+    n_rows = 0
+    ops = []
+    for row in self.fetch_rows(since):
+      if row.created_at is not None and (newest is None or row.created_at > newest):
+        newest = row.created_at
+      ops.append(UpdateOne(
+        {'uid': row.uid},
+        {
+          '$set': {
+            'pmid': parse_pmid(row.row_data),
+            'dataset_uid': self.dataset_uid,
+            'created_at': row.created_at,
+          },
+          '$setOnInsert': {
+            'row_data': row.row_data.strip(),
+            'external_id': row.external_id,
+          },
+        },
+        upsert=True))
+      if len(ops) == self.batch_size:
+        self.collection.bulk_write(ops, ordered=False)
+        n_rows += len(ops)
+        ops = []
+    if ops:
+      self.collection.bulk_write(ops, ordered=False)
+      n_rows += len(ops)
+    # every row since the previous watermark is written
+    if newest is not None and newest != since:
+      self.watermarks.update_one(
+        {'_id': self.dataset_uid}, {'$set': {'created_at': newest}}, upsert=True)
+    return n_rows
+
+  def _find(self, pmids):
+    mapping = {}
+    for doc in self.collection.find(
+        {'dataset_uid': self.dataset_uid, 'pmid': {'$in': list(pmids)}},
+        projection={'pmid': 1, 'uid': 1}):
+      mapping[doc['pmid']] = doc['uid']
+    return mapping
+
+  def lookup(self, pmids):
+    """
+    Data row uids of PMIDs, {pmid: uid} with the PMIDs as given (they are normalized, see `normalize_pmid`).
+    The index is refreshed only when a PMID is not indexed yet (new data rows),
+    PMIDs which are still missing after the refresh are left out.
+    """
+    normalized = {pmid: normalize_pmid(pmid) for pmid in set(pmids)}
+    wanted = set(normalized.values()) - {None}
+    mapping = self._find(wanted)
+    if len(mapping) < len(wanted):
+      if self.refresh():
+        mapping = self._find(wanted)
+    return {pmid: mapping[value] for pmid, value in normalized.items() if value in mapping}
@@ -10,13 +10,36 @@ $(document).ready(function() {
 });
 
 var task_id = []
+// cursor of every page, the id of the last upload of the previous page
+var page_cursors = [null]
+function load_page(request, callback, settings){
+    var page = Math.floor(request.start / request.length)
+    var params = {"limit": request.length}
+    if(page_cursors[page]){
+        params["after"] = page_cursors[page]
+    }
+    $.getJSON("/upload-annotation-list", params, function(response){
+        page_cursors[page + 1] = response['next']
+        callback({
+            "draw": request.draw,
+            "recordsTotal": response['total'],
+            "recordsFiltered": response['total'],
+            "data": response['data'] || []
+        })
+    });
+}
+
 function load_tbl_servers(){
     task_id = []
+    page_cursors = [null]
     return $('#tbl-uploaded-annotations').DataTable( {
-        "ajax": {
-            "url": "/upload-annotation-list",
-            "dataType": "json",
-        },
+        // pages are fetched on demand, one after the other (cursor pagination)
+        "serverSide": true,
+        "ajax": load_page,
+        "pagingType": "simple",
+        "lengthChange": false,
+        "searching": false,
+        "ordering": false,
         "destroy": true,
         "columns": [
             { "data": "project" },
@@ -13,6 +13,7 @@ $(document).ready(function() {
                         $('#no-result').addClass('d-none')
                         $('#uid').text(data.row_uid)
                         $('#external-id').text(data.external_id)
+                        $('#match').text(data.match == 'fuzzy' ? 'similar (' + Math.round(data.score * 100) + '%)' : 'exact')
                     }else{
                         $('#result').addClass('d-none')
                         $('#no-result').removeClass('d-none')
@@ -1,8 +1,14 @@
+from lbutils import annotations
 from lbutils import data_utils
+from lbutils import evaluation
+from lbutils import json_backend
 from lbutils import model_utils
 from lbutils import utils
 __all__ = [
+    'annotations',
     'data_utils',
+    'evaluation',
+    'json_backend',
     'model_utils',
     'utils',
 ]
@@ -0,0 +1,203 @@
+import json
+import numpy as np
+import pandas as pd
+
+# Columns describing a sample, every other column of the dataframe format is a feature
+META_COLUMNS = ['PMID', 'abstract', 'num_arms_in_study']
+SPAN_COLUMNS = ['doc_id', 'feature', 'start', 'end']
+
+
+class AnnotationTable:
+    """
+    Columnar annotation storage - one row per document & one row per span
+
+    `docs` holds the sample columns (PMID, abstract, num_arms_in_study), row position is the `doc_id`.
+    `spans` holds one row per annotation with columns doc_id, feature, start, end (python indexing),
+    integer offsets and a categorical feature keeping the feature order of the dataframe format.
+    """
+    def __init__(self, docs, spans, features):
+        """
+        Parameters
+        ----------
+        docs : pandas.core.frame.Dataframe
+            One row per document
+        spans : pandas.core.frame.Dataframe
+            One row per span - doc_id, feature, start, end
+        features : list
+            All the features (also the ones without any span)
+        """
+        self.features = list(features)
+        self.docs = docs.reset_index(drop = True)
+        self.spans = pd.DataFrame({
+            'doc_id' : np.asarray(spans['doc_id'], dtype = np.int64),
+            'feature' : pd.Categorical(np.asarray(spans['feature'], dtype = object), categories = self.features),
+            'start' : np.asarray(spans['start'], dtype = np.int64),
+            'end' : np.asarray(spans['end'], dtype = np.int64),
+        })
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def from_records(cls, records, features = ()):
+        """ Builds the table from samples
+
+        Parameters
+        ----------
+        records : list
+            Samples - dictionaries with the sample columns and a list of [start, end] per feature
+        features : list
+            Features to keep even if never annotated, new features are added in order of appearance
+
+        Returns
+        -------
+        table : AnnotationTable
+        """
+        features = list(features)
+        doc_columns = {col : [] for col in META_COLUMNS}
+        span_columns = {col : [] for col in SPAN_COLUMNS}
+        for doc_id, sample in enumerate(records):
+            for key, value in sample.items():
+                if key in doc_columns:
+                    continue
+                if key not in features:
+                    features.append(key)
+                for start, end in value:
+                    span_columns['doc_id'].append(doc_id)
+                    span_columns['feature'].append(key)
+                    span_columns['start'].append(start)
+                    span_columns['end'].append(end)
+            for col in META_COLUMNS:
+                doc_columns[col].append(sample.get(col, np.nan))
+
+        return cls(pd.DataFrame(doc_columns), span_columns, features)
+
+    @classmethod
+    def from_wide(cls, df):
+        """ Builds the table from the dataframe format (spans of each feature dumped in json)
+
+        Parameters
+        ----------
+        df : pandas.core.frame.Dataframe
+            Dataframe output from process_lbexport/process_jsonl
+
+        Returns
+        -------
+        table : AnnotationTable
+        """
+        features = [col for col in df.columns if col not in META_COLUMNS]
+        span_columns = {col : [] for col in SPAN_COLUMNS}
+        for feature in features:
+            for doc_id, cell in enumerate(df[feature].tolist()):
+                # Skip nan values
+                if isinstance(cell, float):
+                    continue
+                annot_list = json.loads(cell) if isinstance(cell, str) else cell
+                for start, end in annot_list:
+                    span_columns['doc_id'].append(doc_id)
+                    span_columns['feature'].append(feature)
+                    span_columns['start'].append(start)
+                    span_columns['end'].append(end)
+
+        docs = df[[col for col in df.columns if col in META_COLUMNS]]
+        return cls(docs, span_columns, features)
+
+    def to_wide(self):
+        """ Converts back to the dataframe format
+
+        Returns
+        -------
+        df : pandas.core.frame.Dataframe
+            Dataframe containing annotations per sample per feature dumped into json format
+        """
+        # Spans grouped by feature & document, keeping their order
+        cells = {feature : {} for feature in self.features}
+        spans = self.spans
+        for doc_id, feature, start, end in zip(spans['doc_id'].tolist(), spans['feature'].tolist(),
+                                               spans['start'].tolist(), spans['end'].tolist()):
+            cells[feature].setdefault(doc_id, []).append([start, end])
+
+        df = self.docs.copy()
+        for feature in self.features:
+            feature_cells = cells[feature]
+            df[feature] = [json.dumps(feature_cells[doc_id]) if doc_id in feature_cells else np.nan
+                           for doc_id in range(len(df))]
+        return df
+
+    def select(self, mask):
+        """ Keeps only some documents
+
+        Parameters
+        ----------
+        mask : array-like
+            True/False for every document
+
+        Returns
+        -------
+        table : AnnotationTable
+            New table, documents are renumbered
+        """
+        mask = np.asarray(mask, dtype = bool)
+        new_ids = np.cumsum(mask) - 1
+        spans = self.spans[mask[self.spans['doc_id'].to_numpy()]].copy()
+        spans['doc_id'] = new_ids[spans['doc_id'].to_numpy()]
+        return AnnotationTable(self.docs[mask], spans, self.features)
+
+    def with_spans(self, spans):
+        """Returns a new table with same documents & features and other spans"""
+        return AnnotationTable(self.docs, spans, self.features)
+
+    def save(self, path, file_format = 'parquet'):
+        """ Saves the table to `<path>.docs.<format>` & `<path>.spans.<format>` (requires pyarrow)
+
+        Parameters
+        ----------
+        path : str
+            Path without extension
+        file_format : str
+            parquet/feather
+        """
+        spans = self.spans.copy()
+        # Keep features which were never annotated
+        spans['feature'] = spans['feature'].cat.set_categories(self.features)
+        docs = self.docs.astype({col : str for col in self.docs.columns if col != 'num_arms_in_study'})
+        if file_format == 'parquet':
+            docs.to_parquet(f'{path}.docs.parquet')
+            spans.to_parquet(f'{path}.spans.parquet')
+        elif file_format == 'feather':
+            docs.to_feather(f'{path}.docs.feather')
+            spans.to_feather(f'{path}.spans.feather')
+        else:
+            raise ValueError(f'Invalid file format - {file_format}')
+
+    @classmethod
+    def load(cls, path, file_format = 'parquet'):
+        """ Loads a table saved with `save`
+
+        Parameters
+        ----------
+        path : str
+            Path without extension
+        file_format : str
+            parquet/feather
+
+        Returns
+        -------
+        table : AnnotationTable
+        """
+        if file_format == 'parquet':
+            docs = pd.read_parquet(f'{path}.docs.parquet')
+            spans = pd.read_parquet(f'{path}.spans.parquet')
+        elif file_format == 'feather':
+            docs = pd.read_feather(f'{path}.docs.feather')
+            spans = pd.read_feather(f'{path}.spans.feather')
+        else:
+            raise ValueError(f'Invalid file format - {file_format}')
+        return cls(docs, spans, spans['feature'].cat.categories)
+
+
+def to_table(df):
+    """Returns the table of annotations from the dataframe format or the table itself"""
+    if isinstance(df, AnnotationTable):
+        return df
+    return AnnotationTable.from_wide(df)
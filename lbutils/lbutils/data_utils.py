@@ -5,10 +5,10 @@ import csv
 import random
 import hashlib
 import numpy as np
-import pandas as pd
 from collections import defaultdict
-from itertools import combinations
-from lbutils.utils import DataCleaning
+from lbutils import json_backend
+from lbutils.annotations import AnnotationTable, META_COLUMNS, to_table
+from lbutils.utils import DataCleaning, resolve_overlaps
 
 dtypes = np.dtype([
           ('PMID', str),
@@ -38,7 +38,94 @@ dtypes = np.dtype([
           ('Other_HR',str)
           ])
 
-def process_lbexport(json_file, remove_2plus = False):
+FEATURES = [name for name in dtypes.names if name not in META_COLUMNS]
+
+def iter_lbexport(f, read_size = 2**16):
+    """ Iterates over the rows of a Labelbox json export without loading the whole file
+
+    The export is a json list, rows are decoded one at a time from a buffer
+    so memory is bounded by the size of the largest row. Raises ValueError if
+    anything but whitespace follows the list (ex: several concatenated lists).
+
+    Parameters
+    ----------
+    f : file object
+        Opened Labelbox .json export
+    read_size : int
+        Minimum number of characters read at once default - 65536
+
+    Yields
+    ------
+    row : dict
+        One exported row
+    """
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+    delimiter = re.compile(r'[\s,\]]')
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read_more():
+        """Drops the consumed buffer & reads the next block, returns False at end of file"""
+        nonlocal buffer, pos, eof
+        # Grow reads with the buffer so big rows are not decoded over & over
+        block = f.read(max(read_size, len(buffer) - pos))
+        buffer = buffer[pos:] + block
+        pos = 0
+        eof = not block
+        return not eof
+
+    def next_char():
+        """Skips whitespaces & returns the next character, empty string at end of file"""
+        nonlocal pos
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return ''
+
+    def check_end():
+        """Only whitespaces may follow the list (like json.load)"""
+        nonlocal pos
+        pos += 1
+        if next_char() != '':
+            raise ValueError('Extra data after the Labelbox export list')
+
+    if next_char() != '[':
+        raise ValueError('Labelbox export must be a json list')
+    pos += 1
+    if next_char() == ']':
+        check_end()
+        return
+
+    while True:
+        next_char()
+        try:
+            row, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Row is not fully read yet
+            if not read_more():
+                raise
+            continue
+        if not eof and isinstance(row, (int, float)) and not delimiter.match(buffer, end):
+            # A number could go on in the next block (ex: '-3.' of '-3.25'), decoded again with it
+            read_more()
+            continue
+        pos = end
+        yield row
+
+        char = next_char()
+        if char == ']':
+            check_end()
+            return
+        if char != ',':
+            raise ValueError(f'Expected , or ] in Labelbox export, found {char!r}')
+        pos += 1
+
+
+def process_lbexport(json_file, remove_2plus = False, as_table = False, stream = True):
     """ Extracts annotations into a dataframe from Labelbox NER json Format
     
     Logs Processed, Duplicate & Missing Annotation numbers.
@@ -51,10 +138,15 @@ def process_lbexport(json_file, remove_2plus = False):
         Exported Annotations .json file from Labelbox
     remove_2plus : bool
         Remove >2 arms default - False
+    as_table : bool
+        Return an AnnotationTable (one row per span) instead of the dataframe format default - False
+    stream : bool
+        Decode the export row by row (memory bounded by the largest row), otherwise the whole
+        export is parsed at once with the fastest installed json parser (see `lbutils.json_backend`) default - True
     
     Returns
     -------
-    df : pandas.core.frame.Dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
         Dataframe containing annotations per sample per feature dumped into json format
     missing_annots : list
         List of PMIDs which did not have any annotation in exported data
@@ -62,10 +154,6 @@ def process_lbexport(json_file, remove_2plus = False):
 
     remove_feature_overlaps = False
 
-    def find_index_ofdict(feature_spans, dict_to_find):
-        """Returns index of dict from list"""
-        return next((i for i, item in enumerate(feature_spans) if item == dict_to_find), None)
-
     def overlap(span_list):
         """Check if overlap is present in list of start, end indexes"""
         n = len(span_list)
@@ -75,50 +163,22 @@ def process_lbexport(json_file, remove_2plus = False):
         return False
 
     def drop_overlapping(span_list):
-        """Drops invalid overlaps for a particular feature considering length"""
-        filtered_list = []
-        spans = []
-        for span in span_list:
-            span_dict = defaultdict()
-            start, end = span[0], span[1]
-            span_dict['start'] = start
-            span_dict['end'] = end
-            span_dict['length'] = abs(start - end)
-            span_dict['valid'] = 1
-            spans.append(span_dict)
-
-        all_possible_overlaps = list(combinations(spans, 2))
-        
-        for span1, span2 in all_possible_overlaps:
-            if span1['valid'] and span2['valid']:
-                if (span2['start'] > span1['end']) or (span2['end'] < span1['start']):
-                    # Both spans are valid
-                    pass
-                else:
-                    # Prefer longer span
-                    if span1['length'] > span2['length']:
-                    # Mark 2nd as invalid
-                        index = find_index_ofdict(spans, span2)
-                        spans[index]['valid']  = 0
-                    elif span1['length'] < span2['length']:
-                    # Mark 1st as invalid
-                        index = find_index_ofdict(spans, span1)
-                        spans[index]['valid']  = 0
-                    else:
-                        raise Exception("Fail")
-
-        for span in spans:
-            # If valid(not overlapping)
-            if span['valid']:
-                filtered_list.append([span['start'], span['end']])
-
-        return filtered_list
-
-    df = pd.DataFrame(np.empty(0, dtype=dtypes))
+        """ Drops invalid overlaps for a particular feature considering length
+
+        A span is dropped if it overlaps (or touches) any longer span, even one which is dropped
+        itself - with chained overlaps A > B > C (B overlaps A & C, C doesn't overlap A) only A is kept.
+        The result doesn't depend on the order of the spans.
+        """
+        is_kept = resolve_overlaps(span_list, touching = True)
+        return [[start, end] for (start, end), keep in zip(span_list, is_kept) if keep]
+
+    records = []
     missing_annot = []
+    n_rows = 0
     with open(json_file, encoding='utf-8') as f:
-        data = json.load(f)
-        for i, row in enumerate(data):
+        rows = iter_lbexport(f) if stream else json_backend.loads(f.read())
+        for i, row in enumerate(rows):
+            n_rows += 1
             sample = defaultdict(list)
             abstract = row['Labeled Data']
             sample['abstract'] = abstract
@@ -178,123 +238,193 @@ def process_lbexport(json_file, remove_2plus = False):
 
 
             if flag_class or flag_label:
-                for key in sample:
-                    if not isinstance(sample[key], str):
-                        sample[key] = json.dumps(sample[key])
-                df = df.append(sample, ignore_index = True)
+                if not isinstance(sample['PMID'], str):
+                    sample['PMID'] = json.dumps(sample['PMID'])
+                records.append(dict(sample))
             else:
                 # has PMID but no classification label or annotations
                 missing_annot.append(sample['PMID'])   
     
-    print(f'Exported abstracts length - {len(data)}')
-    count = df.duplicated(subset = ['PMID']).sum()
+    # Build table once - known features first, then any new feature
+    table = AnnotationTable.from_records(records, features = FEATURES)
+
+    print(f'Exported abstracts length - {n_rows}')
+    is_duplicated = table.docs.duplicated(subset = ['PMID']).to_numpy()
+    count = is_duplicated.sum()
     if count:
         print('Duplicate PMIDs Found!, Deleting..')
         print(f'Duplicate count - {count}')
-        df = df.drop_duplicates(subset=['PMID'], ignore_index= True)    
-    
-    req_cols = df.columns.difference(['PMID','abstract', 'num_arms_in_study'])
+        table = table.select(~is_duplicated)
 
     if remove_2plus:
-        plus2 = df.loc[df['num_arms_in_study'].isin(['>2'])]
-        if len(plus2):
-            print(f'Found >2 arms dropping. Count - {len(plus2)}')
-            df = df.loc[df['num_arms_in_study'].isin(['1', '2'])]
+        is_2plus = table.docs['num_arms_in_study'].isin(['>2']).to_numpy()
+        if is_2plus.sum():
+            print(f'Found >2 arms dropping. Count - {is_2plus.sum()}')
+            table = table.select(table.docs['num_arms_in_study'].isin(['1', '2']).to_numpy())
 
     # No annotations but has num_arms label tho
-    no_annots = df[df[req_cols].isnull().all(axis=1)]
-    if len(no_annots):
-        df = df.dropna(how = 'all', subset = req_cols)
-        missing_annot += list(no_annots.PMID.values)
-
-    df.reset_index(inplace = True, drop=True)
+    has_annots = np.zeros(len(table), dtype = bool)
+    has_annots[table.spans['doc_id'].to_numpy()] = True
+    if not has_annots.all():
+        missing_annot += table.docs['PMID'][~has_annots].tolist()
+        table = table.select(has_annots)
 
-    print(f'Processed abstracts - {len(df)}')
+    print(f'Processed abstracts - {len(table)}')
     # Abstract which were exported but did not have any annotations
     print(f'Missing annotation abstracts - {len(missing_annot)}')
 
-    return df, missing_annot
+    if as_table:
+        return table, missing_annot
+    return table.to_wide(), missing_annot
+
+def trim_spaces(abstracts, doc_ids, starts, ends, chunk_size = 1024):
+    """ Removes the spaces at the begin/end of spans - vectorized over all the spans
+
+    Abstracts are processed by chunks, for each chunk the position of the next
+    non-space character and the end of the previous non-space character are precomputed
+    for every position, new indexes are then looked up for all the spans at once.
 
-def fix_annots(df, val = False, log = False):
+    Offsets are expected to be non-negative (Labelbox character offsets). Unlike slicing
+    `abstract[start:end]`, negative indexes are not counted from the end of the abstract:
+    spans with a negative start or an end at or before their start are returned unchanged.
+
+    Parameters
+    ----------
+    abstracts : list
+        Abstracts
+    doc_ids : numpy.ndarray
+        Abstract index of each span
+    starts : numpy.ndarray
+        Start index of each span
+    ends : numpy.ndarray
+        End index of each span (python indexing)
+    chunk_size : int
+        Number of abstracts processed at once default - 1024
+
+    Returns
+    -------
+    new_starts : numpy.ndarray
+        Start indexes without leading spaces
+    new_ends : numpy.ndarray
+        End indexes without trailing spaces
+    """
+    doc_ids = np.asarray(doc_ids, dtype = np.int64)
+    starts = np.asarray(starts, dtype = np.int64)
+    ends = np.asarray(ends, dtype = np.int64)
+    new_starts, new_ends = starts.copy(), ends.copy()
+    lengths = np.array([len(abstract) for abstract in abstracts], dtype = np.int64)
+
+    order = np.argsort(doc_ids, kind = 'mergesort')
+    sorted_ids = doc_ids[order]
+    for first_doc in range(0, len(abstracts), chunk_size):
+        last_doc = min(first_doc + chunk_size, len(abstracts))
+        idx = order[np.searchsorted(sorted_ids, first_doc):np.searchsorted(sorted_ids, last_doc)]
+        if not len(idx):
+            continue
+
+        # Abstracts of the chunk joined with a separator, so space runs stop at the abstract end
+        text = '\0'.join(abstracts[first_doc:last_doc]) + '\0'
+        is_space = np.frombuffer(text.encode('utf-32-le'), dtype = np.uint32) == ord(' ')
+        positions = np.arange(len(is_space))
+        # Next non-space position & end of previous non-space character for every position
+        next_char = np.minimum.accumulate(np.where(is_space, len(is_space), positions)[::-1])[::-1]
+        prev_end = np.concatenate([[0], np.maximum.accumulate(np.where(is_space, 0, positions + 1))])
+
+        offsets = np.concatenate([[0], np.cumsum(lengths[first_doc:last_doc] + 1)])
+        doc_offsets = offsets[doc_ids[idx] - first_doc]
+        start, end = starts[idx], ends[idx]
+        # Slicing an abstract stops at its end
+        end_clip = np.minimum(end, lengths[doc_ids[idx]])
+        is_valid = (start >= 0) & (start < end_clip)
+        start, end, end_clip, doc_offsets, idx = (start[is_valid], end[is_valid], end_clip[is_valid],
+                                                  doc_offsets[is_valid], idx[is_valid])
+
+        # Same as removing spaces one by one, spans with only spaces get start & end swapped
+        n_lead = np.minimum(next_char[start + doc_offsets] - doc_offsets, end_clip) - start
+        n_trail = end_clip - np.maximum(prev_end[end_clip + doc_offsets] - doc_offsets, start)
+        new_starts[idx] = start + n_lead
+        new_ends[idx] = end - n_trail
+
+    return new_starts, new_ends
+
+
+def fix_annots(df, val = False, log = False, vocab = None):
     """
-    Inplace Fixes annotations
+    Fixes annotations
     - Fixes annotations having whitespaces
 
     Parameters 
     ----------
-    df : pandas.core.frame.Dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
         Dataframe output from the process_lbexport function
     val : bool
         Number Extraction during Evaluation default - False
+    log : bool
+        Display edits default - False
+    vocab : set
+        Words of the total_sample_size spans of the whole dataset, when `df` is a chunk of it
+        (see DataCleaning.collect_vocab) default - None, words of `df`
     
     Returns
     -------
-    df : pandas.core.frame.Dataframe
-        Cleaned and processed dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
+        Cleaned and processed dataframe (same format as the input)
     
     """
 
     fix_decimals = False
 
-    columns = df.columns
-    for index in df.index:
-        abstract = df['abstract'][index]
-        pmid = df['PMID'][index]
-        for col in columns:
-            # Skip nan values and parse only required labels
-            if not isinstance(df[col][index],float) and col not in ['PMID', 'abstract','num_arms_in_study']:
-                annot_list = json.loads(df[col][index])
-                # One feature can have multiple annotation
-                for i, annot in enumerate(annot_list):
-                    start, end = int(annot[0]), int(annot[1])
-                    span = abstract[start:end]
-                    span_check = span.strip()
-                    # check if string contains whitespace at begin/end
-                    if span != span_check:
-                        # Correct indexes
-                        # Forward
-                        for c in span:
-                            if c == ' ':
-                                start += 1
-                            else:
-                                break
-                        # Backward
-                        for c in reversed(span):
-                            if c == ' ':
-                                end -= 1
-                            else:
-                                break
-                                      
-                    if fix_decimals:
-                        # For such cases annotated -> 0139, token -> .0139
-                        if start and abstract[start - 1] == '.':
-                            # Possible candidate
-                            if span.isnumeric():
-                                # Its a number
-                                check_span = abstract[start - 10:end]
-                                check_span = check_span.replace(" ", "")
-                                check_span = check_span.replace(span, "")
-                                length = len(span)
-                                # False positive -> .25 patients
-                                if check_span[-1] == '.' and check_span[-2] == '=':
-                                    # 0030 -> .0030
-                                    start -= 1
-                
-                    annot_list[i] = [start, end]
-
-                # Fixing new annotations can make new duplicates
-                annot_list = list(set(map(tuple, annot_list)))
-                df[col][index] = json.dumps(annot_list)
+    table = to_table(df)
+    abstracts = table.docs['abstract'].tolist()
+    spans = table.spans
+    # Remove whitespaces at begin/end of all the spans at once
+    new_starts, new_ends = trim_spaces(abstracts, spans['doc_id'].to_numpy(),
+                                       spans['start'].to_numpy(), spans['end'].to_numpy())
+
+    if fix_decimals:
+        new_starts = new_starts.copy()
+        for i, (doc_id, start, end) in enumerate(zip(spans['doc_id'].tolist(), spans['start'].tolist(),
+                                                     spans['end'].tolist())):
+            abstract = abstracts[doc_id]
+            span = abstract[start:end]
+            start, end = int(new_starts[i]), int(new_ends[i])
+            # For such cases annotated -> 0139, token -> .0139
+            if start and abstract[start - 1] == '.':
+                # Possible candidate
+                if span.isnumeric():
+                    # Its a number
+                    check_span = abstract[start - 10:end]
+                    check_span = check_span.replace(" ", "")
+                    check_span = check_span.replace(span, "")
+                    length = len(span)
+                    # False positive -> .25 patients
+                    if check_span[-1] == '.' and check_span[-2] == '=':
+                        # 0030 -> .0030
+                        new_starts[i] = start - 1
+
+    # Fixing new annotations can make new duplicates
+    spans = spans.assign(start = new_starts, end = new_ends).drop_duplicates()
+    table = table.with_spans(spans)
     
     if val:
-        dc = DataCleaning(df, log = log)
+        dc = DataCleaning(table, log = log)
         # For total sample size
-        dc.build_vocab()
-        df = dc.extract_all()
-
-    return df
-
-
+        dc.build_vocab(vocab)
+        table = dc.extract_all()
+
+    if isinstance(df, AnnotationTable):
+        return table
+    return table.to_wide()
+
+
+def _iter_doc_spans(table):
+    """Yields doc_id & list of (feature, start, end) for every document, spans grouped by feature in column order"""
+    spans = table.spans.sort_values(['doc_id', 'feature'], kind = 'mergesort')
+    doc_spans = [[] for _ in range(len(table))]
+    for doc_id, feature, start, end in zip(spans['doc_id'].tolist(), spans['feature'].tolist(),
+                                           spans['start'].tolist(), spans['end'].tolist()):
+        doc_spans[doc_id].append((feature, start, end))
+    return enumerate(doc_spans)
     
 
 def to_jsonl(df, file_name):
@@ -303,35 +433,40 @@ def to_jsonl(df, file_name):
 
     Parameters
     ----------
-    df : pandas.core.frame.Dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
         Processed exported dataframe using process_json()
     file_name : str
         json filename
     """
-    data = []
-    cols = list(df.columns)
+    with open(file_name + '.json', 'w', encoding='utf-8') as f:
+        for line in to_jsonl_lines(df):
+            f.write(line)
+
+def to_jsonl_lines(df):
+    """
+    Converts the dataframe to lines of the jsonl evaluation format
 
-    for index in df.index:
+    Parameters
+    ----------
+    df : pandas.core.frame.Dataframe/AnnotationTable
+        Processed exported dataframe using process_json()
+
+    Yields
+    -------
+    line : str
+        json line of a sample (ends with a newline)
+    """
+    table = to_table(df)
+    abstracts = table.docs['abstract'].tolist()
+    pmids = table.docs['PMID'].tolist()
+
+    for doc_id, doc_spans in _iter_doc_spans(table):
         row = dict()
-        abstract = df['abstract'][index]
-        pmid = df['PMID'][index]
-
-        row['id'] = pmid
-        row['text'] = abstract
-        predictions = []
-        for col in cols:
-            # Skip nan values and parse only required labels
-            if not isinstance(df[col][index],float) and col not in ['PMID', 'abstract','num_arms_in_study']:
-                annot_list = json.loads(df[col][index])
-                for i, annot in enumerate(annot_list):
-                    start, end = annot
-                    predictions.append({'start' : start, 'end' : end, 'entity' : col})
-        row['predictions'] = predictions
-        data.append(row) 
-    
-    with open(file_name + '.json', 'w', encoding='utf-8') as f:
-        for item in data:
-            f.write(json.dumps(item) + "\n")
+        row['id'] = pmids[doc_id]
+        row['text'] = abstracts[doc_id]
+        row['predictions'] = [{'start' : start, 'end' : end, 'entity' : feature}
+                              for feature, start, end in doc_spans]
+        yield json.dumps(row) + "\n"
 
 def df_to_raw(df, file_name, file_format):
     """Converts the cleaned dataframe back to labelbox raw format
@@ -340,7 +475,7 @@ def df_to_raw(df, file_name, file_format):
 
     Parameters
     ----------
-    df : pandas.core.frame.Dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
         Processed & fixed exported dataframe
     file_name : str
         filename
@@ -348,14 +483,18 @@ def df_to_raw(df, file_name, file_format):
         csv/json export
     """
 
+    table = to_table(df)
+    abstracts = table.docs['abstract'].tolist()
+    pmids = table.docs['PMID'].tolist()
+    all_num_arms = table.docs['num_arms_in_study'].tolist()
 
     rct_pre = []
-    for index in df.index:
+    for doc_id, doc_spans in _iter_doc_spans(table):
         sample = defaultdict()
 
-        abstract = df['abstract'][index]
-        pmid = df['PMID'][index]
-        num_arms_in_study = df['num_arms_in_study'][index]
+        abstract = abstracts[doc_id]
+        pmid = pmids[doc_id]
+        num_arms_in_study = all_num_arms[doc_id]
 
         sample['id'] = pmid
         sample['Labeled Data'] = abstract
@@ -366,21 +505,15 @@ def df_to_raw(df, file_name, file_format):
         }})
         sample['Label']['objects'] = []
 
-        for col in df.columns:
-            if not isinstance(df[col][index],float) and col not in ['PMID', 'abstract','num_arms_in_study']:
-                annot_list = json.loads(df[col][index])
-
-                for annot in annot_list:
-                    start, end = annot
-
-                    sample['Label']['objects'].append({
-                        'title':col, 'value':col, 'data' : {
-                            'location' : {
-                                'start' : start,
-                                'end' : end - 1
-                            }
-                        }
-                    })
+        for feature, start, end in doc_spans:
+            sample['Label']['objects'].append({
+                'title':feature, 'value':feature, 'data' : {
+                    'location' : {
+                        'start' : start,
+                        'end' : end - 1
+                    }
+                }
+            })
         rct_pre.append(dict(sample))
         
     if file_format == 'json':
@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+from lbutils.annotations import to_table
+
+MATCH_TYPES = ['exact', 'overlap', 'token']
+# Characters separating tokens for the token level scores, \0 separates abstracts
+TOKEN_SEPARATORS = ' \t\n\r\0'
+# Lookup table of the separators by character code
+_IS_SEPARATOR = np.zeros(128, dtype = bool)
+_IS_SEPARATOR[[ord(c) for c in TOKEN_SEPARATORS]] = True
+
+
+def token_bounds(abstracts, doc_ids, starts, ends, chunk_size = 1024):
+    """ First & last whitespace token of each span - vectorized over all the spans
+
+    Tokens are numbered over all the abstracts, so a token id is unique over the dataset.
+
+    Parameters
+    ----------
+    abstracts : list
+        Abstracts
+    doc_ids : numpy.ndarray
+        Abstract index of each span
+    starts : numpy.ndarray
+        Start index of each span
+    ends : numpy.ndarray
+        End index of each span (python indexing)
+    chunk_size : int
+        Number of abstracts processed at once default - 1024
+
+    Returns
+    -------
+    first : numpy.ndarray
+        First token of each span
+    last : numpy.ndarray
+        Last token of each span (inclusive), lower than `first` if the span has no token
+    """
+    doc_ids = np.asarray(doc_ids, dtype = np.int64)
+    starts = np.asarray(starts, dtype = np.int64)
+    ends = np.asarray(ends, dtype = np.int64)
+    first, last = np.ones(len(doc_ids), dtype = np.int64), np.zeros(len(doc_ids), dtype = np.int64)
+    lengths = np.array([len(abstract) for abstract in abstracts], dtype = np.int64)
+
+    order = np.argsort(doc_ids, kind = 'mergesort')
+    sorted_ids = doc_ids[order]
+    n_tokens = 0
+    for first_doc in range(0, len(abstracts), chunk_size):
+        last_doc = min(first_doc + chunk_size, len(abstracts))
+
+        # Abstracts of the chunk joined with a separator, so tokens stop at the abstract end
+        text = '\0'.join(abstracts[first_doc:last_doc]) + '\0'
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype = np.uint32)
+        is_space = _IS_SEPARATOR[np.minimum(codes, 127)]
+        is_token_start = ~is_space
+        is_token_start[1:] &= is_space[:-1]
+        # Token of every position, spaces belong to the previous token
+        token_ids = np.cumsum(is_token_start) - 1 + n_tokens
+        n_tokens += int(is_token_start.sum())
+
+        idx = order[np.searchsorted(sorted_ids, first_doc):np.searchsorted(sorted_ids, last_doc)]
+        if not len(idx):
+            continue
+        offsets = np.concatenate([[0], np.cumsum(lengths[first_doc:last_doc] + 1)])
+        doc_offsets = offsets[doc_ids[idx] - first_doc]
+        start = starts[idx]
+        end = np.minimum(ends[idx], lengths[doc_ids[idx]])
+        is_valid = (start >= 0) & (start < end)
+        start, end, doc_offsets, idx = start[is_valid], end[is_valid], doc_offsets[is_valid], idx[is_valid]
+
+        first[idx] = token_ids[start + doc_offsets] + is_space[start + doc_offsets]
+        last[idx] = token_ids[end - 1 + doc_offsets]
+
+    return first, last
+
+
+def _overlaps(cells, starts, ends, other_cells, other_starts, other_ends):
+    """True for every span which overlaps a span of the other set in the same cell (document & feature)"""
+    if not len(other_cells):
+        return np.zeros(len(cells), dtype = bool)
+    # Cells are laid out one after the other on a single axis
+    width = max(ends.max(initial = 0), other_ends.max()) + 1
+    order = np.lexsort((other_starts, other_cells))
+    other_begin = (other_cells * width + other_starts)[order]
+    # Furthest end among the spans of the cell starting before each position
+    other_reach = np.maximum.accumulate((other_cells * width + other_ends)[order])
+
+    idx = np.searchsorted(other_begin, cells * width + ends, side = 'left') - 1
+    return (idx >= 0) & (other_reach[np.maximum(idx, 0)] > cells * width + starts)
+
+
+def _sorted_unique(keys):
+    """Sorted unique keys"""
+    keys = np.sort(keys)
+    return keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+
+
+def _sorted_isin(keys, other_keys):
+    """True for every key found in `other_keys` - both sorted & unique"""
+    idx = np.minimum(np.searchsorted(other_keys, keys), max(len(other_keys) - 1, 0))
+    return other_keys[idx] == keys if len(other_keys) else np.zeros(len(keys), dtype = bool)
+
+
+def _unique_spans(cells, starts, ends, width):
+    """Unique spans encoded as keys - cells, starts, ends & keys, sorted by key"""
+    keys = _sorted_unique((cells * width + starts) * width + ends)
+    cells, rest = np.divmod(keys, width * width)
+    starts, ends = np.divmod(rest, width)
+    return cells, starts, ends, keys
+
+
+def _unique_tokens(cells, tokens, width):
+    """Unique (cell, token) encoded as keys - cells & keys, sorted by key"""
+    keys = _sorted_unique(cells * width + tokens)
+    return keys // width, keys
+
+
+def _scores(tp_pred, tp_gold, n_pred, n_gold):
+    """Precision, recall & f1 from counts (0 when undefined)"""
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        precision = np.where(n_pred > 0, tp_pred / n_pred, 0.)
+        recall = np.where(n_gold > 0, tp_gold / n_gold, 0.)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.)
+    return precision, recall, f1
+
+
+class SpanScorer:
+    """
+    Span level precision, recall & f1 of predictions against gold annotations
+
+    Spans of both tables are encoded as integer keys (document, feature, start, end), matches are
+    found with sorted array joins. Counts are kept per document & feature so that bootstrap
+    resamples of the documents are a single matrix product.
+
+    - exact : same start & end
+    - overlap : predicted span overlapping a gold span (precision), gold span overlapping a
+      predicted span (recall)
+    - token : whitespace tokens covered by the spans
+    """
+    def __init__(self, gold, pred, features = None, chunk_size = 1024):
+        """
+        Parameters
+        ----------
+        gold : pandas.core.frame.Dataframe/AnnotationTable
+            Gold annotations (process_lbexport output)
+        pred : pandas.core.frame.Dataframe/AnnotationTable
+            Predictions (process_jsonl output), documents are matched on PMID,
+            predictions of documents not in `gold` are ignored
+        features : list
+            Features to score default - None, all the features of gold & predictions
+        chunk_size : int
+            Number of abstracts processed at once for token scores default - 1024
+        """
+        gold, pred = to_table(gold), to_table(pred)
+        if features is None:
+            features = list(dict.fromkeys(gold.features + pred.features))
+        self.features = list(features)
+        self.n_docs = len(gold)
+
+        # Predicted document -> gold document
+        gold_ids = pd.Series(np.arange(len(gold)), index = gold.docs['PMID'].to_numpy())
+        gold_ids = gold_ids[~gold_ids.index.duplicated()]
+        pred_doc_map = gold_ids.reindex(pred.docs['PMID'].to_numpy()).fillna(-1).to_numpy(dtype = np.int64)
+
+        gold_spans = self._spans(gold, np.arange(len(gold)))
+        pred_spans = self._spans(pred, pred_doc_map)
+        # Spans are encoded with the same key layout for gold & predictions
+        width = max(gold_spans[2].max(initial = 0), pred_spans[2].max(initial = 0)) + 1
+        gold_spans, pred_spans = _unique_spans(*gold_spans, width), _unique_spans(*pred_spans, width)
+        abstracts = gold.docs['abstract'].tolist()
+
+        # Counts per cell (document & feature) - matched predictions, matched gold, predictions, gold
+        self.counts = {}
+        for match in MATCH_TYPES:
+            if match == 'token':
+                gold_tokens, pred_tokens = self._tokens(abstracts, gold_spans, pred_spans, chunk_size)
+                width = max(gold_tokens[1].max(initial = 0), pred_tokens[1].max(initial = 0)) + 1
+                gold_units = _unique_tokens(*gold_tokens, width)
+                pred_units = _unique_tokens(*pred_tokens, width)
+            else:
+                gold_units, pred_units = gold_spans, pred_spans
+            gold_cells, pred_cells = gold_units[0], pred_units[0]
+
+            if match == 'overlap':
+                pred_matched = _overlaps(*pred_units[:3], *gold_units[:3])
+                gold_matched = _overlaps(*gold_units[:3], *pred_units[:3])
+            else:
+                pred_matched = _sorted_isin(pred_units[-1], gold_units[-1])
+                gold_matched = _sorted_isin(gold_units[-1], pred_units[-1])
+            self.counts[match] = np.stack([
+                self._count(pred_cells[pred_matched]),
+                self._count(gold_cells[gold_matched]),
+                self._count(pred_cells),
+                self._count(gold_cells),
+            ], axis = -1)
+
+    def _spans(self, table, doc_map):
+        """Spans of a table - cells (document & feature), starts & ends"""
+        spans = table.spans
+        doc_ids = doc_map[spans['doc_id'].to_numpy()]
+        feature_ids = pd.Categorical(spans['feature'].astype(object), categories = self.features).codes.astype(np.int64)
+        keep = (doc_ids >= 0) & (feature_ids >= 0)
+        cells = doc_ids[keep] * len(self.features) + feature_ids[keep]
+        return cells, spans['start'].to_numpy()[keep], spans['end'].to_numpy()[keep]
+
+    def _tokens(self, abstracts, gold_spans, pred_spans, chunk_size):
+        """Every token of every span of gold & predictions - cells & tokens"""
+        # Token bounds of both sets in one pass over the abstracts
+        cells, starts, ends = (np.concatenate([gold, pred]) for gold, pred in zip(gold_spans[:3], pred_spans[:3]))
+        first, last = token_bounds(abstracts, cells // len(self.features), starts, ends, chunk_size = chunk_size)
+        n_tokens = np.maximum(last - first + 1, 0)
+        offsets = np.repeat(np.cumsum(n_tokens) - n_tokens, n_tokens)
+        tokens = np.repeat(first, n_tokens) + np.arange(n_tokens.sum()) - offsets
+        cells = np.repeat(cells, n_tokens)
+        n_gold = n_tokens[:len(gold_spans[0])].sum()
+        return (cells[:n_gold], tokens[:n_gold]), (cells[n_gold:], tokens[n_gold:])
+
+    def _count(self, cells):
+        """Number of units per document & feature"""
+        n_features = len(self.features)
+        return np.bincount(cells, minlength = self.n_docs * n_features).reshape(self.n_docs, n_features)
+
+    def _table(self, totals):
+        """Scores per feature & overall (micro average) from the counts summed over documents"""
+        totals = np.concatenate([totals, totals.sum(axis = -2, keepdims = True)], axis = -2)
+        return _scores(*np.moveaxis(totals, -1, 0))
+
+    def score(self, n_bootstrap = 0, ci = 0.95, seed = 0, batch_size = 100):
+        """ Computes the scores
+
+        Parameters
+        ----------
+        n_bootstrap : int
+            Number of bootstrap resamples of the documents for confidence intervals default - 0, no interval
+        ci : float
+            Confidence level default - 0.95
+        seed : int
+            Random seed of the resampling default - 0
+        batch_size : int
+            Number of resamples drawn at once default - 100
+
+        Returns
+        -------
+        scores : pandas.core.frame.Dataframe
+            precision, recall, f1, n_gold, n_pred per match type & feature ('all' - micro average),
+            `<score>_low` & `<score>_high` bounds if `n_bootstrap` is given
+        """
+        index = pd.MultiIndex.from_product([MATCH_TYPES, self.features + ['all']], names = ['match', 'feature'])
+        counts = np.stack([self.counts[match] for match in MATCH_TYPES])
+        totals = counts.sum(axis = 1)
+        precision, recall, f1 = self._table(totals)
+        scores = pd.DataFrame({
+            'precision' : precision.ravel(),
+            'recall' : recall.ravel(),
+            'f1' : f1.ravel(),
+            'n_gold' : np.concatenate([totals[..., 3], totals[..., 3].sum(axis = 1, keepdims = True)], axis = 1).ravel(),
+            'n_pred' : np.concatenate([totals[..., 2], totals[..., 2].sum(axis = 1, keepdims = True)], axis = 1).ravel(),
+        }, index = index)
+
+        if n_bootstrap and self.n_docs:
+            rng = np.random.default_rng(seed)
+            # Counts of every document as one row, float64 counts are exact up to 2**53
+            flat_counts = np.moveaxis(counts, 1, 0).reshape(self.n_docs, -1).astype(np.float64)
+            samples = []
+            for first in range(0, n_bootstrap, batch_size):
+                n_samples = min(batch_size, n_bootstrap - first)
+                # Number of times each document is drawn, one bincount for the whole batch
+                draws = rng.integers(self.n_docs, size = (n_samples, self.n_docs))
+                draws += np.arange(n_samples)[:, None] * self.n_docs
+                weights = np.bincount(draws.ravel(), minlength = n_samples * self.n_docs).reshape(n_samples, self.n_docs)
+                resampled = (weights.astype(np.float64) @ flat_counts).reshape((n_samples,) + totals.shape)
+                samples.append(np.stack(self._table(resampled), axis = 1))
+            samples = np.concatenate(samples)
+            low, high = np.quantile(samples, [(1 - ci) / 2, (1 + ci) / 2], axis = 0)
+            for i, name in enumerate(['precision', 'recall', 'f1']):
+                scores[f'{name}_low'] = low[i].ravel()
+                scores[f'{name}_high'] = high[i].ravel()
+
+        return scores
+
+
+def evaluate(gold, pred, features = None, n_bootstrap = 0, ci = 0.95, seed = 0):
+    """ Span level precision, recall & f1 per feature - exact, overlap & token matches
+
+    Parameters
+    ----------
+    gold : pandas.core.frame.Dataframe/AnnotationTable
+        Gold annotations (process_lbexport output)
+    pred : pandas.core.frame.Dataframe/AnnotationTable
+        Predictions (process_jsonl output)
+    features : list
+        Features to score default - None, all the features
+    n_bootstrap : int
+        Number of bootstrap resamples for confidence intervals default - 0
+    ci : float
+        Confidence level default - 0.95
+    seed : int
+        Random seed of the resampling default - 0
+
+    Returns
+    -------
+    scores : pandas.core.frame.Dataframe
+        Scores indexed by match type & feature, see SpanScorer.score
+    """
+    return SpanScorer(gold, pred, features = features).score(n_bootstrap = n_bootstrap, ci = ci, seed = seed)
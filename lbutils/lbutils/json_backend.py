@@ -0,0 +1,100 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# Fastest first, the stdlib is always available
+_LOADERS = {
+    'orjson' : orjson.loads if orjson is not None else None,
+    'simdjson' : simdjson.loads if simdjson is not None else None,
+    'json' : json.loads,
+}
+BACKENDS = [name for name, loader in _LOADERS.items() if loader is not None]
+_backend = BACKENDS[0]
+
+
+def get_backend():
+    """Name of the json parser in use"""
+    return _backend
+
+
+def set_backend(name):
+    """ Selects the json parser
+
+    Parameters
+    ----------
+    name : str
+        orjson/simdjson/json, must be installed (see `BACKENDS`)
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f'Json backend {name} is not installed, use one of {BACKENDS}')
+    _backend = name
+
+
+def loads(s, backend = None):
+    """ Parses a json document with the fastest installed parser
+
+    Parameters
+    ----------
+    s : str/bytes
+        Json document
+    backend : str
+        Parser to use default - None, `get_backend()`
+
+    Returns
+    -------
+    obj : object
+        Parsed document
+    """
+    return _LOADERS[backend or _backend](s)
+
+
+def _loads_chunk(strings, backend, transform):
+    """Parses a chunk of documents (in a worker process)"""
+    loader = _LOADERS[backend]
+    if transform is None:
+        return [loader(s) for s in strings]
+    return [transform(loader(s)) for s in strings]
+
+
+def loads_many(strings, n_process = 1, chunk_size = 10000, transform = None, backend = None):
+    """ Parses many json documents, chunks of documents are dispatched to a process pool
+
+    Parsed objects are sent back to the main process, `transform` (a module level function)
+    can reduce every object to what is needed before it is sent back.
+
+    Parameters
+    ----------
+    strings : list
+        Json documents
+    n_process : int
+        Number of processes default - 1, parse in this process
+    chunk_size : int
+        Number of documents per chunk default - 10000
+    transform : function
+        Applied to every parsed object default - None
+    backend : str
+        Parser to use default - None, `get_backend()`
+
+    Returns
+    -------
+    objs : list
+        Parsed (and transformed) documents in input order
+    """
+    backend = backend or _backend
+    if n_process <= 1 or len(strings) <= chunk_size:
+        return _loads_chunk(strings, backend, transform)
+
+    chunks = [strings[i:i + chunk_size] for i in range(0, len(strings), chunk_size)]
+    with ProcessPoolExecutor(max_workers = n_process) as executor:
+        results = executor.map(_loads_chunk, chunks, [backend] * len(chunks), [transform] * len(chunks))
+        return [obj for chunk in results for obj in chunk]
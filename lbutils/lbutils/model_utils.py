@@ -1,10 +1,68 @@
 import json
 import numpy as np
 import pandas as pd
-from collections import defaultdict
-from lbutils.data_utils import dtypes
+from itertools import islice
+from lbutils import json_backend
+from lbutils.annotations import AnnotationTable
+from lbutils.data_utils import FEATURES
 
-def process_jsonl(json_file):
+def _doc_columns(row):
+    """PMID, abstract & predictions (entity, start, end) of a parsed model output line"""
+    pmid = row['id'] if isinstance(row['id'], str) else json.dumps(row['id'])
+    preds = [(pred['entity'], pred['start'], pred['end']) for pred in row['predictions']]
+    return pmid, row['text'], preds
+
+
+def process_jsonl_lines(lines, as_table = False, n_process = 1):
+    """
+    Converts lines of model output to dataframe
+
+    Column arrays of the documents & spans are built in a single pass.
+    Lines are parsed with the fastest installed json parser (see `lbutils.json_backend`).
+
+    Parameters 
+    ----------
+    lines : iterable
+        Lines of the model output jsonl file
+    as_table : bool
+        Return an AnnotationTable (one row per span) instead of the dataframe format default - False
+    n_process : int
+        Number of processes parsing the lines default - 1
+    
+    Returns
+    -------
+    df : pandas.core.frame.Dataframe/AnnotationTable
+        Output Dataframe
+    
+    """
+    pmids, abstracts = [], []
+    doc_ids, entities, starts, ends = [], [], [], []
+    if n_process > 1:
+        rows = json_backend.loads_many(list(lines), n_process = n_process, transform = _doc_columns)
+    else:
+        rows = (_doc_columns(json_backend.loads(line)) for line in lines)
+    for doc_id, (pmid, abstract, preds) in enumerate(rows):
+        pmids.append(pmid)
+        abstracts.append(abstract)
+
+        for entity, start, end in preds:
+            doc_ids.append(doc_id)
+            entities.append(entity)
+            starts.append(start)
+            ends.append(end)
+
+    # New features are added in order of appearance
+    features = list(FEATURES)
+    features.extend(dict.fromkeys(entity for entity in entities if entity not in FEATURES))
+
+    docs = pd.DataFrame({'PMID' : pmids, 'abstract' : abstracts, 'num_arms_in_study' : np.nan})
+    spans = {'doc_id' : doc_ids, 'feature' : entities, 'start' : starts, 'end' : ends}
+    table = AnnotationTable(docs, spans, features)
+    if as_table:
+        return table
+    return table.to_wide()
+
+def process_jsonl(json_file, as_table = False, chunksize = None, n_process = 1):
     """
     Converts model output to dataframe
 
@@ -12,30 +70,50 @@ def process_jsonl(json_file):
     ----------
     json_file : str
         model output json file
+    as_table : bool
+        Return an AnnotationTable (one row per span) instead of the dataframe format default - False
+    chunksize : int
+        Number of lines per dataframe, returns an iterator over the chunks of the file (only one
+        chunk is kept in memory) default - None, whole file
+    n_process : int
+        Number of processes parsing the lines default - 1
     
     Returns
     -------
-    df : pandas.core.frame.Dataframe
-        Output Dataframe
+    df : pandas.core.frame.Dataframe/AnnotationTable
+        Output Dataframe (iterator of Dataframes if `chunksize` is given)
     
     """
-    data = []
+    if chunksize is not None:
+        return (process_jsonl_lines(lines, as_table = as_table, n_process = n_process)
+                for lines in iter_jsonl_chunks(json_file, chunk_size = chunksize))
+
     with open(json_file, encoding='utf-8') as f:
-        for line in f:
-            data.append(json.loads(line))
+        return process_jsonl_lines(f, as_table = as_table, n_process = n_process)
+
+def iter_jsonl_chunks(json_file, chunk_size = 10000):
+    """
+    Reads model output in chunks of lines, only one chunk is kept in memory
+
+    Parameters 
+    ----------
+    json_file : str
+        model output json file
+    chunk_size : int
+        Number of lines per chunk default - 10000
     
-    df = pd.DataFrame(np.empty(0, dtype = dtypes))
-    for i,row in enumerate(data):
-        sample = defaultdict(list)
-        sample['PMID'] = row['id']
-        sample['abstract'] = row['text']
-
-        for pred in row['predictions']:
-            sample[pred['entity']].append([pred['start'], pred['end']])
-        
-        for key in sample:
-            if not isinstance(sample[key], str):
-                sample[key] = json.dumps(sample[key])
-        df = df.append(sample, ignore_index = True)
+    Yields
+    -------
+    lines : list
+        Lines of the chunk (in file order)
     
-    return df
+    """
+    with open(json_file, encoding='utf-8') as f:
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                return
+            # Skip blank lines
+            lines = [line for line in lines if line.strip()]
+            if lines:
+                yield lines
@@ -1,21 +1,156 @@
 import re
-import json
+from bisect import bisect_left
+from functools import lru_cache
+from heapq import heappop, heappush
+from itertools import accumulate
+import numpy as np
+import pandas as pd
+from lbutils.annotations import AnnotationTable, to_table
+
+# Feature type of each feature (normalizer used), every other feature is a number
+FEATURE_KINDS = {
+    'g1_n' : 'n', 'g2_n' : 'n',
+    'g1_n_response' : 'n_response', 'g2_n_response' : 'n_response',
+    'total_sample_size' : 'sample_size',
+}
+NUMBER_PATTERN = re.compile(r'\d*[.·]?\d+')
+
+
+def resolve_overlaps(spans, touching = False):
+    """ Sort-and-sweep overlap resolver - keeps the longest span of every collision
+
+    A span is dropped if it overlaps a longer span (or a span of same length that comes first).
+    Runs in O(n log n), an overlapping span at least as long as a span must contain
+    its first or last character, so only those two positions are checked.
+
+    Parameters
+    ----------
+    spans : list
+        Unique [start, end] spans, python indexing
+    touching : bool
+        Also treat spans sharing a boundary as overlapping default - False
+
+    Returns
+    -------
+    is_kept : list
+        True/False for every span, True if the span is kept
+    """
+    # Touching spans overlap if the end index is included
+    spans = [(start, end + 1) if touching else (start, end) for start, end in spans]
+
+    # Longest first, ties broken by position
+    order = sorted(range(len(spans)), key = lambda i: (spans[i][0] - spans[i][1], i))
+    rank = [0] * len(spans)
+    for r, i in enumerate(order):
+        rank[i] = r
+
+    non_empty = [i for i, (start, end) in enumerate(spans) if end > start]
+    by_start = sorted(non_empty, key = lambda i: spans[i][0])
+    starts = [spans[i][0] for i in by_start]
+    max_ends = list(accumulate((spans[i][1] for i in by_start), max))
+
+    is_kept = [True] * len(spans)
+    # Empty spans collide with any span strictly around them
+    for i, (start, end) in enumerate(spans):
+        if end <= start:
+            n_before = bisect_left(starts, start)
+            is_kept[i] = not (n_before and max_ends[n_before - 1] > start)
+
+    # Sweep first & last character of each span, active spans kept in a heap by rank
+    queries = sorted((pos, i) for i in non_empty for pos in {spans[i][0], spans[i][1] - 1})
+    active = []
+    n_inserted = 0
+    for pos, i in queries:
+        while n_inserted < len(by_start) and starts[n_inserted] <= pos:
+            j = by_start[n_inserted]
+            heappush(active, (rank[j], spans[j][1]))
+            n_inserted += 1
+        while active and active[0][1] <= pos:
+            heappop(active)
+        if active[0][0] < rank[i]:
+            is_kept[i] = False
+
+    return is_kept
+
+
+class SpanNormalizer:
+    """
+    Rule-driven span normalizer
+
+    Removes symbols and stop-words from spans, each rule is compiled once into a
+    single regular expression (stop-words are one alternation, longest first) and
+    applied in one pass. Symbols are removed before the stop-words, so a stop-word split
+    by a removed symbol is still matched ('pa tients' with symbols = ' ').
+    Text joined by removing a stop-word isn't matched again ('mn=en' gives 'men'),
+    unlike the former chained `str.replace` calls.
+    """
+    def __init__(self, stop_words = (), symbols = None, whole_words = False):
+        """
+        Parameters
+        ----------
+        stop_words : iterable
+            Strings to remove
+        symbols : str
+            Regex character class of symbols to remove, removed before the stop-words default - None
+        whole_words : bool
+            Only remove stop-words which are whole space separated tokens default - False
+        """
+        self.patterns = []
+        if symbols is not None:
+            self.patterns.append(re.compile(symbols))
+
+        stop_words = sorted(set(stop_words), key = lambda word: (-len(word), word))
+        if stop_words:
+            alternation = '|'.join(re.escape(word) for word in stop_words)
+            if whole_words:
+                alternation = f'(?<![^ ])(?:{alternation})(?![^ ])'
+            self.patterns.append(re.compile(alternation))
+
+    def __call__(self, s):
+        """Normalizes one span"""
+        for pattern in self.patterns:
+            s = pattern.sub('', s)
+        return s
+
+    def normalize(self, spans):
+        """ Normalizes all the spans of a series at once
+
+        Parameters
+        ----------
+        spans : pandas.core.series.Series
+            Series of spans
+
+        Returns
+        -------
+        spans : pandas.core.series.Series
+            Normalized spans
+        """
+        for pattern in self.patterns:
+            spans = spans.str.replace(pattern, '', regex = True)
+        return spans
+
+
 class DataCleaning:
     """
     Class to extract numbers for evaluation
     """
-    def __init__(self, df, log = False):
+    def __init__(self, df, log = False, cache_size = 4096):
         """ Extracts annotations into a dataframe from Labelbox NER json Format
     
         Parameters
         ----------
-        df : pandas.core.frame.Dataframe
+        df : pandas.core.frame.Dataframe/AnnotationTable
             Dataframe output from the process_lbexport function
+        log : bool
+            Display edits default - False
+        cache_size : int
+            Number of parsed numbers kept in cache default - 4096
         
         """
         self.df = df
+        self.table = to_table(df)
         self.log = log
-        self.req_cols = self.df.columns.difference(['PMID','abstract', 'num_arms_in_study','group1','group2'])
+        self.req_cols = [feature for feature in self.table.features if feature not in ['group1', 'group2']]
         self.units = [
         "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
         "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
@@ -27,6 +162,78 @@ class DataCleaning:
 
         self.full_valid_vocab = set()
         self.full_valid_vocab.update(self.units + self.tens + self.scales + ['and','ieth','th','y'] + list(self.ordinal_words.keys()))
+
+        # Lookup tables for text2int - built once
+        self.numwords = {}
+        self.numwords['and'] = (1, 0)
+        for idx, word in enumerate(self.units): self.numwords[word] = (1, idx)
+        for idx, word in enumerate(self.tens):       self.numwords[word] = (1, idx * 10)
+        for idx, word in enumerate(self.scales): self.numwords[word] = (10 ** (idx * 3 or 2), 0)
+        self.ordinal_endings = [('ieth', 'y'), ('th', '')]
+
+        # Normalizers of each feature type, sample size one is built from the invalid vocabulary
+        self.normalizers = {
+            # Remove symbols except -,=
+            'n' : SpanNormalizer(['n=', 'patients', 'subjects', 'men', 'women'], symbols = r'[^,-=\w]'),
+            # Spaces are removed first so split words ('pa tients') are joined before the units
+            'n_response' : SpanNormalizer(['patients', 'subjects', 'men', 'women'], symbols = ' '),
+            'sample_size' : SpanNormalizer(),
+        }
+
+        # Parsed numbers are cached, see `cache_info` for hits/misses
+        self._parse_number = lru_cache(maxsize = cache_size)(self._parse_number_uncached)
+
+    def cache_info(self):
+        """ Hits/misses of the text2int cache
+
+        Returns
+        -------
+        cache_info : functools._CacheInfo
+            hits, misses, maxsize, currsize
+        """
+        return self._parse_number.cache_info()
+
+    def _parse_number_uncached(self, textnum):
+        """Returns the number written in words in `textnum` (lowercase), None if unable to convert"""
+        textnum = textnum.replace('-', ' ')
+        textnum = textnum.replace('‐', ' ')
+
+        current = result = 0
+        for word in textnum.split():
+            if word in self.ordinal_words:
+                scale, increment = (1, self.ordinal_words[word])
+            else:
+                for ending, replacement in self.ordinal_endings:
+                    if word.endswith(ending):
+                        word = "%s%s" % (word[:-len(ending)], replacement)
+                
+                if word not in self.numwords:
+                    return None
+                
+                scale, increment = self.numwords[word]
+
+            current = current * scale + increment
+            if scale > 100:
+                result += current
+                current = 0
+
+        return result + current
+
+    def valid_numbers(self, words):
+        """ Checks a batch of words, each distinct word is parsed once
+
+        Parameters
+        ----------
+        words : iterable
+            Words to check
+
+        Returns
+        -------
+        valid : set
+            Words (lowercase) which can be converted to numbers
+        """
+        words = {word.lower() for word in words}
+        return {word for word in words if self._parse_number(word) is not None}
     
     def text2int(self, textnum, raw_text, convert = False):
         """ Converts text to integer 
@@ -58,76 +265,67 @@ class DataCleaning:
             Returns True/False depending on able to convert or not
         """     
         cleaned_text = textnum
-        textnum = textnum.lower()
-
-        numwords = {}
-        numwords['and'] = (1, 0)
-        for idx, word in enumerate(self.units): numwords[word] = (1, idx)
-        for idx, word in enumerate(self.tens):       numwords[word] = (1, idx * 10)
-        for idx, word in enumerate(self. scales): numwords[word] = (10 ** (idx * 3 or 2), 0)
-        
-        ordinal_endings = [('ieth', 'y'), ('th', '')]
-
-        textnum = textnum.replace('-', ' ')
-        textnum = textnum.replace('‐', ' ')
-
-        current = result = 0
-        for word in textnum.split():
-            if word in self.ordinal_words:
-                scale, increment = (1, self.ordinal_words[word])
-            else:
-                for ending, replacement in ordinal_endings:
-                    if word.endswith(ending):
-                        word = "%s%s" % (word[:-len(ending)], replacement)
-                
-                if word not in numwords:
-                    return raw_text, False
-                
-                scale, increment = numwords[word]
-
-            current = current * scale + increment
-            if scale > 100:
-                result += current
-                current = 0
+        number = self._parse_number(textnum.lower())
+        if number is None:
+            return raw_text, False
         
         # Able to convert
         if convert:
-            return result + current, True
+            return number, True
         return cleaned_text, True
 
 
-    def build_vocab(self):
+    def collect_vocab(self):
         """
-        Builds a Invalid Vocabulary from Feature
+        Collects the words of the feature - total_sample_size
 
-        Currently only works for the feature - total_sample_size
+        Returns
+        -------
+        vocab : set
+            Words of the spans (without commas)
         """
         feature_name = 'total_sample_size'
         vocab = set()
-        for index in self.df.index:
-            feature = feature_name
-            if not isinstance(self.df[feature][index], float):
-                annot_list = json.loads(self.df[feature][index])
-                abstract = self.df['abstract'][index]
-                for annot in annot_list:
-                    start, end = annot
-                    s = abstract[start:end].split(' ')
-                    for word in s:
-                        vocab.add(word.replace(',', ''))
+        abstracts = self.table.docs['abstract'].tolist()
+        spans = self.table.spans[self.table.spans['feature'] == feature_name]
+        for doc_id, start, end in zip(spans['doc_id'].tolist(), spans['start'].tolist(), spans['end'].tolist()):
+            s = abstracts[doc_id][start:end].split(' ')
+            for word in s:
+                vocab.add(word.replace(',', ''))
+        return vocab
+
+    def build_vocab(self, vocab = None):
+        """
+        Builds a Invalid Vocabulary from Feature
+
+        Currently only works for the feature - total_sample_size
+
+        Parameters
+        ----------
+        vocab : set
+            Words collected with `collect_vocab` (can be merged over chunks of a dataset)
+            default - None, words of this dataframe
+        """
+        if vocab is None:
+            vocab = self.collect_vocab()
         
+        # Check the words & their hyphen separated parts in one batch
+        candidates = [i for i in vocab if not i.isnumeric()]
+        valid_words = self.valid_numbers(candidates + [s for i in candidates if '-' in i for s in i.split('-')])
+
         # Keep only invalid vocab
         invalid_vocab = set()
-        for i in vocab:
-            _, valid = self.text2int(i.lower(), i)
-            if not i.isnumeric() and not valid:
+        for i in candidates:
+            if i.lower() not in valid_words:
                 # Edge case
                 if '-' in i:
-                    if any(self.text2int(s.lower(),'')[1] for s in i.split('-')):
+                    if any(s.lower() in valid_words for s in i.split('-')):
                         continue
                 invalid_vocab.add(i)
         
         # Remove number vocabulary or substring
         self.invalid_vocab = {i for i in invalid_vocab if all(i.lower() not in v.lower() for v in self.full_valid_vocab)}
+        self.normalizers['sample_size'] = SpanNormalizer(self.invalid_vocab, whole_words = True)
 
     def clean_n(self, s, convert = False):
         """
@@ -150,14 +348,7 @@ class DataCleaning:
         
         """
         raw_text = s
-        # Remove symbols except -,=
-        s = re.sub(r'[^,-=\w]', '', s)
-        s = s.replace(' ','')
-        s = s.replace('n=','')
-        s = s.replace('patients','')
-        s = s.replace('subjects','')
-        s = s.replace('men','')
-        s = s.replace('women','')
+        s = self.normalizers['n'](s)
         if s.isnumeric():
             return s, True
         else:
@@ -184,12 +375,7 @@ class DataCleaning:
         
         """
         raw_text = s
-        # Remove symbols except -,=
-        s = s.replace(' ','')
-        s = s.replace('patients','')
-        s = s.replace('subjects','')
-        s = s.replace('men','')
-        s = s.replace('women','')
+        s = self.normalizers['n_response'](s)
         if s.isnumeric():
             return s, True
         else:
@@ -217,13 +403,8 @@ class DataCleaning:
         """
         raw_text = s
 
-        # Get tokens in annotation
-        tokens = s.split(' ')
-
-        # Replace perfect matches
-        for token in tokens:
-            if token in self.invalid_vocab:
-                s = s.replace(token, '')
+        # Replace perfect matches of the invalid vocabulary
+        s = self.normalizers['sample_size'](s)
         s = s.strip()
 
         if s.isnumeric():
@@ -251,7 +432,7 @@ class DataCleaning:
             able to extract or not
         
         """
-        all_numbers = re.findall('\d*[.·]?\d+', span)
+        all_numbers = NUMBER_PATTERN.findall(span)
         if all_numbers and len(all_numbers) <= 2:
             return all_numbers[0], True
         else:
@@ -286,53 +467,96 @@ class DataCleaning:
         new_index = new_relative_index[0] + start, new_relative_index[1] + start
         return new_index
 
+    def parse_spans(self, kind, spans):
+        """ Extracts the numbers from all the spans of a feature type at once
+
+        Parameters
+        ----------
+        kind : str
+            Feature type - n/n_response/sample_size/number
+        spans : pandas.core.series.Series
+            Series of spans (str)
+
+        Returns
+        -------
+        new_spans : pandas.core.series.Series
+            Extracted values, raw span/NaN if unable to parse
+        parsed : pandas.core.series.Series
+            Able to parse or not
+        update : pandas.core.series.Series
+            Span indexes should be moved to the extracted value or not
+        """
+        if kind == 'number':
+            # Same as get_number_from_span
+            all_numbers = spans.str.findall(NUMBER_PATTERN)
+            n_numbers = all_numbers.str.len()
+            parsed = (n_numbers > 0) & (n_numbers <= 2)
+            return all_numbers.str[0].where(parsed), parsed, parsed
+
+        cleaned = self.normalizers[kind].normalize(spans)
+        if kind == 'sample_size':
+            cleaned = cleaned.str.strip()
+        numeric = cleaned.str.isnumeric()
+        # Words are converted once per distinct value (cached)
+        converted = pd.Series([self._parse_number(s.lower()) is not None for s in cleaned.tolist()],
+                              index = cleaned.index)
+        parsed = numeric | converted
+        new_spans = cleaned.where(parsed, spans)
+        # Numeric sample sizes are kept as annotated (see clean_sample_size)
+        update = converted & ~numeric if kind == 'sample_size' else parsed
+        return new_spans, parsed, update
+
     def extract_all(self):
         """
         Extracts the numbers from spans and fixes the indexes
 
+        Spans are grouped by feature type, each group is cleaned at once.
+        The parse rates of every feature are kept in `parse_rates`.
+
         Returns
         -------
-        df : pandas.core.frame.Dataframe
-            cleaned dataframe for evaluation
+        df : pandas.core.frame.Dataframe/AnnotationTable
+            cleaned dataframe for evaluation (same format as given to the constructor)
         
         """
-        for index in self.df.index:
-            for feature in self.req_cols:
-                if not isinstance(self.df[feature][index], float):
-                    annot_list = json.loads(self.df[feature][index])
-                    abstract = self.df['abstract'][index]
-
-                    for i, annot in enumerate(annot_list):
-                        start, end = annot
-                        span = abstract[start:end]
-                        parsed = False
-                        if feature in ['g1_n', 'g2_n']:
-                            new_span, parsed = self.clean_n(span)
-                        elif feature in ['g1_n_response', 'g2_n_response']:
-                            new_span, parsed = self.clean_n_response(span)
-                        elif feature == 'total_sample_size':
-                            new_span, parsed = self.clean_sample_size(span)
-                        elif feature in self.df.columns.difference(['group1', 'group2','g1_n','g2_n','g1_n_response','g2_n_response', 'total_sample_size']):
-                            new_span, parsed = self.get_number_from_span(span)
-                        else:
-                            raise Exception(f'Invalid Column Found! {feature}')
-                        
-                        # If able to parse
-                        if parsed and len(span) - len(new_span):            
-                            new_start, new_end = self.get_new_span(start, end, span, new_span, feature)
-                            # See parsed old vs new
-                            if self.log:
-                                print([abstract[start:end], abstract[new_start:new_end]])
-                            start, end = new_start, new_end
-
-                        
-                        annot_list[i] = [start, end]
-
-                    self.df[feature][index] = json.dumps(annot_list)
-
+        abstracts = self.table.docs['abstract'].tolist()
+        spans = self.table.spans
+
+        feature = spans['feature'].astype(object)
+        kinds = feature.map(lambda f: FEATURE_KINDS.get(f, 'number')).where(feature.isin(self.req_cols))
+        texts = pd.Series([abstracts[doc_id][start:end] for doc_id, start, end in
+                           zip(spans['doc_id'].tolist(), spans['start'].tolist(), spans['end'].tolist())],
+                          index = spans.index, dtype = object)
+
+        new_texts = pd.Series(None, index = spans.index, dtype = object)
+        parsed = pd.Series(False, index = spans.index)
+        update = pd.Series(False, index = spans.index)
+        for kind, group in texts.groupby(kinds, sort = False):
+            new_texts[group.index], parsed[group.index], update[group.index] = self.parse_spans(kind, group)
+
+        # Only spans which changed are moved to the extracted value
+        update &= texts.str.len() != new_texts.str.len()
+        new_starts = spans['start'].to_numpy().copy()
+        new_ends = spans['end'].to_numpy().copy()
+        for i, old_span, new_span in zip(np.flatnonzero(update.to_numpy()), texts[update].tolist(), new_texts[update].tolist()):
+            offset = old_span.find(new_span)
+            # Cleaning removed characters inside the value (1 200 -> 1200)
+            if offset < 0:
+                continue
+            new_starts[i] += offset
+            new_ends[i] = new_starts[i] + len(new_span)
+            # See parsed old vs new
+            if self.log:
+                print([old_span, abstracts[spans['doc_id'].iat[i]][new_starts[i]:new_ends[i]]])
+
+        counts = pd.DataFrame({'feature' : feature, 'parsed' : parsed})[kinds.notna()]
+        self.parse_rates = counts.groupby('feature', sort = False)['parsed'].agg(spans = 'size', parsed = 'sum')
+        self.parse_rates['parse_rate'] = self.parse_rates['parsed'] / self.parse_rates['spans']
+        if self.log:
+            print(self.parse_rates)
+
+        self.table = self.table.with_spans(spans.assign(start = new_starts, end = new_ends))
+        if isinstance(self.df, AnnotationTable):
+            return self.table
+        self.df = self.table.to_wide()
         return self.df
-
-                
-
-
-
@@ -14,4 +14,7 @@ setup(
         "numpy>=1.18.5",
         "pandas>=1.1.5",
     ],
+    extras_require={
+        "fast-json": ["orjson>=3.5"],
+    },
 )
@@ -0,0 +1,105 @@
+import argparse
+import gc
+import json
+import logging
+import random
+import time
+
+import pandas as pd
+
+from lbutils import json_backend
+from src.data_utils import labelbox, labelbox_spans
+from src.data_utils.ner import get_entities
+
+ENTITIES = [
+    "group1",
+    "group2",
+    "g1_n",
+    "g2_n",
+    "total_sample_size",
+    "OS_HR",
+    "response_p",
+]
+
+
+def synthetic_export(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Labelbox CSV export with `n_rows` abstracts - some without label, without annotations or duplicated"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        pmid = rng.randrange(n_rows) if rng.random() < 0.05 else n_rows + i
+        text = f"PMID: {pmid}  TITLE. " + " ".join(
+            rng.choice(["patients", "were", "randomized", "12", "arms"])
+            for _ in range(200)
+        )
+        draw = rng.random()
+        if draw < 0.03:
+            label = {}
+        elif draw < 0.06:
+            label = {"objects": []}
+        else:
+            objects = []
+            for _ in range(rng.randrange(1, 15)):
+                start = rng.randrange(len(text) - 20)
+                objects.append(
+                    {
+                        "value": rng.choice(ENTITIES),
+                        "data": {
+                            "location": {
+                                "start": start,
+                                "end": start + rng.randrange(1, 20),
+                            }
+                        },
+                    }
+                )
+            label = {"objects": objects}
+        rows.append({"Labeled Data": text, "Label": json.dumps(label)})
+    return pd.DataFrame(rows)
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark labelbox preprocessing - label parsing, span table and per-document lists"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=100000, help="Rows of the synthetic export"
+    )
+    parser.add_argument("--dedup", action="store_true", help="Drop PMID duplicates")
+    return parser
+
+
+def _timed(func, *args, **kwargs):
+    """Result and run time of a call - the garbage collector is paused like in `labelbox_spans`"""
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+if __name__ == "__main__":
+    args = setup_parser().parse_args()
+    logging.getLogger("src.data_utils").setLevel(logging.WARNING)
+    df = synthetic_export(args.rows)
+
+    # parsing every label is a lower bound of both functions
+    labels = "[" + ",".join(df["Label"]) + "]"
+    timings = {}
+    _, timings["parse"] = _timed(json_backend.loads, labels)
+    (docs, spans), timings["spans"] = _timed(labelbox_spans, df, dedup=args.dedup)
+    result, timings["lists"] = _timed(labelbox, df, dedup=args.dedup)
+    print(f"json parsing ({json_backend.get_backend()}): {timings['parse']:.2f}s")
+    print(f"labelbox_spans: {timings['spans']:.2f}s ({len(spans)} spans)")
+    print(f"labelbox: {timings['lists']:.2f}s ({len(result)} abstracts)")
+
+    if not args.dedup:
+        # same annotations as parsing the labels one by one
+        expected = [
+            [(start, stop + 1, entity) for start, stop, entity in annotations]
+            for annotations in map(get_entities, df["Label"])
+            if annotations
+        ]
+        assert result["annotations"].tolist() == expected
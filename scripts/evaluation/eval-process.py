@@ -1,7 +1,12 @@
 import argparse
+import io
 import re
-from lbutils.model_utils import process_jsonl
-from lbutils.data_utils import to_jsonl, fix_annots
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from lbutils.model_utils import iter_jsonl_chunks, process_jsonl_lines
+from lbutils.data_utils import to_jsonl_lines, fix_annots
+from lbutils.utils import DataCleaning
 
 def setup_parser():
     parser = argparse.ArgumentParser(description = 'Extract numerical entities')
@@ -11,10 +16,50 @@ def setup_parser():
     parser.add_argument('out_file', type = str
                         , help = 'Filepath to write output file')
     parser.add_argument('--verbose', '-v', action='store_true', help = 'Display edits')
+    parser.add_argument('--workers', '-w', type = int, default = 1
+                        , help = 'Number of processes cleaning chunks')
+    parser.add_argument('--chunk-size', type = int, default = 10000
+                        , help = 'Number of predictions per chunk')
 
     return parser
 
 
+def chunk_vocab(lines):
+    """Words of the total_sample_size spans of a chunk"""
+    table = fix_annots(process_jsonl_lines(lines, as_table = True))
+    return DataCleaning(table).collect_vocab()
+
+
+def clean_chunk(lines, vocab, log):
+    """Extracts numbers from a chunk, returns the output lines & the edits displayed"""
+    table = process_jsonl_lines(lines, as_table = True)
+    # Edits are returned, prints of the workers would interleave
+    with redirect_stdout(io.StringIO()) as edits:
+        table = fix_annots(table, val = True, log = log, vocab = vocab)
+    return list(to_jsonl_lines(table)), edits.getvalue()
+
+
+def map_ordered(func, chunks, workers, *args):
+    """
+    Applies `func` to every chunk, results are yielded in input order
+
+    At most 2 chunks per worker are in flight, so memory does not depend on the file size
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(chunk, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 if __name__ == '__main__':
 
     parser = setup_parser()
@@ -23,20 +68,18 @@ if __name__ == '__main__':
     model_output_file = args.pred_file
     cleaned_output_file = re.sub(r'.json|.jsonl','', args.out_file)
 
-    # Parse model output to dataframe
-    df_pred = process_jsonl(model_output_file)
+    # Invalid vocabulary of total_sample_size is built from the whole file - first pass
+    vocab = set()
+    for words in map_ordered(chunk_vocab, iter_jsonl_chunks(model_output_file, args.chunk_size), args.workers):
+        vocab.update(words)
 
     verbose = args.verbose
 
     if verbose:
         print('Before ------- After')
-    # Extract numbers
-    df_pred = fix_annots(df_pred, val = True, log = args.verbose)
-
-    to_jsonl(df_pred, cleaned_output_file)
-
-
-
-    
-
-
+    # Extract numbers chunk by chunk - second pass
+    with open(cleaned_output_file + '.json', 'w', encoding='utf-8') as f:
+        for lines, edits in map_ordered(clean_chunk, iter_jsonl_chunks(model_output_file, args.chunk_size),
+                                        args.workers, vocab, verbose):
+            f.writelines(lines)
+            print(edits, end = '')
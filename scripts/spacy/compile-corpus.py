@@ -0,0 +1,35 @@
+import argparse
+
+import pandas as pd
+
+from src.data_utils import labelbox
+from src.data_utils.corpus import compile_corpus
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(
+        description="Compile a Labelbox CSV export into sharded .spacy files",
+        epilog="Train on the shards with: python -m spacy train scripts/spacy/ner_pipe.cfg "
+        "--paths.train <output_dir> --paths.dev <dev_dir>",
+    )
+    parser.add_argument("csv_file", type=str, help="Labelbox export in csv format")
+    parser.add_argument("output_dir", type=str, help="Directory of the .spacy shards")
+    parser.add_argument(
+        "--shard-size", type=int, default=1000, help="Documents per shard"
+    )
+    parser.add_argument(
+        "--n-process", type=int, default=1, help="Processes used for tokenizing"
+    )
+    parser.add_argument(
+        "--rm-groups", action="store_true", help="Remove the group information"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = setup_parser().parse_args()
+    df = labelbox(pd.read_csv(args.csv_file), rm_groups=args.rm_groups, dedup=True)
+    stats = compile_corpus(
+        df, args.output_dir, shard_size=args.shard_size, n_process=args.n_process
+    )
+    print(stats)
@@ -12,5 +12,8 @@ setuptools.setup(
         "spacy==3.0.1",
         "spacy-alignments==0.7.2",
         "spacy-legacy==3.0.1",
+        # src.data_utils helpers - not on PyPI, install ./lbutils first (see requirements.txt)
+        "lbutils",
     ],
+    extras_require={"fast-json": ["orjson>=3.5"]},
 )
@@ -1,10 +1,15 @@
+import gc
 import logging
 import sys
-from typing import Any, Iterable, List, Tuple
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, List, Tuple
 
+import numpy as np
 import pandas as pd
 
-from src.data_utils.ner import get_entities, rm_groups
+from lbutils import json_backend
+from src.data_utils.ner import get_entities, rm_groups  # re-exported
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -16,76 +21,197 @@ Annotations = List[Tuple[int, int, str]]
 def batch_data(
     iterable: Iterable[Any], batch_size: int = 64, compounding: int = 1
 ) -> Iterable[List[Any]]:
-    """Batch data - allow for increasing batch sizes"""
+    """Batch data - allow for increasing batch sizes.
+    Sequences are sliced, other iterables (ex: generators) are batched into lists.
+    For token budgets and length bucketing see `src.data_utils.batching`."""
     assert (
         compounding >= 1
     ), "Compounding must be equal to or greater than 1 (always increasing)"
     b = batch_size
-    iter_length = len(iterable)
-    for ndx in range(0, iter_length, batch_size):
-        batch = iterable[ndx : min(ndx + round(b), iter_length)]
-        b *= compounding
-        yield batch
-
-
-def labelbox(
+    if hasattr(iterable, "__len__") and hasattr(iterable, "__getitem__"):
+        iter_length = len(iterable)
+        ndx = 0
+        while ndx < iter_length:
+            # step by the current batch size so that batches don't overlap
+            size = round(b)
+            yield iterable[ndx : min(ndx + size, iter_length)]
+            ndx += size
+            b *= compounding
+    else:
+        iterator = iter(iterable)
+        while True:
+            batch = list(islice(iterator, round(b)))
+            if not batch:
+                return
+            yield batch
+            b *= compounding
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Pause the garbage collector (if enabled) for bulk allocations."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _label_columns(label: dict) -> Tuple[int, List[str], List[int], List[int]]:
+    """Number of objects (-1 for an empty label), entities, starts and ends of a parsed label."""
+    if not label:
+        return -1, [], [], []
+    objects = label["objects"]
+    return (
+        len(objects),
+        [el["value"] for el in objects],
+        [el["data"]["location"]["start"] for el in objects],
+        [el["data"]["location"]["end"] for el in objects],
+    )
+
+
+def labelbox_spans(
     df: pd.DataFrame,
     increment_end_span: bool = True,
     rm_groups: bool = False,
     dedup: bool = False,
-) -> pd.DataFrame:
-    """Process the CSV from labelbox and return relevant info.
-    Dataframe must contain columns"""
-
-    def _get_info(df: pd.DataFrame) -> pd.DataFrame:
-        """Process data - get the annotations and the PMID"""
-        _df = df.copy()
-        _df["annotations"] = _df["Label"].apply(get_entities)
-        _df["pmid"] = _df["Labeled Data"].str.extract(r"PMID: (\d+)  TITLE.")
-        _df["text"] = _df["Labeled Data"]
-        return _df[["pmid", "annotations", "text", "Label", "Labeled Data"]]
-
-    def _clean(df: pd.DataFrame, dedup: bool) -> pd.DataFrame:
-        """Drop empty annotations and duplicates"""
-        _df = df.copy()
-        is_invalid = _df["annotations"].apply(
-            lambda x: len(x) < 1 if isinstance(x, list) else False
-        )
-        is_duplicated = _df["pmid"].duplicated()
-        _df = _df.dropna(subset=["annotations"])
-        _df = _df[_df.annotations.apply(len) > 0]
-
-        if dedup:
-            _df = _df.drop_duplicates(subset=["pmid"])
-
-        if is_invalid.sum() > 0 or is_duplicated.sum() > 0:
-            logger.info("Some examples were removed:")
-            logger.info(f"Found {is_invalid.sum()} examples with no annotations.")
-            logger.info(f"Found {is_duplicated.sum()} PMID duplicates.")
-        return _df
-
-    data = df[["Labeled Data", "Label"]].copy()
-    data = data.reset_index(drop=True)
-
+    n_process: int = 1,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Process the CSV from labelbox into a document table and a long-format span table.
+    All the labels are parsed at once (see `lbutils.json_backend`), group removal and
+    the end span increment are column operations.
+    :param df: Labelbox export with the columns `Labeled Data` and `Label`
+    :param increment_end_span: Increment ending span by one (to account for labelbox tagging)
+    :param rm_groups: Remove the group information (see `src.data_utils.ner.rm_groups`)
+    :param dedup: Keep only the first document of every PMID
+    :param n_process: Number of processes parsing the labels
+    :return: Documents (pmid, text, Label, Labeled Data) & spans (doc_id, start, stop, entity),
+        `doc_id` is the row of the document
+    """
     logger.info("Parse annotations and extract features")
-    data = _get_info(df=data)
+    labels = df["Label"].tolist()
+    # the parsed labels are acyclic - no need for the garbage collector to scan them while parsing
+    with _gc_paused():
+        if n_process > 1:
+            columns = json_backend.loads_many(
+                labels, n_process=n_process, transform=_label_columns
+            )
+            n_objects = [n for n, _, _, _ in columns]
+            values, starts, stops = (
+                list(chain.from_iterable(column[i] for column in columns))
+                for i in range(1, 4)
+            )
+            del columns
+        else:
+            # objects of all the labels in one list - no per-label lists to concatenate
+            objects = [
+                label["objects"] if label else None
+                for label in json_backend.loads("[" + ",".join(labels) + "]")
+            ]
+            n_objects = [-1 if obj is None else len(obj) for obj in objects]
+            objects = list(chain.from_iterable(obj for obj in objects if obj))
+            values = [el["value"] for el in objects]
+            starts = [el["data"]["location"]["start"] for el in objects]
+            stops = [el["data"]["location"]["end"] for el in objects]
+            del objects
+    n_objects = np.array(n_objects)
+    entities = pd.Categorical(values)
+    pmids = df["Labeled Data"].str.extract(r"PMID: (\d+)  TITLE.", expand=False)
 
     logger.info("Clean data")
-    data = _clean(df=data, dedup=dedup)
+    n_invalid = int((n_objects == 0).sum())
+    n_duplicated = int(pmids.duplicated().sum())
+    is_kept = n_objects > 0
+    if dedup:
+        is_kept &= ~(pmids.where(is_kept).duplicated() & pmids.notna()).to_numpy()
+    if n_invalid > 0 or n_duplicated > 0:
+        logger.info("Some examples were removed:")
+        logger.info(f"Found {n_invalid} examples with no annotations.")
+        logger.info(f"Found {n_duplicated} PMID duplicates.")
+
+    # documents of the kept rows, renumbered
+    doc_ids = np.cumsum(is_kept) - 1
+    span_docs = np.repeat(doc_ids, np.maximum(n_objects, 0))
+    span_kept = np.repeat(is_kept, np.maximum(n_objects, 0))
+    spans = pd.DataFrame(
+        {
+            "doc_id": span_docs,
+            "start": np.array(starts, dtype=np.int64),
+            "stop": np.array(stops, dtype=np.int64),
+            "entity": entities,
+        }
+    )[span_kept]
 
     if rm_groups:
         logger.info("Remove group information")
-        data["annotations"] = data["annotations"].apply(rm_groups)
+        # only the distinct labels go through the string operations
+        categories = (
+            spans["entity"]
+            .cat.categories.to_series()
+            .str.replace(r"^g[12]_", "", regex=True)
+            .str.replace(r"^group[12]$", "group", regex=True)
+        )
+        spans["entity"] = pd.Categorical(
+            categories.to_numpy()[spans["entity"].cat.codes]
+        )
+        spans = spans.drop_duplicates()
 
     if increment_end_span:
         logger.info("Increment ending span by one (to account for labelbox tagging)")
-        data["annotations"] = data["annotations"].apply(
-            lambda l: [(start, stop + 1, entity) for start, stop, entity in l]
-        )
-
-    assert data.notna().values.all(), "There are Null values"
+        spans["stop"] += 1
+
+    # boolean masks of the columns keep their dtype (no conversion of the texts to objects)
+    texts = df["Labeled Data"][is_kept].reset_index(drop=True)
+    docs = pd.DataFrame(
+        {
+            "pmid": pmids[is_kept].reset_index(drop=True),
+            "text": texts,
+            "Label": df["Label"][is_kept].reset_index(drop=True),
+            "Labeled Data": texts,
+        }
+    )
+    assert docs.notna().values.all(), "There are Null values"
     if dedup:
-        assert not data.pmid.duplicated().any(), "There are duplicates"
+        assert not docs.pmid.duplicated().any(), "There are duplicates"
+    return docs, spans.reset_index(drop=True)
 
-    data = data.reset_index(drop=True)
-    return data
+
+def labelbox(
+    df: pd.DataFrame,
+    increment_end_span: bool = True,
+    rm_groups: bool = False,
+    dedup: bool = False,
+    n_process: int = 1,
+) -> pd.DataFrame:
+    """Process the CSV from labelbox and return relevant info.
+    Dataframe must contain columns `Labeled Data` and `Label` (see `labelbox_spans`).
+    Building the per-document (start, stop, entity) lists is a Python loop over all the spans,
+    use the span table of `labelbox_spans` when the lists are not needed."""
+    docs, spans = labelbox_spans(
+        df,
+        increment_end_span=increment_end_span,
+        rm_groups=rm_groups,
+        dedup=dedup,
+        n_process=n_process,
+    )
+    # spans are ordered by document - slice the (start, stop, entity) tuples per document
+    bounds = np.searchsorted(spans["doc_id"].to_numpy(), np.arange(len(docs) + 1))
+    with _gc_paused():
+        tuples = list(
+            zip(
+                spans["start"].tolist(),
+                spans["stop"].tolist(),
+                # labels of the codes - faster than listing the categorical
+                spans["entity"]
+                .cat.categories.to_numpy(dtype=object)[spans["entity"].cat.codes]
+                .tolist(),
+            )
+        )
+        annotations = [
+            tuples[a:b] for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+        ]
+    docs.insert(1, "annotations", annotations)
+    return docs
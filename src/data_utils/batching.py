@@ -0,0 +1,152 @@
+import random
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Sequence
+
+
+def shuffle_buffer(
+    iterable: Iterable[Any], buffer_size: int = 1000, seed: int = None
+) -> Iterator[Any]:
+    """
+    Approximately shuffle any iterable while keeping at most `buffer_size` items in memory.
+    Each incoming item replaces a random item of the buffer, which is yielded.
+    :param iterable: Items (ex: a generator)
+    :param buffer_size: Number of items kept in the buffer
+    :param seed: Random seed
+    :return: Generator of shuffled items
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for item in iterable:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _batch_cost(n_items: int, max_length: int, total_length: int, padded: bool) -> int:
+    """Tokens of a batch - padded to the longest item or not."""
+    return n_items * max_length if padded else total_length
+
+
+def _split_by_tokens(
+    items: Sequence[Any],
+    lengths: Sequence[int],
+    max_tokens: int,
+    padded: bool,
+    discard_oversize: bool,
+) -> Iterator[List[Any]]:
+    """Split items (in order) into consecutive batches within the token budget."""
+    batch, max_length, total_length = [], 0, 0
+    for item, length in zip(items, lengths):
+        if length > max_tokens:
+            # an item over the budget can't share a batch
+            if not discard_oversize:
+                yield [item]
+            continue
+        cost = _batch_cost(
+            len(batch) + 1, max(max_length, length), total_length + length, padded
+        )
+        if batch and cost > max_tokens:
+            yield batch
+            batch, max_length, total_length = [], 0, 0
+        batch.append(item)
+        max_length = max(max_length, length)
+        total_length += length
+    if batch:
+        yield batch
+
+
+def batch_by_tokens(
+    iterable: Iterable[Any],
+    max_tokens: int = 4096,
+    get_length: Callable[[Any], int] = len,
+    padded: bool = True,
+    buffer_size: int = 1000,
+    discard_oversize: bool = False,
+    shuffle: bool = True,
+    seed: int = None,
+) -> Iterator[List[Any]]:
+    """
+    Batch items of similar lengths under a token budget.
+    Items are read `buffer_size` at a time, each buffer is sorted by length and cut into batches
+    whose cost (longest item x batch size if padded, sum of lengths otherwise) stays within `max_tokens`.
+    :param iterable: Items (ex: Docs, Examples or token lists) - any iterable
+    :param max_tokens: Token budget of a batch
+    :param get_length: Number of tokens of an item
+    :param padded: Count the padding (transformers) or only the tokens
+    :param buffer_size: Number of items sorted together
+    :param discard_oversize: Drop items longer than the budget (otherwise yielded alone)
+    :param shuffle: Shuffle the batches of every buffer
+    :param seed: Random seed
+    :return: Generator of batches (lists of items)
+    """
+    rng = random.Random(seed)
+    iterator = iter(iterable)
+    while True:
+        buffer = list(islice(iterator, buffer_size))
+        if not buffer:
+            return
+        lengths = [get_length(item) for item in buffer]
+        order = sorted(range(len(buffer)), key=lengths.__getitem__)
+        batches = list(
+            _split_by_tokens(
+                [buffer[i] for i in order],
+                [lengths[i] for i in order],
+                max_tokens=max_tokens,
+                padded=padded,
+                discard_oversize=discard_oversize,
+            )
+        )
+        if shuffle:
+            rng.shuffle(batches)
+        yield from batches
+
+
+def bucket_by_length(
+    iterable: Iterable[Any],
+    boundaries: Sequence[int],
+    max_tokens: int = 4096,
+    get_length: Callable[[Any], int] = len,
+    padded: bool = True,
+    discard_oversize: bool = False,
+) -> Iterator[List[Any]]:
+    """
+    Batch items of similar lengths under a token budget, without sorting.
+    Every item goes to the bucket of its length (`boundaries` are the upper bounds, the last bucket
+    is unbounded), a bucket is yielded once the next item would exceed the budget.
+    Memory is bounded by the number of buckets times the budget.
+    :param iterable: Items - any iterable
+    :param boundaries: Sorted upper bounds (inclusive) of the bucket lengths
+    :param max_tokens: Token budget of a batch
+    :param get_length: Number of tokens of an item
+    :param padded: Count the padding (transformers) or only the tokens
+    :param discard_oversize: Drop items longer than the budget (otherwise yielded alone)
+    :return: Generator of batches (lists of items)
+    """
+    boundaries = list(boundaries)
+    # items, longest item & total length of every bucket
+    buckets = [[[], 0, 0] for _ in range(len(boundaries) + 1)]
+    for item in iterable:
+        length = get_length(item)
+        if length > max_tokens:
+            if not discard_oversize:
+                yield [item]
+            continue
+        bucket = buckets[bisect_left(boundaries, length)]
+        items, max_length, total_length = bucket
+        cost = _batch_cost(
+            len(items) + 1, max(max_length, length), total_length + length, padded
+        )
+        if items and cost > max_tokens:
+            yield items
+            items, max_length, total_length = [], 0, 0
+        items.append(item)
+        bucket[:] = [items, max(max_length, length), total_length + length]
+    for items, _, _ in buckets:
+        if items:
+            yield items
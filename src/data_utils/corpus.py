@@ -0,0 +1,275 @@
+import hashlib
+import json
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import pandas as pd
+import spacy
+from spacy.language import Language
+from spacy.tokens import DocBin
+from spacy.training import Example
+
+from lbutils import json_backend
+from src.data_utils.ner import Annotations, TaggedCorpus, iter_examples
+from src.data_utils.tokenizer import (
+    DEFAULT_CONFIG,
+    INFIXES,
+    TokenizerConfig,
+    get_blank_nlp,
+    get_tokenizer,
+)
+
+MANIFEST = "manifest.json"
+
+
+def iter_table(
+    path: Union[str, Path],
+    text_col: str = "text",
+    annotations_col: str = "annotations",
+    chunksize: int = 10000,
+) -> Iterator[Tuple[str, Annotations]]:
+    """
+    Stream (text, annotations) rows from an annotation table (ex: output of `src.data_utils.labelbox`).
+    JSON lines and CSV files are read in chunks, pickled dataframes are loaded at once.
+    :param path: .jsonl/.csv/.pkl file, annotations stored as [(start, stop, entity), ...] (JSON string in CSV)
+    :param text_col: Column with the input texts
+    :param annotations_col: Column with the annotations
+    :param chunksize: Number of rows read at once (CSV)
+    :return: Generator of (text, annotations)
+    """
+    path = Path(path)
+    if path.suffix in (".jsonl", ".json"):
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json_backend.loads(line)
+                    yield row[text_col], _to_annotations(row[annotations_col])
+    elif path.suffix == ".csv":
+        for chunk in pd.read_csv(
+            path, usecols=[text_col, annotations_col], chunksize=chunksize
+        ):
+            for text, annotations in zip(chunk[text_col], chunk[annotations_col]):
+                yield text, _to_annotations(json_backend.loads(annotations))
+    elif path.suffix in (".pkl", ".pickle"):
+        df = pd.read_pickle(path)
+        for text, annotations in zip(df[text_col], df[annotations_col]):
+            yield text, _to_annotations(annotations)
+    else:
+        raise ValueError(f"Unsupported table format: {path.suffix}")
+
+
+def _to_annotations(annotations) -> Annotations:
+    """Annotations as (start, stop, entity) tuples."""
+    return [(int(start), int(stop), entity) for start, stop, entity in annotations]
+
+
+class TableCorpus:
+    """
+    Lazy spaCy corpus reading an annotation table - no `.spacy` file needed.
+    Each call (one per epoch) streams the table again and yields Examples batch by batch.
+    Annotations are put on documents tokenized with the shared tokenizer (like `compile_corpus`)
+    so spans inside tokens split by the extra infix rules (ex: "n=20") are kept whatever the
+    tokenizer of the trained pipeline.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        text_col: str = "text",
+        annotations_col: str = "annotations",
+        batch_size: int = 1000,
+        limit: int = 0,
+        max_length: int = 0,
+        tokenizer_config: TokenizerConfig = DEFAULT_CONFIG,
+    ) -> None:
+        """
+        :param path: Annotation table (see `iter_table`)
+        :param text_col: Column with the input texts
+        :param annotations_col: Column with the annotations
+        :param batch_size: Number of texts tokenized per batch
+        :param limit: Maximum number of examples (0 for no limit)
+        :param max_length: Skip examples longer than this number of tokens (0 for no limit)
+        :param tokenizer_config: Tokenizer configuration of the annotated documents
+        """
+        self.path = path
+        self.text_col = text_col
+        self.annotations_col = annotations_col
+        self.batch_size = batch_size
+        self.limit = limit
+        self.max_length = max_length
+        self.tokenizer_config = tokenizer_config
+
+    def __call__(self, nlp: Language) -> Iterator[Example]:
+        rows = iter_table(
+            self.path, text_col=self.text_col, annotations_col=self.annotations_col
+        )
+        examples = iter_examples(
+            rows,
+            nlp=nlp,
+            batch_size=self.batch_size,
+            tokenizer=get_tokenizer(self.tokenizer_config),
+        )
+        if self.max_length:
+            examples = (eg for eg in examples if len(eg.predicted) <= self.max_length)
+        if self.limit:
+            examples = islice(examples, self.limit)
+        return examples
+
+
+@spacy.registry.readers("src.TableCorpus.v1")
+def create_table_corpus(
+    path: str,
+    text_col: str = "text",
+    annotations_col: str = "annotations",
+    batch_size: int = 1000,
+    limit: int = 0,
+    max_length: int = 0,
+    infixes: List[str] = list(INFIXES),
+) -> Callable[[Language], Iterator[Example]]:
+    """
+    Corpus reader for training configs, ex:
+        [corpora.train]
+        @readers = "src.TableCorpus.v1"
+        path = ${paths.train}
+    Train on annotation tables with
+    `python -m spacy train scripts/spacy/ner_pipe_table.cfg --code src/data_utils/corpus.py`.
+    `infixes` are the extra infix rules of the tokenizer of the annotated documents.
+    """
+    return TableCorpus(
+        path,
+        text_col=text_col,
+        annotations_col=annotations_col,
+        batch_size=batch_size,
+        limit=limit,
+        max_length=max_length,
+        tokenizer_config=TokenizerConfig(infixes=tuple(infixes)),
+    )
+
+
+def content_hash(
+    text: str,
+    annotations: Iterable[Tuple[int, int, str]],
+    tokenizer_config: TokenizerConfig = DEFAULT_CONFIG,
+) -> str:
+    """
+    Hash of everything a compiled document depends on - text, annotations and tokenizer rules.
+    :param text: Input text
+    :param annotations: Annotations [(start, stop, entity), ...] (order doesn't matter)
+    :param tokenizer_config: Tokenizer configuration
+    :return: Hex digest
+    """
+    payload = [
+        text,
+        sorted(
+            [int(start), int(stop), str(entity)] for start, stop, entity in annotations
+        ),
+        [tokenizer_config.lang, list(tokenizer_config.infixes)],
+    ]
+    return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+def _read_manifest(output_dir: Path) -> Dict[str, List[str]]:
+    """Document hashes of every shard of a compiled corpus (empty if not compiled yet)."""
+    path = output_dir / MANIFEST
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)["shards"]
+
+
+def compile_corpus(
+    df: pd.DataFrame,
+    output_dir: Union[str, Path],
+    text_col: str = "text",
+    annotations_col: str = "annotations",
+    tokenizer_config: TokenizerConfig = DEFAULT_CONFIG,
+    shard_size: int = 1000,
+    batch_size: int = 1000,
+    n_process: int = 1,
+) -> Dict[str, int]:
+    """
+    Compile an annotation table (ex: output of `src.data_utils.labelbox`) into sharded `.spacy` files.
+    A manifest keeps the content hash of every document of every shard, on rebuild:
+    - shards whose documents are all still in the table are kept as is
+    - valid documents of the other shards are copied from their shard (no re-tokenizing)
+    - only new or changed documents go through TaggedCorpus
+    The output directory is read with `spacy.Corpus.v1` (`paths.train`/`paths.dev` of
+    scripts/spacy/ner_pipe.cfg).
+    Documents are deduplicated, their order across shards is not kept.
+    :param df: Dataframe with the texts and annotations
+    :param output_dir: Directory of the shards and manifest
+    :param text_col: Column with the input texts
+    :param annotations_col: Column with the annotations [(start, stop, entity), ...]
+    :param tokenizer_config: Tokenizer configuration
+    :param shard_size: Maximum number of documents per shard
+    :param batch_size: Number of texts tokenized per batch
+    :param n_process: Number of processes used for tokenizing
+    :return: Number of documents, tokenized documents, reused documents, removed documents and shards
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    vocab = get_blank_nlp(tokenizer_config).vocab
+
+    # position of the first row of every document
+    wanted = {}
+    for i, (text, annotations) in enumerate(zip(df[text_col], df[annotations_col])):
+        wanted.setdefault(content_hash(text, annotations, tokenizer_config), i)
+
+    shards, kept, pending = {}, set(), []
+    n_compiled = 0
+    for name, shard_hashes in _read_manifest(output_dir).items():
+        path = output_dir / name
+        if not path.exists():
+            continue
+        n_compiled += len(shard_hashes)
+        if all(h in wanted and h not in kept for h in shard_hashes):
+            shards[name] = shard_hashes
+            kept.update(shard_hashes)
+            continue
+        # partially stale shard - copy its valid documents to the new shards
+        valid = [h in wanted and h not in kept for h in shard_hashes]
+        if any(valid):
+            docs = DocBin().from_disk(path).get_docs(vocab)
+            for h, doc, is_valid in zip(shard_hashes, docs, valid):
+                if is_valid:
+                    pending.append((h, doc))
+                    kept.add(h)
+    n_reused = len(kept)
+
+    new_hashes = [h for h in wanted if h not in kept]
+    new_rows = df.iloc[[wanted[h] for h in new_hashes]]
+    corpora = TaggedCorpus.from_dataframe(
+        new_rows,
+        text_col=text_col,
+        annotations_col=annotations_col,
+        tokenizer_config=tokenizer_config,
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+    pending.extend((h, corpus.to_doc()) for h, corpus in zip(new_hashes, corpora))
+
+    for start in range(0, len(pending), shard_size):
+        shard = pending[start : start + shard_size]
+        shard_hashes = [h for h, _ in shard]
+        digest = hashlib.sha256("".join(shard_hashes).encode("utf-8")).hexdigest()
+        name = f"shard-{digest[:16]}.spacy"
+        DocBin(docs=[doc for _, doc in shard]).to_disk(output_dir / name)
+        shards[name] = shard_hashes
+
+    # switch to the new manifest, then drop the shards it doesn't list (stale or left by an interrupted build)
+    tmp_path = output_dir / f"{MANIFEST}.tmp"
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump({"tokenizer": tokenizer_config._asdict(), "shards": shards}, f)
+    tmp_path.replace(output_dir / MANIFEST)
+    for path in output_dir.glob("*.spacy"):
+        if path.name not in shards:
+            path.unlink()
+
+    return {
+        "documents": len(wanted),
+        "tokenized": len(new_hashes),
+        "reused": n_reused,
+        "removed": n_compiled - n_reused,
+        "shards": len(shards),
+    }
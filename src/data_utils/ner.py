@@ -1,17 +1,28 @@
-import json
 import warnings
-from itertools import combinations, groupby
-from typing import Dict, Iterable, List, Tuple
+from itertools import groupby, islice, zip_longest
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
+import pandas as pd
 import spacy
 from spacy.language import Language
 from spacy.tokens import Doc
 from spacy.training import Example
 
+from lbutils import json_backend
+from lbutils.utils import resolve_overlaps
+from src.data_utils.tokenizer import (
+    DEFAULT_CONFIG,
+    TokenizerConfig,
+    get_blank_nlp,
+    get_tokenizer,
+)
+
 Annotations = List[Tuple[int, int, str]]
 AnnotationsDict = Dict[str, Iterable[int]]
 
+_SCHEME_PREFIXES = {"IOB": ("B", "I"), "BILUO": ("B", "I", "L", "U")}
+
 
 class TaggedCorpus:
     def __init__(
@@ -19,26 +30,51 @@ class TaggedCorpus:
         text: str,
         annotations: Annotations,
         tokenizer: spacy.tokenizer.Tokenizer = None,
+        doc: Doc = None,
     ) -> None:
         self.text = text
         self.annotations = annotations
-        if tokenizer is None:
-            nlp = spacy.blank("en")
-            # add more rules for tokenizing
-            infixes = nlp.Defaults.infixes + [r"[-/=)(><]"]
-            infix_regex = spacy.util.compile_infix_regex(infixes)
-            nlp.tokenizer.infix_finditer = infix_regex.finditer
-            self.tokenizer = nlp.tokenizer
-        else:
-            self.tokenizer = tokenizer
+        self.tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+        # tokenize once - every export method reuses this document
+        self.doc = self.tokenizer(text) if doc is None else doc
+        assert self.doc.text == text, "Document text doesn't match input text."
         # additional properties
-        self.arr_char_spans, self.tokens = self._get_char_spans_and_tokens(
-            text=text, tokenizer=self.tokenizer
-        )
+        self.arr_char_spans, self.tokens = self._get_char_spans_and_tokens(doc=self.doc)
         self.aligned_annotations_dict = self._align_span_dict(
-            annotations=annotations, text=text, tokenizer=self.tokenizer
+            annotations=annotations, token_spans=self.arr_char_spans
         )
 
+    @classmethod
+    def from_dataframe(
+        cls,
+        df: pd.DataFrame,
+        text_col: str = "text",
+        annotations_col: str = "annotations",
+        tokenizer_config: TokenizerConfig = DEFAULT_CONFIG,
+        batch_size: int = 1000,
+        n_process: int = 1,
+    ) -> Iterator["TaggedCorpus"]:
+        """
+        Lazily build a TaggedCorpus for each row of a dataframe (ex: output of `src.data_utils.labelbox`).
+        Texts are tokenized in batches with `Language.pipe`, optionally in several processes.
+        :param df: Dataframe with the texts and annotations
+        :param text_col: Column with the input texts
+        :param annotations_col: Column with the annotations [(start, stop, entity), ...]
+        :param tokenizer_config: Tokenizer configuration
+        :param batch_size: Number of texts tokenized per batch
+        :param n_process: Number of processes used for tokenizing
+        :return: Generator of TaggedCorpus (same order as the dataframe rows)
+        """
+        nlp = get_blank_nlp(tokenizer_config)
+        docs = nlp.pipe(df[text_col], batch_size=batch_size, n_process=n_process)
+        for doc, annotations in zip(docs, df[annotations_col]):
+            yield cls(
+                text=doc.text,
+                annotations=annotations,
+                tokenizer=nlp.tokenizer,
+                doc=doc,
+            )
+
     @staticmethod
     def _annotations2dict(annotations: Annotations) -> AnnotationsDict:
         """
@@ -63,70 +99,63 @@ class TaggedCorpus:
             for span in spans
         ]
 
-    def _get_char_spans_and_tokens(
-        self, text: str, tokenizer: spacy.tokenizer.Tokenizer
-    ) -> (np.ndarray, List[str]):
+    @staticmethod
+    def _get_char_spans_and_tokens(doc: Doc) -> (np.ndarray, List[str]):
         """
-        Get the character spans and the text for each token in the input text.
-        :param text: Input text
+        Get the character spans and the text for each token in the tokenized text.
+        :param doc: Tokenized text
         :return: 2 components - numpy 2D array - rows are tokens, columns are start, stop character span; list of tokens
         """
-        doc = tokenizer(text)
         arr = doc.to_array(["IDX", "LENGTH"])
         tokens = [token.text for token in doc]
         return np.array([arr[:, 0], arr[:, 0] + arr[:, -1]]).T, tokens
 
     def _align_span_dict(
-        self, annotations: Annotations, text: str, tokenizer: spacy.tokenizer.Tokenizer
+        self, annotations: Annotations, token_spans: np.ndarray
     ) -> Dict[str, Dict[str, List[str]]]:
         """
         Get the aligned character spans - spans start at first character index and end on last characted index + 1.
         For example, in "test-token.", `token` spans from (5,10) - as index starts at zero.
         :param annotations: Annotation list
-        :param text: Input text
-        :return: Dictionary of dictionaries - for each entity get the list of character spans and token sequences
-        (example: {entity: {char_spans: [(0, 6), ...], token_seq: [ENT_1, ...]})
+        :param token_spans: Character spans of the tokens (rows are tokens, columns are start, stop)
+        :return: Dictionary of dictionaries - for each entity get the list of character spans, token sequences and
+        token index ranges (example: {entity: {char_spans: [(0, 6), ...], token_seq: [ENT_1, ...], token_ranges: [(0, 1), ...]})
         """
-
-        def _consecutive(arr: np.ndarray) -> List[Tuple[int, ...]]:
-            """Get tuples of the consecutive integers in 1D array"""
-            idx_splits = (np.diff(arr) != 1).nonzero()[0] + 1
-            arr_consec = np.split(ary=arr, indices_or_sections=idx_splits)
-            return [tuple(a) for a in arr_consec]
-
-        def _stich_spans(
-            arr_spans: np.ndarray, tk_spans: np.ndarray
-        ) -> List[Tuple[int, int]]:
-            """Stich back together the spans of consecutive tokens."""
-            first_and_last_idx = [
-                (grp[0], grp[-1]) for grp in _consecutive(arr_spans.nonzero()[0])
-            ]
-            return [
-                (token_spans[start, 0], token_spans[end, -1])
-                for start, end in first_and_last_idx
-            ]
+        annotations_dict = self._annotations2dict(annotations=annotations)
+        tags = list(annotations_dict.keys())
+        spans = np.array(
+            [span for tag in tags for span in annotations_dict[tag]], dtype=np.int64
+        ).reshape(-1, 2)
+        tag_idx = np.repeat(
+            np.arange(len(tags)), [len(annotations_dict[tag]) for tag in tags]
+        )
+        # token index range [first, last) of every span of every tag in one pass
+        first, last = align_spans(token_spans=token_spans, spans=spans)
+        is_tag = _token_mask(
+            tag_idx=tag_idx,
+            first=first,
+            last=last,
+            n_tags=len(tags),
+            n_tokens=len(token_spans),
+        )
+        # for subsequent tokens with the same entity, we want to join the spans
+        edges = np.diff(np.pad(is_tag, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        run_tag, run_first = (edges == 1).nonzero()
+        _, run_last = (edges == -1).nonzero()
 
         d_arr = {}
-        annotations_dict = self._annotations2dict(annotations=annotations)
-        token_spans, _ = self._get_char_spans_and_tokens(text=text, tokenizer=tokenizer)
-        for tag, spans in annotations_dict.items():
-            # span of entity must include start and end characters of token to be tagged
-            is_span = tuple(
-                ((token_spans[:, 0] >= span[0]) & (token_spans[:, 1] <= span[1]))
-                for span in spans
-            )
-            # gather all the tokens that meet criteria
-            is_tag = np.any(is_span, axis=0)
-            arr_tagged_tokens = np.where(is_tag, tag, "O")
-            # for subsequent tokens with the same entity, we want to join the spans
-            aligned_char_span = (
-                _stich_spans(arr_spans=is_tag, tk_spans=token_spans)
-                if any(is_tag)
-                else []
-            )
+        for i, tag in enumerate(tags):
+            in_tag = run_tag == i
+            tk_first, tk_last = run_first[in_tag], run_last[in_tag]
             d_arr[tag] = {
-                "char_spans": aligned_char_span,
-                "token_seq": arr_tagged_tokens.tolist(),
+                "char_spans": list(
+                    zip(
+                        token_spans[tk_first, 0].tolist(),
+                        token_spans[tk_last - 1, 1].tolist(),
+                    )
+                ),
+                "token_seq": np.where(is_tag[i], tag, "O").tolist(),
+                "token_ranges": list(zip(tk_first.tolist(), tk_last.tolist())),
             }
         return d_arr
 
@@ -148,11 +177,11 @@ class TaggedCorpus:
         d = {k: v["token_seq"] for k, v in self.aligned_annotations_dict.items()}
         return d
 
-    def to_doc(self, entity: str = None) -> spacy.tokens.Doc:
+    def _entity_annotations(self, entity: str = None) -> Annotations:
         """
-        Get the entities in an annotated spaCy document.
-        :param entity: Optional parameter - if set, return document annotated with only selected entity
-        :return: SpaCy document annotated with entities
+        Get the aligned character span annotations.
+        :param entity: Optional parameter - if set, return only the annotations of the selected entity
+        :return: Entity annotations [(start, stop, entity), ...] - without overlaps if entity is not set
         """
         annotations_dict = {
             k: [(e[0], e[1]) for e in v["char_spans"]]
@@ -170,9 +199,18 @@ class TaggedCorpus:
             annotations = [
                 (span[0], span[1], entity) for span in annotations_dict[entity]
             ]
+        return annotations
 
-        # generate a blank spacy document and spans for the entity annotations
-        doc = self.tokenizer(self.text)
+    def to_doc(self, entity: str = None) -> spacy.tokens.Doc:
+        """
+        Get the entities in an annotated spaCy document.
+        :param entity: Optional parameter - if set, return document annotated with only selected entity
+        :return: SpaCy document annotated with entities
+        """
+        annotations = self._entity_annotations(entity=entity)
+
+        # copy the tokenized document and generate spans for the entity annotations
+        doc = self.doc.copy()
         entity_spans = [
             doc.char_span(start, end, label=entity)
             for start, end, entity in annotations
@@ -184,14 +222,46 @@ class TaggedCorpus:
         doc.set_ents(entity_spans)
         return doc
 
+    def to_iob_ids(
+        self, entity: str = None, scheme: str = "IOB", entities: List[str] = None
+    ) -> (np.ndarray, List[str]):
+        """
+        Get the entities as label ids (IOB or BILUO format), without building a spaCy document.
+        :param entity: Optional parameter - if set, return only the selected entity
+        :param scheme: Tagging scheme - `IOB` or `BILUO`
+        :param entities: Optional parameter - entity types of the label vocabulary (ex: all the entities of a corpus),
+        defaults to the entities of the document
+        :return: 2 components - numpy 1D array with the label id of each token; label vocabulary (id -> label)
+        """
+        if entities is None:
+            entities = (
+                list(self.aligned_annotations_dict.keys())
+                if entity is None
+                else [entity]
+            )
+        entity2id = {ent: i for i, ent in enumerate(entities)}
+        annotations = self._entity_annotations(entity=entity)
+        first, last = align_spans(
+            token_spans=self.arr_char_spans,
+            spans=[(start, stop) for start, stop, _ in annotations],
+        )
+        ids = encode_tags(
+            first=first,
+            last=last,
+            entity_ids=[entity2id[ent] for _, _, ent in annotations],
+            n_tokens=len(self.tokens),
+            scheme=scheme,
+        )
+        return ids, tag_vocab(entities=entities, scheme=scheme)
+
     def to_iob_list(self, entity: str = None) -> List[str]:
         """
         Get the entities in a list of entities (IOB format).
         :param entity: Optional parameter - if set, return document annotated with only selected entity
         :return: List of strings where each string represents the entity associated with the token
         """
-        doc = self.to_doc(entity=entity)
-        return doc2ents(doc)
+        ids, labels = self.to_iob_ids(entity=entity)
+        return np.array(labels)[ids].tolist()
 
     def to_multi_iob_list(self) -> (List[Tuple[str, ...]], List[str]):
         """
@@ -204,10 +274,158 @@ class TaggedCorpus:
         ]
         return list(zip(*all_entities)), list(self.aligned_annotations_dict.keys())
 
+    def to_multi_iob_array(
+        self, entities: List[str] = None, scheme: str = "IOB"
+    ) -> (np.ndarray, List[str], List[str]):
+        """
+        Get all the entities in a compact matrix of label ids (one column per entity type).
+        :param entities: Optional parameter - entity types of the columns (ex: all the entities of a corpus),
+        defaults to the entities of the document
+        :param scheme: Tagging scheme - `IOB` or `BILUO`
+        :return: 3 components - numpy 2D int8 array - rows are tokens, columns are entity types;
+        entity types; label table shared by all columns (id -> prefix, ex: ["O", "B", "I"])
+        """
+        if entities is None:
+            entities = list(self.aligned_annotations_dict.keys())
+        arr = np.zeros((len(self.tokens), len(entities)), dtype=np.int8)
+        for col, entity in enumerate(entities):
+            if entity not in self.aligned_annotations_dict:
+                continue
+            token_ranges = self.aligned_annotations_dict[entity]["token_ranges"]
+            arr[:, col] = encode_tags(
+                first=[first for first, _ in token_ranges],
+                last=[last for _, last in token_ranges],
+                entity_ids=[0] * len(token_ranges),
+                n_tokens=len(self.tokens),
+                scheme=scheme,
+            )
+        return arr, entities, ["O"] + list(_SCHEME_PREFIXES[scheme])
+
+
+def save_multi_iob(
+    path: str,
+    arrays: Iterable[np.ndarray],
+    entities: List[str],
+    labels: List[str],
+) -> None:
+    """
+    Save the multi-label matrices of a corpus (see `TaggedCorpus.to_multi_iob_array`) in a `.npz` file.
+    Matrices are stacked in a single array, with the token offset of each document.
+    :param path: Output file path
+    :param arrays: Matrices of label ids - rows are tokens, columns are entity types (same for every document)
+    :param entities: Entity types of the columns
+    :param labels: Label table shared by all columns
+    """
+    arrays = list(arrays)
+    offsets = np.cumsum([0] + [len(arr) for arr in arrays])
+    stacked = (
+        np.concatenate(arrays)
+        if arrays
+        else np.zeros((0, len(entities)), dtype=np.int8)
+    )
+    np.savez_compressed(
+        path,
+        labels=stacked,
+        offsets=offsets,
+        entities=np.array(entities, dtype=str),
+        label_table=np.array(labels, dtype=str),
+    )
+
+
+def load_multi_iob(path: str) -> (List[np.ndarray], List[str], List[str]):
+    """
+    Load the multi-label matrices of a corpus saved with `save_multi_iob`.
+    :param path: Input `.npz` file path
+    :return: 3 components - list of matrices (one per document); entity types; label table
+    """
+    with np.load(path) as data:
+        arrays = np.split(data["labels"], data["offsets"][1:-1])
+        return arrays, data["entities"].tolist(), data["label_table"].tolist()
+
+
+def align_spans(
+    token_spans: np.ndarray, spans: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the range of tokens fully covered by each character span.
+    A token is covered if the span includes its start and end characters.
+    :param token_spans: Character spans of the tokens, sorted (rows are tokens, columns are start, stop)
+    :param spans: Character spans to align (rows are spans, columns are start, stop)
+    :return: 2 arrays - first token index and last token index + 1 of each span (empty if first >= last)
+    """
+    token_spans = np.asarray(token_spans).reshape(-1, 2)
+    spans = np.asarray(spans).reshape(-1, 2)
+    # tokens don't overlap, so both token starts and ends are sorted
+    first = np.searchsorted(token_spans[:, 0], spans[:, 0], side="left")
+    last = np.searchsorted(token_spans[:, 1], spans[:, 1], side="right")
+    return first, last
+
+
+def tag_vocab(entities: Iterable[str], scheme: str = "IOB") -> List[str]:
+    """
+    Get the label vocabulary of a tagging scheme - the label id is the position in the list.
+    For example, `["O", "B-ENT1", "I-ENT1", "B-ENT2", "I-ENT2"]` for the IOB scheme.
+    :param entities: Entity types
+    :param scheme: Tagging scheme - `IOB` or `BILUO`
+    :return: List of labels
+    """
+    prefixes = _SCHEME_PREFIXES[scheme]
+    return ["O"] + [f"{prefix}-{ent}" for ent in entities for prefix in prefixes]
+
+
+def encode_tags(
+    first: np.ndarray,
+    last: np.ndarray,
+    entity_ids: Iterable[int],
+    n_tokens: int,
+    scheme: str = "IOB",
+) -> np.ndarray:
+    """
+    Encode token ranges of entities into label ids (see `tag_vocab` for the label of each id).
+    :param first: First token index of each entity
+    :param last: Last token index + 1 of each entity
+    :param entity_ids: Position of the entity type of each entity in the entity types
+    :param n_tokens: Number of tokens in the document
+    :param scheme: Tagging scheme - `IOB` or `BILUO`
+    :return: Numpy 1D array with the label id of each token (0 is `O`)
+    """
+    n_prefixes = len(_SCHEME_PREFIXES[scheme])
+    first, last = np.asarray(first, dtype=np.int64), np.asarray(last, dtype=np.int64)
+    entity_ids = np.asarray(entity_ids, dtype=np.int64).reshape(-1)
+    lengths = np.maximum(last - first, 0)
+    # token index and position inside the entity of every tagged token
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    tokens = np.repeat(first, lengths) + offsets
+    # prefix index - B: 0, I: 1, L: 2, U: 3
+    prefix = (offsets > 0).astype(np.int64)
+    if scheme == "BILUO":
+        is_last = offsets == np.repeat(lengths, lengths) - 1
+        prefix[is_last] = np.where(offsets[is_last] > 0, 2, 3)
+    ids = np.zeros(n_tokens, dtype=np.int32)
+    ids[tokens] = 1 + np.repeat(entity_ids, lengths) * n_prefixes + prefix
+    return ids
+
+
+def _token_mask(
+    tag_idx: np.ndarray,
+    first: np.ndarray,
+    last: np.ndarray,
+    n_tags: int,
+    n_tokens: int,
+) -> np.ndarray:
+    """Get a boolean matrix (tags x tokens) of the tokens covered by the token ranges of each tag"""
+    is_valid = first < last
+    counts = np.zeros((n_tags, n_tokens + 1), dtype=np.int32)
+    np.add.at(counts, (tag_idx[is_valid], first[is_valid]), 1)
+    np.add.at(counts, (tag_idx[is_valid], last[is_valid]), -1)
+    return np.cumsum(counts, axis=1)[:, :-1] > 0
+
 
 def get_entities(s: str) -> Annotations:
     """Process annotations to get in the format of (start, stop, label)"""
-    d = json.loads(s)
+    d = json_backend.loads(s)
 
     # check if dictionary is not empty
     if not d:
@@ -236,56 +454,93 @@ def rm_groups(a: Annotations) -> Annotations:
 
 def rm_colliding(x: Annotations) -> Annotations:
     """Remove any duplicated annotations (one token cannot have two entities)"""
-
-    def _is_overlap(a: Tuple[int, int], b: Tuple[int, int]) -> bool:
-        return a[0] < b[1] and b[0] < a[1]
-
-    def _span_to_drop(a: Tuple[int, int], b: Tuple[int, int]) -> Tuple[int, int]:
-        return a if (a[1] - a[0]) < (b[1] - b[0]) else b
-
-    def _rm_overlap(ranges: Iterable[Tuple[int, int]]):
-        not_valid = [
-            _span_to_drop(a, b) for a, b in combinations(ranges, 2) if _is_overlap(a, b)
-        ]
-        valid = [el for el in ranges if el not in not_valid]
-
-        # check for other overlaps (in case of 3-way collisions)
-        if not_valid:
-            return _rm_overlap(valid)
-        else:
-            return valid
-
     # if duplicated spans then take first
     d = {(start, stop): ent for start, stop, ent in x[::-1]}
-    valid_spans = _rm_overlap(d.keys())
+    is_kept = resolve_overlaps(list(d.keys()))
     return [
         (start, stop, ent)
-        for (start, stop), ent in d.items()
-        if (start, stop) in valid_spans
+        for ((start, stop), ent), keep in zip(d.items(), is_kept)
+        if keep
     ]
 
 
 def doc2ents(doc: Doc) -> List[str]:
     """Take a spaCy `Doc` and return a list of IOB token-based entities"""
     return [
-        f"{token.ent_iob_}-{token.ent_type_}"
-        if token.ent_type_
-        else token.ent_iob_
-        if token.ent_iob_
-        else "O"
+        (
+            f"{token.ent_iob_}-{token.ent_type_}"
+            if token.ent_type_
+            else token.ent_iob_ if token.ent_iob_ else "O"
+        )
         for token in doc
     ]
 
 
 def generate_examples(
-    texts: Iterable[str], entity_offsets: Iterable[Annotations], nlp: Language
-) -> List[Example]:
-    if len(texts) != len(entity_offsets):
-        raise ValueError("Lengths don't match.")
-    # get docs (with predictions)
-    docs = [nlp.make_doc(text) for text in texts]
-    examples = [
-        Example.from_dict(doc, {"entities": entity_offsets})
-        for doc, entity_offsets in zip(docs, entity_offsets)
-    ]
-    return examples
+    texts: Iterable[str],
+    entity_offsets: Iterable[Annotations],
+    nlp: Language,
+    batch_size: int = 1000,
+) -> Iterator[Example]:
+    """
+    Lazily build spaCy Examples - texts are tokenized in batches with `nlp.tokenizer.pipe`.
+    Inputs can be any iterables (ex: generators), only one batch is kept in memory.
+    :param texts: Input texts
+    :param entity_offsets: Annotations [(start, stop, entity), ...] of each text
+    :param nlp: SpaCy pipeline used for tokenizing
+    :param batch_size: Number of texts tokenized per batch
+    :return: Generator of Examples (same order as the inputs)
+    """
+    if hasattr(texts, "__len__") and hasattr(entity_offsets, "__len__"):
+        if len(texts) != len(entity_offsets):
+            raise ValueError("Lengths don't match.")
+    return iter_examples(
+        _zip_same_length(texts, entity_offsets), nlp=nlp, batch_size=batch_size
+    )
+
+
+def iter_examples(
+    rows: Iterable[Tuple[str, Annotations]],
+    nlp: Language,
+    batch_size: int = 1000,
+    tokenizer: spacy.tokenizer.Tokenizer = None,
+) -> Iterator[Example]:
+    """
+    Lazily build spaCy Examples from (text, annotations) pairs.
+    :param rows: Pairs of text and annotations [(start, stop, entity), ...]
+    :param nlp: SpaCy pipeline used for tokenizing
+    :param batch_size: Number of texts tokenized per batch
+    :param tokenizer: Tokenizer of the reference documents (the annotations), default to the
+        tokenizer of `nlp`. Predicted documents are tokenized by `nlp` and aligned by the Example.
+    :return: Generator of Examples (same order as the inputs)
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        # get docs (with predictions)
+        docs = nlp.tokenizer.pipe((text for text, _ in batch), batch_size=batch_size)
+        if tokenizer is None or tokenizer is nlp.tokenizer:
+            for doc, (_, offsets) in zip(docs, batch):
+                yield Example.from_dict(doc, {"entities": offsets})
+            continue
+        references = tokenizer.pipe((text for text, _ in batch), batch_size=batch_size)
+        for doc, reference, (_, offsets) in zip(docs, references, batch):
+            # same tokens in the vocab of the pipeline (entity labels are looked up there)
+            reference = Doc(
+                nlp.vocab,
+                words=[token.text for token in reference],
+                spaces=[bool(token.whitespace_) for token in reference],
+            )
+            reference = Example.from_dict(reference, {"entities": offsets}).reference
+            yield Example(doc, reference)
+
+
+def _zip_same_length(a: Iterable, b: Iterable) -> Iterator[Tuple]:
+    """Zip two iterables, raise an error if one is exhausted before the other."""
+    missing = object()
+    for pair in zip_longest(a, b, fillvalue=missing):
+        if any(x is missing for x in pair):
+            raise ValueError("Lengths don't match.")
+        yield pair
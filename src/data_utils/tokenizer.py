@@ -0,0 +1,103 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Pattern, Tuple
+
+import spacy
+from spacy.language import Language
+from spacy.tokenizer import Tokenizer
+
+# extra infix rules on top of spaCy's defaults (split on symbols common in abstracts)
+INFIXES = (r"[-/=)(><]",)
+
+
+class TokenizerConfig(NamedTuple):
+    """
+    Hashable and picklable description of a tokenizer.
+    Worker processes receive the config and rebuild the tokenizer from the registry.
+    """
+
+    lang: str = "en"
+    infixes: Tuple[str, ...] = INFIXES
+
+    def load(self) -> Tokenizer:
+        """Get the (cached) tokenizer for this configuration."""
+        return get_tokenizer(self)
+
+
+DEFAULT_CONFIG = TokenizerConfig()
+
+# process-wide registry - one blank pipeline per tokenizer configuration
+_REGISTRY: Dict[TokenizerConfig, Language] = {}
+
+
+def configure_tokenizer(
+    nlp: Language, config: TokenizerConfig = DEFAULT_CONFIG
+) -> None:
+    """
+    Add the extra infix rules of the configuration to the tokenizer of a pipeline (in place).
+    :param nlp: SpaCy pipeline
+    :param config: Tokenizer configuration
+    """
+    nlp.tokenizer.infix_finditer = _compile_infixes(
+        lang=config.lang, infixes=tuple(config.infixes)
+    ).finditer
+
+
+@lru_cache(maxsize=None)
+def _compile_infixes(lang: str, infixes: Tuple[str, ...]) -> Pattern:
+    """Compile the default infix rules of the language plus the extra rules (once per rule set)."""
+    defaults = spacy.util.get_lang_class(lang).Defaults.infixes
+    return spacy.util.compile_infix_regex(list(defaults) + list(infixes))
+
+
+def get_blank_nlp(config: TokenizerConfig = DEFAULT_CONFIG) -> Language:
+    """
+    Get the shared blank pipeline for a tokenizer configuration - built once per process.
+    The returned pipeline is shared, do not add components to it.
+    :param config: Tokenizer configuration
+    :return: Blank spaCy pipeline with the configured tokenizer
+    """
+    config = TokenizerConfig(lang=config.lang, infixes=tuple(config.infixes))
+    nlp = _REGISTRY.get(config)
+    if nlp is None:
+        nlp = spacy.blank(config.lang)
+        configure_tokenizer(nlp, config=config)
+        _REGISTRY[config] = nlp
+    return nlp
+
+
+def get_tokenizer(config: TokenizerConfig = DEFAULT_CONFIG) -> Tokenizer:
+    """
+    Get the shared tokenizer for a tokenizer configuration - built once per process.
+    :param config: Tokenizer configuration
+    :return: SpaCy tokenizer
+    """
+    return get_blank_nlp(config).tokenizer
+
+
+@spacy.registry.tokenizers("src.Tokenizer.v1")
+def create_tokenizer(
+    infixes: List[str] = list(INFIXES),
+) -> Callable[[Language], Tokenizer]:
+    """
+    Tokenizer of training configs - spaCy's default tokenizer with the extra infix rules, ex:
+        [nlp.tokenizer]
+        @tokenizers = "src.Tokenizer.v1"
+    so that the pipeline splits tokens like the compiled corpora and the table reader.
+    :param infixes: Extra infix rules
+    :return: Function building the tokenizer of a pipeline
+    """
+    default_tokenizer = spacy.registry.tokenizers.get("spacy.Tokenizer.v1")()
+
+    def make_tokenizer(nlp: Language) -> Tokenizer:
+        tokenizer = default_tokenizer(nlp)
+        tokenizer.infix_finditer = _compile_infixes(
+            lang=nlp.lang, infixes=tuple(infixes)
+        ).finditer
+        return tokenizer
+
+    return make_tokenizer
+
+
+def clear_registry() -> None:
+    """Drop all the cached tokenizers."""
+    _REGISTRY.clear()
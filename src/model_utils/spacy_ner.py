@@ -3,17 +3,23 @@ from typing import List, Tuple
 import pandas as pd
 import spacy
 
+from src.data_utils.tokenizer import (
+    DEFAULT_CONFIG,
+    TokenizerConfig,
+    configure_tokenizer,
+)
+
 Annotations = List[Tuple[int, int, str]]
 
 
 # creating a blank model, could have started from something pretrained as well (look for models)
-def create_blank_nlp(train_data: pd.Series) -> spacy.Language:
+def create_blank_nlp(
+    train_data: pd.Series, tokenizer_config: TokenizerConfig = DEFAULT_CONFIG
+) -> spacy.Language:
     """Create a blank NLP model for training"""
-    nlp = spacy.blank("en")
-    # add more rules for tokenizing
-    infixes = nlp.Defaults.infixes + [r"[-/=)(><]"]
-    infix_regex = spacy.util.compile_infix_regex(infixes)
-    nlp.tokenizer.infix_finditer = infix_regex.finditer
+    nlp = spacy.blank(tokenizer_config.lang)
+    # add more rules for tokenizing (same rules as the shared tokenizers)
+    configure_tokenizer(nlp, config=tokenizer_config)
     # add ner component
     nlp.add_pipe("ner", last=True)
     ner = nlp.get_pipe("ner")
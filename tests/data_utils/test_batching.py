@@ -0,0 +1,50 @@
+from hypothesis import given
+from hypothesis import strategies as st
+
+from src.data_utils import batch_data, batching
+
+
+def test_batch_data_compounding() -> None:
+    data = list(range(10))
+    batches = list(batch_data(data, batch_size=2, compounding=2))
+    assert batches == [[0, 1], [2, 3, 4, 5], [6, 7, 8, 9]]
+    assert list(batch_data(iter(data), batch_size=2, compounding=2)) == batches
+
+
+@given(st.lists(st.integers(min_value=0, max_value=50)), st.booleans())
+def test_batch_by_tokens_budget(lengths, padded) -> None:
+    items = [[0] * n for n in lengths]
+    batches = list(
+        batching.batch_by_tokens(
+            iter(items), max_tokens=60, padded=padded, buffer_size=7, seed=0
+        )
+    )
+    assert sorted(map(len, (i for b in batches for i in b))) == sorted(lengths)
+    for batch in batches:
+        sizes = [len(item) for item in batch]
+        cost = len(batch) * max(sizes) if padded else sum(sizes)
+        assert cost <= 60
+
+
+@given(st.lists(st.integers(min_value=0, max_value=100)))
+def test_bucket_by_length(lengths) -> None:
+    items = [[0] * n for n in lengths]
+    batches = list(
+        batching.bucket_by_length(
+            items, boundaries=[10, 40], max_tokens=80, discard_oversize=True
+        )
+    )
+    assert sorted(len(i) for b in batches for i in b) == sorted(
+        n for n in lengths if n <= 80
+    )
+    for batch in batches:
+        sizes = [len(item) for item in batch]
+        assert len(batch) * max(sizes) <= 80
+        assert len({(n > 10) + (n > 40) for n in sizes}) == 1
+
+
+def test_shuffle_buffer() -> None:
+    items = list(range(100))
+    shuffled = list(batching.shuffle_buffer(iter(items), buffer_size=10, seed=0))
+    assert sorted(shuffled) == items
+    assert shuffled != items
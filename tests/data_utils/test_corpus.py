@@ -0,0 +1,116 @@
+import json
+import warnings
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import spacy
+from spacy.lang.en import English
+
+from src.data_utils import corpus, ner
+
+
+def test_table_corpus_jsonl(tmp_path) -> None:
+    path = tmp_path / "train.jsonl"
+    rows = [
+        {"text": "Mr. Bean flew to New York.", "annotations": [[0, 8, "PERSON"]]},
+        {"text": "Murilo is da bomb from Brazil.", "annotations": [[23, 29, "PLACE"]]},
+    ]
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+
+    reader = spacy.registry.resolve(
+        {"corpus": {"@readers": "src.TableCorpus.v1", "path": str(path)}}
+    )["corpus"]
+    nlp = English()
+    # read again for every epoch
+    for _ in range(2):
+        examples = list(reader(nlp))
+        assert [ner.doc2ents(eg.reference) for eg in examples] == [
+            ["B-PERSON", "I-PERSON", "O", "O", "O", "O", "O"],
+            ["O", "O", "O", "O", "O", "B-PLACE", "O"],
+        ]
+
+    assert len(list(corpus.TableCorpus(path, limit=1)(nlp))) == 1
+    assert len(list(corpus.TableCorpus(path, max_length=6)(nlp))) == 0
+
+
+def test_iter_table_csv(tmp_path) -> None:
+    path = tmp_path / "train.csv"
+    pd.DataFrame(
+        {"text": ["n = 5"], "annotations": [json.dumps([[4, 5, "g1_n"]])]}
+    ).to_csv(path, index=False)
+    assert list(corpus.iter_table(path)) == [("n = 5", [(4, 5, "g1_n")])]
+
+
+def test_compile_corpus_incremental(tmp_path) -> None:
+    df = pd.DataFrame(
+        {
+            "text": ["Mr. Bean flew to New York.", "n = 5 patients", "n = 7 patients"],
+            "annotations": [[(0, 8, "PERSON")], [(4, 5, "g1_n")], [(4, 5, "g2_n")]],
+        }
+    )
+    stats = corpus.compile_corpus(df, tmp_path, shard_size=2)
+    assert stats["tokenized"] == 3 and stats["shards"] == 2
+
+    # relabel one document and drop another
+    df.at[1, "annotations"] = [(4, 5, "g2_n")]
+    stats = corpus.compile_corpus(df.drop(index=2), tmp_path, shard_size=2)
+    assert stats["tokenized"] == 1
+    assert stats["removed"] == 2
+    assert stats["documents"] == 2
+
+    nlp = English()
+    docs = [eg.reference for eg in spacy.training.Corpus(tmp_path)(nlp)]
+    assert sorted(ner.doc2ents(doc) for doc in docs) == [
+        ["B-PERSON", "I-PERSON", "O", "O", "O", "O", "O"],
+        ["O", "O", "B-g2_n", "O"],
+    ]
+    stats = corpus.compile_corpus(df.drop(index=2), tmp_path, shard_size=2)
+    assert stats["tokenized"] == 0 and stats["reused"] == 2
+
+
+@pytest.mark.parametrize("tokenizer", ["spacy.Tokenizer.v1", "src.Tokenizer.v1"])
+def test_table_corpus_infix_annotations(tmp_path, tokenizer) -> None:
+    path = tmp_path / "train.jsonl"
+    path.write_text(
+        json.dumps({"text": "n=20 patients", "annotations": [[2, 4, "g1_n"]]})
+    )
+    nlp = spacy.blank("en", config={"nlp": {"tokenizer": {"@tokenizers": tokenizer}}})
+    with warnings.catch_warnings():
+        # W030 - misaligned entities are dropped
+        warnings.simplefilter("error")
+        (example,) = corpus.TableCorpus(path)(nlp)
+    # the entity is kept on the reference whatever the tokenizer of the pipeline
+    assert [t.text for t in example.reference] == ["n", "=", "20", "patients"]
+    assert ner.doc2ents(example.reference) == ["O", "O", "B-g1_n", "O"]
+    assert example.predicted.text == "n=20 patients"
+    if tokenizer == "src.Tokenizer.v1":
+        assert len(example.predicted) == 4
+        assert example.get_aligned_ner() == ["O", "O", "U-g1_n", "O"]
+
+
+def _config_corpus(name, path):
+    """Train corpus & pipeline tokenizer of a training config of scripts/spacy"""
+    config = spacy.util.load_config(
+        Path(__file__).parents[2] / "scripts" / "spacy" / name,
+        overrides={"paths.train": str(path), "paths.dev": str(path)},
+        interpolate=True,
+    )
+    nlp = spacy.blank("en", config={"nlp": {"tokenizer": config["nlp"]["tokenizer"]}})
+    reader = spacy.registry.resolve({"corpus": config["corpora"]["train"]})["corpus"]
+    return list(reader(nlp))
+
+
+def test_training_configs(tmp_path) -> None:
+    df = pd.DataFrame({"text": ["n=20 patients"], "annotations": [[(2, 4, "g1_n")]]})
+    # compiled shards are read by ner_pipe.cfg, annotation tables by ner_pipe_table.cfg
+    corpus.compile_corpus(df, tmp_path / "shards")
+    path = tmp_path / "train.jsonl"
+    df.to_json(path, orient="records", lines=True)
+    (shards,) = _config_corpus("ner_pipe.cfg", tmp_path / "shards")
+    (table,) = _config_corpus("ner_pipe_table.cfg", path)
+    for example in [shards, table]:
+        assert ner.doc2ents(example.reference) == ["O", "O", "B-g1_n", "O"]
+    # ner_pipe.cfg keeps the stock tokenizer, only the table config splits infixes
+    assert [t.text for t in shards.predicted] == ["n=20", "patients"]
+    assert table.get_aligned_ner() == ["O", "O", "U-g1_n", "O"]
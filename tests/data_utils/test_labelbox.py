@@ -0,0 +1,46 @@
+import json
+
+import pandas as pd
+
+from src.data_utils import labelbox, labelbox_spans
+
+
+def _label(*objects) -> str:
+    return json.dumps(
+        {
+            "objects": [
+                {"value": value, "data": {"location": {"start": start, "end": end}}}
+                for start, end, value in objects
+            ]
+        }
+    )
+
+
+def test_labelbox() -> None:
+    df = pd.DataFrame(
+        {
+            "Labeled Data": [f"PMID: {pmid}  TITLE. text" for pmid in [1, 2, 3, 1]],
+            "Label": [
+                _label((0, 3, "g1_n"), (0, 3, "g2_n"), (5, 6, "group1")),
+                "{}",
+                _label(),
+                _label((1, 2, "OS_HR")),
+            ],
+        }
+    )
+    docs, spans = labelbox_spans(df, rm_groups=True, dedup=True)
+    assert docs["pmid"].tolist() == ["1"]
+    assert spans.values.tolist() == [[0, 0, 4, "n"], [0, 5, 7, "group"]]
+
+    data = labelbox(df, increment_end_span=False)
+    assert data.columns.tolist() == [
+        "pmid",
+        "annotations",
+        "text",
+        "Label",
+        "Labeled Data",
+    ]
+    assert data["annotations"].tolist() == [
+        [(0, 3, "g1_n"), (0, 3, "g2_n"), (5, 6, "group1")],
+        [(1, 2, "OS_HR")],
+    ]
@@ -1,6 +1,11 @@
 import warnings
+from itertools import combinations
 
 import numpy as np
+import pandas as pd
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
 from spacy.lang.en import English
 from spacy.tokens import Span
 
@@ -118,6 +123,28 @@ class TestTaggedCorpus:
             "I-PLACE",
         ]
 
+    def test_to_iob_ids(self) -> None:
+        text = "Murilo is from São Paulo, a city in Brazil."
+        annotations = [(0, 6, "PERSON"), (15, 24, "PLACE"), (35, 43, "PLACE")]
+        tagged_corpus = ner.TaggedCorpus(text, annotations)
+        ids, labels = tagged_corpus.to_iob_ids(entities=["PLACE", "PERSON"])
+        assert labels == ["O", "B-PLACE", "I-PLACE", "B-PERSON", "I-PERSON"]
+        assert ids.tolist() == [3, 0, 0, 1, 2, 0, 0, 0, 0, 1, 2]
+        ids, labels = tagged_corpus.to_iob_ids(entity="PLACE", scheme="BILUO")
+        assert [labels[i] for i in ids] == [
+            "O",
+            "O",
+            "O",
+            "B-PLACE",
+            "L-PLACE",
+            "O",
+            "O",
+            "O",
+            "O",
+            "B-PLACE",
+            "L-PLACE",
+        ]
+
     def test_to_multi_iob_list(self) -> None:
         text = "Murilo is from São Paulo, Brazil."
         annotations = [
@@ -139,6 +166,108 @@ class TestTaggedCorpus:
             ("O", "O", "O", "O"),
         ]
 
+    def test_tokenize_once(self) -> None:
+        tokenizer = ner.get_tokenizer()
+        calls = []
+
+        def _tokenizer(text: str):
+            calls.append(text)
+            return tokenizer(text)
+
+        text = "Murilo is from São Paulo, Brazil."
+        annotations = [(0, 6, "PERSON"), (15, 24, "CITY"), (26, 32, "COUNTRY")]
+        tagged_corpus = ner.TaggedCorpus(text, annotations, tokenizer=_tokenizer)
+        tagged_corpus.to_doc()
+        tagged_corpus.to_multi_iob_list()
+        assert calls == [text]
+
+    def test_from_dataframe(self) -> None:
+        df = pd.DataFrame(
+            {
+                "text": [
+                    "Murilo is testing some components for Omdena and RebootRx.",
+                    "Murilo is from São Paulo, Brazil.",
+                ],
+                "annotations": [
+                    [(0, 6, "PERSON"), (37, 44, "ORG"), (49, 58, "ORG")],
+                    [(0, 6, "PERSON"), (15, 24, "CITY"), (26, 32, "COUNTRY")],
+                ],
+            }
+        )
+        res = ner.TaggedCorpus.from_dataframe(df, batch_size=1)
+        assert not isinstance(res, list)
+        for tagged_corpus, (text, annotations) in zip(res, df.values):
+            expected = ner.TaggedCorpus(text, annotations)
+            assert tagged_corpus.text == text
+            assert tagged_corpus.to_tokens() == expected.to_tokens()
+            assert tagged_corpus.to_dict() == expected.to_dict()
+
+    def test_to_multi_iob_array(self) -> None:
+        text = "Murilo is from São Paulo, Brazil."
+        annotations = [
+            (0, 6, "PERSON"),
+            (15, 24, "CITY"),
+            (26, 32, "COUNTRY"),
+            (15, 32, "PLACE"),
+        ]
+        tagged_corpus = ner.TaggedCorpus(text, annotations)
+        res_list, entities = tagged_corpus.to_multi_iob_list()
+        arr, res_entities, labels = tagged_corpus.to_multi_iob_array()
+        assert arr.dtype == np.int8
+        assert arr.shape == (8, 4)
+        assert res_entities == entities
+        assert labels == ["O", "B", "I"]
+        assert res_list == [
+            tuple(f"{labels[i]}-{ent}" if i else "O" for i, ent in zip(row, entities))
+            for row in arr
+        ]
+
+
+def test_save_load_multi_iob(tmp_path) -> None:
+    entities = ["CITY", "PERSON"]
+    corpora = [
+        ner.TaggedCorpus("Murilo is from São Paulo.", [(0, 6, "PERSON")]),
+        ner.TaggedCorpus("São Paulo, Brazil.", [(0, 9, "CITY")]),
+    ]
+    arrays = [tc.to_multi_iob_array(entities=entities)[0] for tc in corpora]
+    path = tmp_path / "multi_iob.npz"
+    ner.save_multi_iob(path, arrays=arrays, entities=entities, labels=["O", "B", "I"])
+    res, res_entities, labels = ner.load_multi_iob(path)
+    assert res_entities == entities
+    assert labels == ["O", "B", "I"]
+    assert [arr.tolist() for arr in res] == [arr.tolist() for arr in arrays]
+    assert res[1][:, 0].tolist() == [1, 2, 0, 0, 0]
+
+
+def test_align_spans() -> None:
+    token_spans = np.array([[0, 4], [5, 7], [8, 9], [10, 14], [14, 15], [15, 19]])
+    spans = np.array([[0, 7], [6, 14], [9, 19], [5, 6]])
+    first, last = ner.align_spans(token_spans=token_spans, spans=spans)
+    assert first.tolist() == [0, 2, 3, 1]
+    assert last.tolist() == [2, 4, 6, 1]
+
+
+def test_encode_tags() -> None:
+    labels = ner.tag_vocab(["TAG1", "TAG2"], scheme="BILUO")
+    ids = ner.encode_tags(
+        first=[0, 2, 6],
+        last=[1, 5, 8],
+        entity_ids=[1, 0, 0],
+        n_tokens=9,
+        scheme="BILUO",
+    )
+    assert [labels[i] for i in ids] == [
+        "U-TAG2",
+        "O",
+        "B-TAG1",
+        "I-TAG1",
+        "L-TAG1",
+        "O",
+        "B-TAG1",
+        "L-TAG1",
+        "O",
+    ]
+
 
 def test_get_entities() -> None:
     x = """{ "objects": [
@@ -173,6 +302,54 @@ def test_rm_colliding() -> None:
     assert sorted(res) == sorted([(2, 6, "TAG1"), (6, 8, "TAG2"), (9, 12, "TAG3")])
 
 
+def _rm_colliding_reference(x: ner.Annotations) -> ner.Annotations:
+    """Quadratic (recursive) implementation - reference for the sweep-line resolver"""
+
+    def _is_overlap(a, b) -> bool:
+        return a[0] < b[1] and b[0] < a[1]
+
+    def _span_to_drop(a, b):
+        return a if (a[1] - a[0]) < (b[1] - b[0]) else b
+
+    def _rm_overlap(ranges):
+        not_valid = [
+            _span_to_drop(a, b) for a, b in combinations(ranges, 2) if _is_overlap(a, b)
+        ]
+        valid = [el for el in ranges if el not in not_valid]
+        return _rm_overlap(valid) if not_valid else valid
+
+    d = {(start, stop): ent for start, stop, ent in x[::-1]}
+    valid_spans = _rm_overlap(d.keys())
+    return [
+        (start, stop, ent)
+        for (start, stop), ent in d.items()
+        if (start, stop) in valid_spans
+    ]
+
+
+annotations_strategy = st.lists(
+    st.tuples(
+        st.integers(min_value=0, max_value=60),
+        st.integers(min_value=0, max_value=15),
+        st.sampled_from(["TAG1", "TAG2", "TAG3"]),
+    ).map(lambda a: (a[0], a[0] + a[1], a[2])),
+    max_size=40,
+)
+
+
+@given(annotations_strategy)
+def test_rm_colliding_matches_reference(x: ner.Annotations) -> None:
+    assert ner.rm_colliding(x) == _rm_colliding_reference(x)
+
+
+@given(annotations_strategy)
+def test_rm_colliding_no_overlaps(x: ner.Annotations) -> None:
+    res = sorted(
+        (start, stop) for start, stop, _ in ner.rm_colliding(x) if stop > start
+    )
+    assert all(a[1] <= b[0] for a, b in zip(res, res[1:]))
+
+
 def test_doc2ents() -> None:
     nlp = English()
     doc = nlp("Mr. Bean flew to New York on Saturday morning.")
@@ -203,7 +380,7 @@ def test_generate_examples() -> None:
         [(0, 2, "PERSON"), (4, 6, "PLACE")],
         [(0, 1, "PERSON"), (5, 6, "PLACE")],
     ]
-    res = ner.generate_examples(texts=texts, entity_offsets=ann_char, nlp=nlp)
+    res = list(ner.generate_examples(texts=texts, entity_offsets=ann_char, nlp=nlp))
     docs_ref = list(nlp.pipe(texts))
     docs_pred = list(nlp.pipe(texts))
 
@@ -216,3 +393,27 @@ def test_generate_examples() -> None:
     assert [ner.doc2ents(doc) for doc in docs_ref] == [
         ner.doc2ents(r.reference) for r in res
     ]
+
+
+def test_generate_examples_lazy() -> None:
+    nlp = English()
+    texts = (t for t in ["Mr. Bean flew to New York.", "Murilo is da bomb."])
+    ann_char = iter([[(0, 8, "PERSON"), (17, 25, "PLACE")], [(0, 6, "PERSON")]])
+    res = ner.generate_examples(texts=texts, entity_offsets=ann_char, nlp=nlp)
+    assert not isinstance(res, list)
+    assert [ner.doc2ents(r.reference) for r in res] == [
+        ["B-PERSON", "I-PERSON", "O", "O", "B-PLACE", "I-PLACE", "O"],
+        ["B-PERSON", "O", "O", "O", "O"],
+    ]
+
+    res = ner.generate_examples(
+        texts=iter(["a b", "c d"]), entity_offsets=iter([[]]), nlp=nlp
+    )
+    with pytest.raises(ValueError):
+        list(res)
+
+
+def test_package_reexports() -> None:
+    from src.data_utils import get_entities, rm_groups
+
+    assert get_entities is ner.get_entities and rm_groups is ner.rm_groups
@@ -0,0 +1,32 @@
+import pickle
+
+from src.data_utils import tokenizer
+
+
+def test_get_tokenizer_is_cached() -> None:
+    tk = tokenizer.get_tokenizer()
+    assert tk is tokenizer.get_tokenizer(tokenizer.DEFAULT_CONFIG)
+    assert tk is tokenizer.TokenizerConfig(infixes=list(tokenizer.INFIXES)).load()
+    assert [t.text for t in tk("token-test (n=5)")] == [
+        "token",
+        "-",
+        "test",
+        "(",
+        "n",
+        "=",
+        "5",
+        ")",
+    ]
+
+
+def test_get_tokenizer_keyed_by_infixes() -> None:
+    config = tokenizer.TokenizerConfig(infixes=())
+    tk = tokenizer.get_tokenizer(config)
+    assert tk is not tokenizer.get_tokenizer()
+    assert [t.text for t in tk("n=5")] == ["n=5"]
+
+
+def test_tokenizer_config_pickle() -> None:
+    config = pickle.loads(pickle.dumps(tokenizer.DEFAULT_CONFIG))
+    assert config == tokenizer.DEFAULT_CONFIG
+    assert config.load() is tokenizer.get_tokenizer()
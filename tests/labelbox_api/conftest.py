@@ -0,0 +1,75 @@
+import copy
+import sys
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+
+# the Flask app modules import each other by name
+sys.path.insert(0, str(Path(__file__).parents[2] / "labelbox-api"))
+
+
+class FakeCollection:
+    """In-memory stand-in of the pymongo collection methods used by the app modules"""
+
+    def __init__(self):
+        self.docs = []
+        self.indexes = []
+        self.n_writes = 0
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in (query or {}).items():
+            value = doc.get(key)
+            if isinstance(condition, dict):
+                for op, operand in condition.items():
+                    if op == "$in" and value not in operand:
+                        return False
+                    if op == "$gt" and (value is None or not value > operand):
+                        return False
+                    if op == "$ne" and value == operand:
+                        return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, query=None, projection=None, sort=None):
+        docs = [copy.deepcopy(d) for d in self.docs if self._matches(d, query)]
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return iter(docs)
+
+    def find_one(self, query=None, projection=None, sort=None):
+        return next(self.find(query, sort=sort), None)
+
+    def count_documents(self, query):
+        return sum(self._matches(d, query) for d in self.docs)
+
+    def insert_many(self, docs):
+        for doc in docs:
+            self.docs.append({"_id": ObjectId(), **copy.deepcopy(doc)})
+
+    def update_one(self, query, update, upsert=False):
+        self.n_writes += 1
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(copy.deepcopy(update.get("$set", {})))
+                return
+        if upsert:
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.setdefault("_id", ObjectId())
+            doc.update(update.get("$set", {}))
+            doc.update(update.get("$setOnInsert", {}))
+            self.docs.append(copy.deepcopy(doc))
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+
+
+@pytest.fixture
+def make_collection():
+    return FakeCollection
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+abstract_search = pytest.importorskip("abstract_search")
+
+ABSTRACTS = [
+    "PMID: 101  TITLE. Drug A versus placebo in 120 patients with advanced lung cancer. "
+    "Patients were randomized to two arms and followed for overall survival.",
+    "PMID: 102  TITLE. A phase II trial of drug B in 45 women with metastatic breast cancer. "
+    "The primary endpoint was the objective response rate after twelve weeks.",
+    "PMID: 12  TITLE. Short report of a single arm study of drug C in elderly patients.",
+]
+
+
+@pytest.fixture
+def search(make_collection):
+    collection = make_collection()
+    collection.insert_many(
+        [
+            {"uid": f"row{i}", "external_id": f"abstract{i}.txt", "row_data": text}
+            for i, text in enumerate(ABSTRACTS)
+        ]
+    )
+    search = abstract_search.AbstractSearch(collection)
+    search.start(interval=3600)
+    # wait for the background build
+    for _ in range(200):
+        if search.ready:
+            break
+        time.sleep(0.01)
+    return search
+
+
+def test_background_build(search) -> None:
+    assert search.ready
+    assert len(search._rows) == 3
+    # fingerprint & pmid fields are filled
+    assert search.collection.find_one({"uid": "row0"})["pmid"] == "101"
+
+
+def test_search_not_ready(make_collection) -> None:
+    collection = make_collection()
+    collection.insert_many(
+        [{"uid": "row0", "external_id": "a", "row_data": ABSTRACTS[0]}]
+    )
+    search = abstract_search.AbstractSearch(collection)
+    # the index is not built in the request
+    assert search.search(ABSTRACTS[0]) == {}
+    assert search._rows == [] and collection.n_writes == 0
+
+
+def test_search_fingerprint(search) -> None:
+    text = "  " + ABSTRACTS[1].upper().replace(":", " ;") + "\n"
+    assert search.search(text) == {
+        "row_uid": "row1",
+        "external_id": "abstract1.txt",
+        "match": "fingerprint",
+        "score": 1.0,
+    }
+
+
+def test_search_fuzzy(search) -> None:
+    text = ABSTRACTS[0].replace("PMID: 101  TITLE. ", "").replace("two arms", "2 arms")
+    result = search.search(text)
+    assert result["row_uid"] == "row0" and result["match"] == "fuzzy"
+    assert abstract_search.MIN_SIMILARITY <= result["score"] < 1
+
+
+def test_search_pmid(search) -> None:
+    assert search.search(" 102 ") == {
+        "row_uid": "row1",
+        "external_id": "abstract1.txt",
+        "match": "pmid",
+        "score": None,
+    }
+    # PMID header with another text, the score tells how close the texts are
+    result = search.search("PMID: 101  TITLE. An unrelated erratum notice")
+    assert result["row_uid"] == "row0" and result["match"] == "pmid"
+    assert result["score"] < abstract_search.MIN_SIMILARITY
+    # digits in free text are not a PMID
+    assert search.search("12 Tumours were treated with radiotherapy") == {}
+
+
+def test_search_new_documents(search) -> None:
+    text = (
+        "PMID: 103  TITLE. New abstract about drug D in children with asthma and allergies. "
+        "Children were followed for one year and the number of asthma attacks was recorded."
+    )
+    search.collection.insert_many(
+        [{"uid": "row3", "external_id": "new", "row_data": text}]
+    )
+    # added by the search (the index is built)
+    result = search.search(
+        text.replace("PMID: 103  TITLE. ", "").replace("one year", "1 year")
+    )
+    assert result["row_uid"] == "row3" and result["match"] == "fuzzy"
+    assert len(search._rows) == 4
+
+
+def test_search_pmid_edited_abstract(search) -> None:
+    # real header, the text was edited too much for a fuzzy match
+    text = (
+        "PMID: 102  TITLE. Drug B in women with breast cancer, response after 12 weeks."
+    )
+    result = search.search(text)
+    assert result["row_uid"] == "row1" and result["match"] == "pmid"
+    assert 0 <= result["score"] < abstract_search.MIN_SIMILARITY
+
+
+def test_refresh_rewrites_padded_pmids(make_collection) -> None:
+    collection = make_collection()
+    # stored by the former parser, cut before the first 'T'
+    collection.insert_many(
+        [{"uid": "row0", "external_id": "a", "row_data": ABSTRACTS[0], "pmid": "101 "}]
+    )
+    search = abstract_search.AbstractSearch(collection)
+    search.refresh()
+    assert collection.find_one({"uid": "row0"})["pmid"] == "101"
+    assert search.search("101")["row_uid"] == "row0"
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+main = pytest.importorskip("main")
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+def test_invalidate_cache(client) -> None:
+    main.project_cache._cache["project"] = "cached"
+    response = client.post(
+        "/invalidate-cache", data=json.dumps({"token": main.token_checker})
+    )
+    assert json.loads(response.data)["caches"] == ["project", "dataset", "ontology"]
+    assert main.project_cache.stats()["size"] == 0
+
+    response = client.post(
+        "/invalidate-cache",
+        data=json.dumps({"token": main.token_checker, "cache": "projects"}),
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data)["message"] == "Unknown cache projects"
+
+
+class FakeUploads:
+    """Stand-in of the upload collection - newest first cursor which can fail while iterating"""
+
+    def __init__(self, n_uploads, fail_after=None):
+        self.uploads = [
+            {
+                "_id": f"{i:024x}",
+                "project": "project",
+                "date": f"2021-03-{i + 1:02d}",
+                "upload_name": f"upload {i}",
+                "submitted_by": "user",
+                "description": "",
+                "status": "RUNNING",
+            }
+            for i in range(n_uploads)
+        ]
+        self.fail_after = fail_after
+        self.n_limit = None
+
+    def estimated_document_count(self):
+        return len(self.uploads)
+
+    def find(self, query, projection=None):
+        return self
+
+    def sort(self, keys):
+        return self
+
+    def limit(self, n_limit):
+        self.n_limit = n_limit
+        return self
+
+    def __iter__(self):
+        for i, upload in enumerate(reversed(self.uploads[-self.n_limit :])):
+            if i == self.fail_after:
+                raise RuntimeError("cursor not found")
+            yield upload
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    def make_uploads(n_uploads, fail_after=None):
+        collection = FakeUploads(n_uploads, fail_after=fail_after)
+        monkeypatch.setattr(main, "mycol", collection)
+        monkeypatch.setattr(main, "upload_indexes_created", True)
+        return collection
+
+    return make_uploads
+
+
+@pytest.mark.parametrize(
+    "limit, n_uploads", [("0", 1), ("-3", 1), ("2", 2), ("5000", 5)]
+)
+def test_upload_list_limit(client, uploads, limit, n_uploads) -> None:
+    uploads(5)
+    result = json.loads(client.get(f"/upload-annotation-list?limit={limit}").data)
+    assert result["status"] == "Successfully Uploaded Annotations"
+    assert [u["upload_name"] for u in result["data"]] == [
+        f"upload {i}" for i in range(4, 4 - n_uploads, -1)
+    ]
+    assert result["next"] == (result["data"][-1]["id"] if n_uploads < 5 else None)
+    assert result["total"] == 5
+
+
+def test_upload_list_stream_error(client, uploads) -> None:
+    uploads(5, fail_after=2)
+    result = json.loads(client.get("/upload-annotation-list").data)
+    # the uploads read before the error are sent, the JSON is closed
+    assert len(result["data"]) == 2
+    assert result["status"] == "Error Uploading"
+    assert result["message"] == "cursor not found"
+    assert result["next"] is None
+
+
+@pytest.mark.parametrize("query", ["limit=abc", "after=bogus"])
+def test_available_abstracts_invalid_parameters(client, query) -> None:
+    response = client.get(f"/available-abstracts?{query}")
+    assert response.status_code == 400
+    assert json.loads(response.data)["status"] == "Invalid Parameters"
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pmid_index = pytest.importorskip("pmid_index")
+
+START = datetime(2021, 3, 1, tzinfo=timezone.utc)
+
+
+def _row(i):
+    return SimpleNamespace(
+        uid=f"row{i}",
+        row_data=f"PMID: {1000 + i}  TITLE. Abstract {i}",
+        external_id=f"abstract{i}.txt",
+        created_at=START + timedelta(minutes=i),
+    )
+
+
+class FakeDataset:
+    """Labelbox dataset stand-in - data rows paged newest first, can fail after some rows"""
+
+    def __init__(self, n_rows):
+        self.rows = [_row(i) for i in range(n_rows)]
+        self.fail_after = None
+        self.n_fetched = 0
+
+    def add_rows(self, n_rows):
+        self.rows += [_row(i) for i in range(len(self.rows), len(self.rows) + n_rows)]
+
+    def data_rows(self, order_by=None):
+        for i, row in enumerate(
+            sorted(self.rows, key=lambda r: r.created_at, reverse=True)
+        ):
+            if self.fail_after is not None and i == self.fail_after:
+                raise ConnectionError("Labelbox API error")
+            self.n_fetched += 1
+            yield row
+
+
+@pytest.fixture
+def index(make_collection):
+    dataset = FakeDataset(7)
+    return (
+        pmid_index.PmidIndex(
+            make_collection(),
+            make_collection(),
+            "dataset",
+            pmid_index.dataset_rows(dataset),
+            batch_size=2,
+        ),
+        dataset,
+    )
+
+
+def test_first_crawl(index) -> None:
+    index, dataset = index
+    assert index.last_created_at() is None
+    assert index.lookup(["1000", "1006", "999"]) == {"1000": "row0", "1006": "row6"}
+    assert index.collection.count_documents({"dataset_uid": "dataset"}) == 7
+    assert index.last_created_at() == START + timedelta(minutes=6)
+    # indexed PMIDs don't go back to Labelbox
+    dataset.n_fetched = 0
+    assert index.lookup(["1003"]) == {"1003": "row3"}
+    assert dataset.n_fetched == 0
+
+
+def test_incremental_refresh(index) -> None:
+    index, dataset = index
+    assert index.refresh() == 7
+    dataset.add_rows(3)
+    dataset.n_fetched = 0
+    assert index.lookup(["1008"]) == {"1008": "row8"}
+    # only the new rows & the newest indexed row (created at the watermark) are fetched,
+    # paging stops at the first older row
+    assert dataset.n_fetched == 5
+    assert index.last_created_at() == START + timedelta(minutes=9)
+    assert index.refresh() == 1
+
+
+def test_interrupted_crawl(index) -> None:
+    index, dataset = index
+    dataset.fail_after = 5
+    with pytest.raises(ConnectionError):
+        index.refresh()
+    # the newest rows are written but the crawl isn't over, the watermark isn't set
+    assert index.collection.count_documents({}) == 4
+    assert index.last_created_at() is None
+
+    dataset.fail_after = None
+    assert index.refresh() == 7
+    assert index.lookup(["1000"]) == {"1000": "row0"}
+    assert index.last_created_at() == START + timedelta(minutes=6)
+
+    # an interrupted refresh keeps the previous watermark
+    dataset.add_rows(4)
+    dataset.fail_after = 2
+    with pytest.raises(ConnectionError):
+        index.refresh()
+    assert index.last_created_at() == START + timedelta(minutes=6)
+    dataset.fail_after = None
+    assert index.lookup(["1007", "1008"]) == {"1007": "row7", "1008": "row8"}
+
+
+@pytest.mark.parametrize(
+    "text, pmid",
+    [
+        ("PMID: 33176080  TITLE. Abstract", "33176080"),
+        ("  pmid 101 Title", "101"),
+        ("PMID101x", None),
+        ("12 Tumours were treated", None),
+        ("No PMID", None),
+    ],
+)
+def test_parse_pmid(text, pmid) -> None:
+    assert pmid_index.parse_pmid(text) == pmid
+
+
+def test_normalize_pmid() -> None:
+    assert pmid_index.normalize_pmid(" 33176080 ") == "33176080"
+    assert pmid_index.normalize_pmid(33176080) == "33176080"
+    assert pmid_index.normalize_pmid("PMID: 33176080  TITLE.") == "33176080"
+    assert pmid_index.normalize_pmid("12 Tumours") is None
+
+
+def test_lookup_submitted_pmids(index) -> None:
+    index, _ = index
+    # PMIDs are returned as submitted
+    assert index.lookup(["1002", "1003 ", "PMID: 1004", "x"]) == {
+        "1002": "row2",
+        "1003 ": "row3",
+        "PMID: 1004": "row4",
+    }
+    assert index.collection.find_one({"uid": "row2"})["pmid"] == "1002"
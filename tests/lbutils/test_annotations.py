@@ -0,0 +1,135 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lbutils.annotations import META_COLUMNS, AnnotationTable, to_table
+from lbutils.data_utils import FEATURES, process_lbexport
+
+RECORDS = [
+    {
+        "PMID": "111",
+        "abstract": "PMID 111 Title first",
+        "num_arms_in_study": "2",
+        "group1": [[0, 4], [10, 14]],
+        "g1_n": [[5, 8]],
+    },
+    {"PMID": "222", "abstract": "PMID 222 Title second", "group2": [[1, 3]]},
+    {
+        "PMID": "333",
+        "abstract": "PMID 333 Title third",
+        "num_arms_in_study": ">2",
+        "new_feature": [[2, 6]],
+        "group1": [[7, 9]],
+    },
+]
+
+
+def _wide_reference(records):
+    """Dataframe format built row by row like the former process_lbexport (df.append of json dumped samples)."""
+    columns = META_COLUMNS + FEATURES
+    for sample in records:
+        columns += [key for key in sample if key not in columns]
+    rows = [
+        {
+            key: value if isinstance(value, str) else json.dumps(value)
+            for key, value in sample.items()
+        }
+        for sample in records
+    ]
+    return pd.DataFrame(rows, columns=columns).astype(object)
+
+
+def _assert_wide_equal(left, right):
+    pd.testing.assert_frame_equal(
+        left.astype(object).where(left.notna(), np.nan),
+        right.astype(object).where(right.notna(), np.nan),
+    )
+
+
+def test_from_records_matches_wide_reference() -> None:
+    table = AnnotationTable.from_records(RECORDS, features=FEATURES)
+    assert table.features == FEATURES + ["new_feature"]
+    assert len(table) == 3
+    assert table.spans["start"].dtype == np.int64
+    _assert_wide_equal(table.to_wide(), _wide_reference(RECORDS))
+
+
+def test_wide_round_trip() -> None:
+    df = _wide_reference(RECORDS)
+    table = AnnotationTable.from_wide(df)
+    assert table.features == FEATURES + ["new_feature"]
+    assert len(table.spans) == 6
+    _assert_wide_equal(table.to_wide(), df)
+    assert to_table(table) is table
+    _assert_wide_equal(to_table(df).to_wide(), df)
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "feather"])
+def test_save_load(tmp_path, file_format) -> None:
+    table = AnnotationTable.from_records(RECORDS, features=FEATURES)
+    path = str(tmp_path / "annotations")
+    table.save(path, file_format=file_format)
+    loaded = AnnotationTable.load(path, file_format=file_format)
+    # features without any span are kept
+    assert list(loaded.features) == table.features
+    pd.testing.assert_frame_equal(loaded.spans, table.spans)
+    _assert_wide_equal(loaded.to_wide(), table.to_wide())
+
+    with pytest.raises(ValueError):
+        table.save(path, file_format="csv")
+
+
+def test_select() -> None:
+    table = AnnotationTable.from_records(RECORDS, features=FEATURES)
+    selected = table.select([True, False, True])
+    assert selected.docs["PMID"].tolist() == ["111", "333"]
+    # documents are renumbered
+    assert sorted(set(selected.spans["doc_id"])) == [0, 1]
+    _assert_wide_equal(selected.to_wide(), _wide_reference([RECORDS[0], RECORDS[2]]))
+
+
+def test_with_spans() -> None:
+    table = AnnotationTable.from_records(RECORDS, features=FEATURES)
+    spans = table.spans[table.spans["feature"] == "group1"]
+    new = table.with_spans(spans)
+    assert new.features == table.features
+    assert len(new) == len(table)
+    wide = new.to_wide()
+    assert wide["group1"].tolist() == ["[[0, 4], [10, 14]]", np.nan, "[[7, 9]]"]
+    assert wide["g1_n"].isna().all()
+    # the original table is not changed
+    assert len(table.spans) == 6
+
+
+def _export_row(pmid, objects, num_arms=None):
+    label = {"objects": objects}
+    if num_arms is not None:
+        label["classifications"] = [
+            {"title": "num_arms_in_study", "answer": {"value": num_arms}}
+        ]
+    return {"Labeled Data": f"PMID {pmid} Title abstract text", "Label": label}
+
+
+def _object(title, start, end):
+    return {"title": title, "data": {"location": {"start": start, "end": end}}}
+
+
+def test_process_lbexport_table_matches_wide(tmp_path, capsys) -> None:
+    rows = [
+        _export_row("1", [_object("group1", 0, 3), _object("group1", 0, 3)], "2"),
+        _export_row("2", [_object("g1_n", 5, 6), _object("extra", 1, 2)], ">2"),
+        _export_row("1", [_object("group2", 0, 1)]),
+        _export_row("3", [], "1"),
+    ]
+    path = tmp_path / "export.json"
+    path.write_text(json.dumps(rows))
+
+    df, missing = process_lbexport(str(path))
+    table, missing_table = process_lbexport(str(path), as_table=True)
+    assert missing == missing_table == ["3"]
+    assert df["PMID"].tolist() == ["1", "2"]
+    assert df["group1"].tolist() == ["[[0, 4]]", np.nan]
+    _assert_wide_equal(table.to_wide(), df)
+    _assert_wide_equal(process_lbexport(str(path), stream=False)[0], df)
@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from lbutils.data_utils import iter_lbexport, trim_spaces
+
+json_values = st.recursive(
+    st.none() | st.booleans() | st.integers() | st.text(),
+    lambda children: st.lists(children, max_size=3)
+    | st.dictionaries(st.text(max_size=5), children, max_size=3),
+    max_leaves=8,
+)
+
+
+@given(
+    st.lists(json_values, max_size=6),
+    st.sampled_from(["", " ", "\n", " \n\t "]),
+    st.integers(1, 16),
+)
+def test_iter_lbexport_matches_json(rows, space, read_size) -> None:
+    text = (
+        space
+        + "["
+        + space
+        + ("," + space).join(json.dumps(row) for row in rows)
+        + space
+        + "]"
+        + space
+    )
+    assert list(iter_lbexport(io.StringIO(text), read_size=read_size)) == rows
+
+
+def test_iter_lbexport_numbers_across_blocks() -> None:
+    text = "[12345, 6789012, -3.25e10]"
+    for read_size in range(1, len(text) + 1):
+        assert list(iter_lbexport(io.StringIO(text), read_size=read_size)) == [
+            12345,
+            6789012,
+            -3.25e10,
+        ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '[{"a": 1}]\n[{"b": 2}]',
+        '[{"a": 1}] {"b": 2}',
+        "[] []",
+        '[{"a": 1} {"b": 2}]',
+        '{"a": 1}',
+        '[{"a": 1},',
+    ],
+)
+def test_iter_lbexport_invalid(text) -> None:
+    # several top level values are rejected like json.load does
+    with pytest.raises(ValueError):
+        list(iter_lbexport(io.StringIO(text), read_size=4))
+
+
+def _trim_reference(abstracts, doc_ids, starts, ends):
+    """Former one span at a time loop of fix_annots."""
+    new_starts, new_ends = [], []
+    for doc_id, start, end in zip(doc_ids, starts, ends):
+        span = abstracts[doc_id][start:end]
+        if span != span.strip():
+            for c in span:
+                if c != " ":
+                    break
+                start += 1
+            for c in reversed(span):
+                if c != " ":
+                    break
+                end -= 1
+        new_starts.append(start)
+        new_ends.append(end)
+    return new_starts, new_ends
+
+
+@given(
+    st.lists(st.text(alphabet=" ab\n", max_size=12), min_size=1, max_size=5),
+    st.data(),
+    st.integers(1, 3),
+)
+def test_trim_spaces_matches_loop(abstracts, data, chunk_size) -> None:
+    spans = data.draw(
+        st.lists(
+            st.tuples(
+                st.integers(0, len(abstracts) - 1),
+                st.integers(0, 14),
+                st.integers(0, 14),
+            ),
+            max_size=10,
+        )
+    )
+    doc_ids, starts, ends = (
+        (list(col) for col in zip(*spans)) if spans else ([], [], [])
+    )
+    new_starts, new_ends = trim_spaces(
+        abstracts, doc_ids, starts, ends, chunk_size=chunk_size
+    )
+    assert (new_starts.tolist(), new_ends.tolist()) == _trim_reference(
+        abstracts, doc_ids, starts, ends
+    )
+
+
+def test_trim_spaces_negative_offsets_unchanged() -> None:
+    # negative offsets are not counted from the end of the abstract like slicing does
+    new_starts, new_ends = trim_spaces(["ab  cd  "], [0, 0], [-4, 1], [8, -1])
+    assert new_starts.tolist() == [-4, 1]
+    assert new_ends.tolist() == [8, -1]
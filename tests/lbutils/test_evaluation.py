@@ -0,0 +1,179 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lbutils.annotations import AnnotationTable
+from lbutils.evaluation import MATCH_TYPES, SpanScorer, evaluate
+
+FEATURES = ["group1", "g1_n", "total_sample_size"]
+WORDS = ["arm", "placebo", "n=20", "patients", "été", "12%"]
+SPACES = [" ", "  ", "\n", "\t", " \r\n"]
+
+
+def _random_tables(seed, n_docs=6):
+    rng = np.random.default_rng(seed)
+    abstracts = []
+    for i in range(n_docs):
+        text = f"PMID {i}"
+        for _ in range(rng.integers(3, 15)):
+            text += SPACES[rng.integers(len(SPACES))] + WORDS[rng.integers(len(WORDS))]
+        abstracts.append(text)
+
+    def spans(doc_ids, n):
+        rows = {"doc_id": [], "feature": [], "start": [], "end": []}
+        for _ in range(n):
+            doc_id = doc_ids[rng.integers(len(doc_ids))]
+            start = int(rng.integers(len(abstracts[doc_id])))
+            rows["doc_id"].append(doc_id)
+            rows["feature"].append(FEATURES[rng.integers(len(FEATURES))])
+            rows["start"].append(start)
+            # some spans run past the end of the abstract
+            rows["end"].append(start + int(rng.integers(1, 12)))
+        return pd.DataFrame(rows)
+
+    docs = pd.DataFrame(
+        {"PMID": [str(i) for i in range(n_docs)], "abstract": abstracts}
+    )
+    gold_spans = spans(list(range(n_docs)), 4 * n_docs)
+
+    # predictions - shuffled documents, one document not in gold, some gold spans copied
+    order = rng.permutation(n_docs)
+    pred_docs = pd.concat(
+        [docs.iloc[order], pd.DataFrame({"PMID": ["999"], "abstract": ["PMID 999 x"]})]
+    )
+    position = {doc_id: i for i, doc_id in enumerate(order)}
+    pred_spans = pd.concat(
+        [
+            spans(list(range(n_docs)), 3 * n_docs),
+            gold_spans.sample(n_docs, random_state=seed),
+        ]
+    )
+    pred_spans["doc_id"] = pred_spans["doc_id"].map(position)
+    extra = {"doc_id": [n_docs], "feature": ["group1"], "start": [0], "end": [4]}
+    pred_spans = pd.concat([pred_spans, pd.DataFrame(extra)])
+    return (
+        AnnotationTable(docs, gold_spans, FEATURES),
+        AnnotationTable(pred_docs, pred_spans, FEATURES),
+    )
+
+
+def _units(table, abstracts_by_pmid):
+    """Spans & tokens of every (PMID, feature) of a table - brute force"""
+    spans, tokens = {}, {}
+    pmids = table.docs["PMID"].tolist()
+    for doc_id, feature, start, end in zip(
+        table.spans["doc_id"],
+        table.spans["feature"],
+        table.spans["start"],
+        table.spans["end"],
+    ):
+        key = (pmids[doc_id], feature)
+        spans.setdefault(key, set()).add((start, end))
+        abstract = abstracts_by_pmid.get(pmids[doc_id], "")
+        end = min(end, len(abstract))
+        for i, token in enumerate(re.finditer(r"[^ \t\n\r]+", abstract)):
+            if token.start() < end and start < token.end():
+                tokens.setdefault(key, set()).add(i)
+    return spans, tokens
+
+
+def _brute_force_counts(gold, pred):
+    """Matched predictions, matched gold, predictions & gold per match type, document & feature"""
+    pmids = gold.docs["PMID"].tolist()
+    abstracts = dict(zip(pmids, gold.docs["abstract"]))
+    gold_spans, gold_tokens = _units(gold, abstracts)
+    pred_spans, pred_tokens = _units(pred, abstracts)
+
+    def overlapping(spans, others):
+        return sum(any(s < oe and os < e for os, oe in others) for s, e in spans)
+
+    counts = np.zeros((len(MATCH_TYPES), len(pmids), len(FEATURES), 4), dtype=np.int64)
+    for d, pmid in enumerate(pmids):
+        for f, feature in enumerate(FEATURES):
+            key = (pmid, feature)
+            g, p = gold_spans.get(key, set()), pred_spans.get(key, set())
+            gt, pt = gold_tokens.get(key, set()), pred_tokens.get(key, set())
+            counts[0, d, f] = [len(p & g), len(g & p), len(p), len(g)]
+            counts[1, d, f] = [overlapping(p, g), overlapping(g, p), len(p), len(g)]
+            counts[2, d, f] = [len(pt & gt), len(gt & pt), len(pt), len(gt)]
+    return counts
+
+
+def _brute_force_scores(totals):
+    """precision, recall & f1 per match type & feature + 'all' from summed counts"""
+    totals = np.concatenate([totals, totals.sum(axis=1, keepdims=True)], axis=1)
+    tp_pred, tp_gold, n_pred, n_gold = np.moveaxis(totals.astype(float), -1, 0)
+    precision = np.divide(tp_pred, n_pred, out=np.zeros_like(tp_pred), where=n_pred > 0)
+    recall = np.divide(tp_gold, n_gold, out=np.zeros_like(tp_gold), where=n_gold > 0)
+    denominator = precision + recall
+    f1 = np.divide(
+        2 * precision * recall,
+        denominator,
+        out=np.zeros_like(denominator),
+        where=denominator > 0,
+    )
+    return np.stack([precision, recall, f1])
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_evaluate_matches_brute_force(seed) -> None:
+    gold, pred = _random_tables(seed)
+    counts = _brute_force_counts(gold, pred)
+    totals = counts.sum(axis=1)
+    expected = _brute_force_scores(totals)
+
+    scores = evaluate(gold, pred, features=FEATURES)
+    assert scores.index.tolist() == [
+        (match, feature) for match in MATCH_TYPES for feature in FEATURES + ["all"]
+    ]
+    for i, name in enumerate(["precision", "recall", "f1"]):
+        np.testing.assert_allclose(scores[name].to_numpy(), expected[i].ravel())
+    n_gold = np.concatenate(
+        [totals[..., 3], totals[..., 3].sum(axis=1, keepdims=True)], axis=1
+    )
+    n_pred = np.concatenate(
+        [totals[..., 2], totals[..., 2].sum(axis=1, keepdims=True)], axis=1
+    )
+    assert scores["n_gold"].tolist() == n_gold.ravel().tolist()
+    assert scores["n_pred"].tolist() == n_pred.ravel().tolist()
+
+
+def test_evaluate_wide_format() -> None:
+    gold, pred = _random_tables(0)
+    pd.testing.assert_frame_equal(
+        evaluate(gold.to_wide(), pred.to_wide(), features=FEATURES),
+        evaluate(gold, pred, features=FEATURES),
+    )
+
+
+def test_bootstrap_fixed_seed() -> None:
+    gold, pred = _random_tables(3, n_docs=10)
+    n_bootstrap, ci, batch_size = 50, 0.9, 16
+    scores = SpanScorer(gold, pred, features=FEATURES).score(
+        n_bootstrap=n_bootstrap, ci=ci, seed=7, batch_size=batch_size
+    )
+
+    # resamples drawn one document at a time with the same random draws
+    counts = _brute_force_counts(gold, pred)
+    rng = np.random.default_rng(7)
+    samples = []
+    for first in range(0, n_bootstrap, batch_size):
+        n_samples = min(batch_size, n_bootstrap - first)
+        for draw in rng.integers(len(gold), size=(n_samples, len(gold))):
+            totals = sum(counts[:, d] for d in draw)
+            samples.append(_brute_force_scores(totals))
+    low, high = np.quantile(samples, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+    for i, name in enumerate(["precision", "recall", "f1"]):
+        np.testing.assert_allclose(scores[f"{name}_low"].to_numpy(), low[i].ravel())
+        np.testing.assert_allclose(scores[f"{name}_high"].to_numpy(), high[i].ravel())
+
+    # same seed, same intervals
+    pd.testing.assert_frame_equal(
+        evaluate(gold, pred, features=FEATURES, n_bootstrap=n_bootstrap, ci=ci, seed=7),
+        SpanScorer(gold, pred, features=FEATURES).score(
+            n_bootstrap=n_bootstrap, ci=ci, seed=7, batch_size=100
+        ),
+    )
+    assert (scores["f1_low"] <= scores["f1_high"]).all()
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from lbutils import json_backend
+
+
+def _n_keys(obj: dict) -> int:
+    return len(obj)
+
+
+@pytest.mark.parametrize("backend", json_backend.BACKENDS)
+def test_loads_backends(backend) -> None:
+    doc = '{"a": [1, 2.5, "é"], "b": null}'
+    assert json_backend.loads(doc, backend=backend) == json.loads(doc)
+
+
+def test_set_backend() -> None:
+    current = json_backend.get_backend()
+    try:
+        json_backend.set_backend("json")
+        assert json_backend.get_backend() == "json"
+        with pytest.raises(ValueError):
+            json_backend.set_backend("not-a-parser")
+    finally:
+        json_backend.set_backend(current)
+
+
+def test_loads_many() -> None:
+    docs = [json.dumps({str(k): k for k in range(i)}) for i in range(25)]
+    assert json_backend.loads_many(docs) == [json.loads(doc) for doc in docs]
+    assert json_backend.loads_many(
+        docs, n_process=2, chunk_size=10, transform=_n_keys
+    ) == list(range(25))
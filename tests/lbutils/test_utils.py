@@ -0,0 +1,218 @@
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from lbutils.annotations import AnnotationTable
+from lbutils.data_utils import FEATURES
+from lbutils.utils import DataCleaning, SpanNormalizer, resolve_overlaps
+
+
+def _dominated(spans, touching):
+    """Quadratic reference (non-empty spans) - a span is dropped if it overlaps any better ranked span."""
+    rank = sorted(range(len(spans)), key=lambda i: (spans[i][0] - spans[i][1], i))
+    rank = {i: r for r, i in enumerate(rank)}
+    pad = 1 if touching else 0
+
+    def overlap(a, b):
+        return a[0] < b[1] + pad and b[0] < a[1] + pad
+
+    return [
+        not any(
+            rank[j] < rank[i] and overlap(spans[i], spans[j])
+            for j in range(len(spans))
+            if j != i
+        )
+        for i in range(len(spans))
+    ]
+
+
+@given(
+    st.lists(
+        st.tuples(st.integers(0, 40), st.integers(1, 8)).map(
+            lambda x: (x[0], x[0] + x[1])
+        ),
+        unique=True,
+        max_size=12,
+    ),
+    st.booleans(),
+)
+def test_resolve_overlaps_dominated(spans, touching) -> None:
+    assert resolve_overlaps(spans, touching=touching) == _dominated(spans, touching)
+
+
+def test_resolve_overlaps_chain() -> None:
+    # the medium span is dropped by the long one and still drops the short one,
+    # whatever the order of the spans (the greedy loop of process_lbexport kept the short span
+    # for some orders)
+    spans = [(0, 10), (8, 14), (13, 15)]
+    for order in permutations(range(3)):
+        kept = resolve_overlaps([spans[i] for i in order], touching=True)
+        assert [spans[i] for i, keep in zip(order, kept) if keep] == [(0, 10)]
+
+
+def test_resolve_overlaps_touching() -> None:
+    assert resolve_overlaps([(0, 5), (5, 7)]) == [True, True]
+    assert resolve_overlaps([(0, 5), (5, 7)], touching=True) == [True, False]
+
+
+@pytest.fixture(scope="module")
+def cleaning():
+    docs = pd.DataFrame(
+        {"PMID": ["1"], "abstract": ["PMID 1 Title"], "num_arms_in_study": [np.nan]}
+    )
+    spans = {"doc_id": [], "feature": [], "start": [], "end": []}
+    return DataCleaning(AnnotationTable(docs, spans, FEATURES))
+
+
+@pytest.mark.parametrize(
+    "span, expected",
+    [
+        ("30 pa tients", ("30", True)),
+        # 'women' used to become 'wo' once 'men' was removed
+        ("120 women", ("120", True)),
+        ("12 men", ("12", True)),
+        ("45 sub jects", ("45", True)),
+        ("n = 45", ("n = 45", False)),
+    ],
+)
+def test_clean_n_response(cleaning, span, expected) -> None:
+    assert cleaning.clean_n_response(span) == expected
+
+
+@pytest.mark.parametrize(
+    "span, expected",
+    [
+        ("n = 45 patients", ("45", True)),
+        ("(n=120 women)", ("120", True)),
+        ("30 pa tients", ("30", True)),
+    ],
+)
+def test_clean_n(cleaning, span, expected) -> None:
+    assert cleaning.clean_n(span) == expected
+
+
+def test_span_normalizer() -> None:
+    normalizer = SpanNormalizer(["men", "women", "n="], symbols=" ")
+    assert normalizer("12 wo men") == "12"
+    assert normalizer("mn=en") == "men"
+    spans = pd.Series(["12 wo men", "n= 3", "men"])
+    assert normalizer.normalize(spans).tolist() == ["12", "3", ""]
+    whole = SpanNormalizer(["about"], whole_words=True)
+    assert whole("about 30") == " 30"
+    assert whole("roundabout 30") == "roundabout 30"
+
+
+SPANS = {
+    "n": [
+        "n = 45 patients",
+        "(n=120 women)",
+        "thirty-two patients",
+        "1 200 patients",
+        "some",
+    ],
+    "n_response": ["30 pa tients", "12 men", "twenty", "n = 4", "5 (20%)"],
+    "sample_size": ["300 patients", "three hundred", "210 randomized patients", "many"],
+    "number": [
+        "45%",
+        "p < 0.05",
+        "HR 0.75 (95% CI 0.6-0.9)",
+        "median 12.5 months",
+        "NR",
+    ],
+}
+FEATURE_OF_KIND = {
+    "n": "g1_n",
+    "n_response": "g2_n_response",
+    "sample_size": "total_sample_size",
+    "number": "g1_response_rate",
+}
+
+
+def _cleaning_table():
+    records, abstract = [], ""
+    for kind, spans in SPANS.items():
+        for span in spans:
+            abstract = f"PMID {len(records)} Title: the value is {span}, end."
+            start = abstract.index(span)
+            records.append(
+                {
+                    "PMID": str(len(records)),
+                    "abstract": abstract,
+                    FEATURE_OF_KIND[kind]: [[start, start + len(span)]],
+                }
+            )
+    return AnnotationTable.from_records(records, features=FEATURES)
+
+
+def _scalar(cleaning, kind, span):
+    if kind == "n":
+        return cleaning.clean_n(span)
+    if kind == "n_response":
+        return cleaning.clean_n_response(span)
+    if kind == "sample_size":
+        return cleaning.clean_sample_size(span)
+    return cleaning.get_number_from_span(span)
+
+
+@pytest.mark.parametrize("kind", list(SPANS))
+def test_parse_spans_matches_scalar(kind) -> None:
+    cleaning = DataCleaning(_cleaning_table())
+    cleaning.build_vocab()
+    spans = pd.Series(SPANS[kind], dtype=object)
+    new_spans, parsed, update = cleaning.parse_spans(kind, spans)
+    for i, span in enumerate(SPANS[kind]):
+        new_span, is_parsed = _scalar(cleaning, kind, span)
+        # numeric sample sizes are parsed (None) but kept as annotated
+        assert parsed[i] == (is_parsed is not False)
+        assert update[i] == bool(is_parsed)
+        if is_parsed is not False:
+            assert new_spans[i] == new_span
+
+
+def _extract_reference(cleaning, table):
+    """Former one span at a time extraction (scalar cleaners, spans moved to the value)."""
+    abstracts = table.docs["abstract"].tolist()
+    kinds = {feature: kind for kind, feature in FEATURE_OF_KIND.items()}
+    bounds = []
+    for doc_id, feature, start, end in zip(
+        table.spans["doc_id"],
+        table.spans["feature"],
+        table.spans["start"],
+        table.spans["end"],
+    ):
+        span = abstracts[doc_id][start:end]
+        new_span, parsed = _scalar(cleaning, kinds[feature], span)
+        if parsed and len(span) - len(new_span) and span.find(new_span) >= 0:
+            start = start + span.find(new_span)
+            end = start + len(new_span)
+        bounds.append((start, end))
+    return bounds
+
+
+@pytest.mark.parametrize("as_table", [True, False])
+def test_extract_all(as_table) -> None:
+    table = _cleaning_table()
+    cleaning = DataCleaning(table if as_table else table.to_wide())
+    cleaning.build_vocab()
+    expected = _extract_reference(cleaning, table)
+    result = cleaning.extract_all()
+    result = result if as_table else AnnotationTable.from_wide(result)
+    # one span per document, the wide format orders spans by feature
+    spans = result.spans.sort_values("doc_id", kind="stable")
+    assert list(zip(spans["start"], spans["end"])) == expected
+
+    abstracts = result.docs["abstract"].tolist()
+    extracted = [
+        abstracts[d][s:e]
+        for d, s, e in zip(spans["doc_id"], spans["start"], spans["end"])
+    ]
+    assert extracted[:2] == ["45", "120"]
+    # '1 200' can't be located once cleaned, the span is kept
+    assert extracted[3] == "1 200 patients"
+    rates = cleaning.parse_rates
+    assert rates.loc["g1_n", "spans"] == len(SPANS["n"])
+    assert rates.loc["g1_response_rate", "parsed"] == 3